@@ -1,4 +1,3 @@
-import json
 import os
 import sys
 from pathlib import Path
@@ -8,6 +7,9 @@ import boto3
 path_to_utils = Path(__file__).parent.parent / "stars"
 sys.path.insert(0, str(path_to_utils))
 
+from indexes import build_indexes, index_files
+from metrics import registry
+from publisher import S3Publisher
 from stars import StarEvents
 
 GH_TOKEN = os.environ.get("GH_TOKEN", None)
@@ -18,26 +20,18 @@ BUCKET_NAME = os.environ.get("BUCKET_NAME", "data.ghtrending.birki.io")
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 STAR_TRENDS_PATH = os.environ.get("STAR_TRENDS_PATH", "trends/stars")
 CACHE_CONTROL = str(os.environ.get("CACHE_CONTROL", "7200"))
-
-
-def upload_to_s3(result):
-    """
-    Uploads files to S3
-    """
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION,
-    )
-
-    s3.put_object(
-        Bucket=BUCKET_NAME,
-        Key=f"{STAR_TRENDS_PATH}/{result['name']}.json",
-        Body=json.dumps(result["data"]),
-        ContentType="application/json",
-        CacheControl=f"public,max-age={CACHE_CONTROL}",
-    )
+CONTENT_ENCODING = os.environ.get("CONTENT_ENCODING", "gzip")
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", 8))
+SPLIT_DETAILS = os.environ.get("SPLIT_DETAILS", "false").lower() == "true"
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", None)
+USE_VELOCITY = os.environ.get("USE_VELOCITY", "true").lower() == "true"
+TRENDS_LIMIT = int(os.environ.get("TRENDS_LIMIT", 20))
+USE_INDEXES = os.environ.get("USE_INDEXES", "true").lower() == "true"
+INDEX_CANDIDATES = int(os.environ.get("INDEX_CANDIDATES", 100))
+INDEX_MIN_REPOS = int(os.environ.get("INDEX_MIN_REPOS", 2))
+INDEX_MAX_KEYS = int(os.environ.get("INDEX_MAX_KEYS", 100))
+# publish the 30 day window even when it has to be counted from the raw events (the rollups don't cover it yet)
+FORCE_LAST_30_DAYS = os.environ.get("FORCE_LAST_30_DAYS", "false").lower() == "true"
 
 
 def main():
@@ -56,36 +50,116 @@ def main():
     # Get Star Event Trends
     star_events = StarEvents()
 
-    results = []
-
-    # Get the most stared repos from the past 24 hours
-    print("\nGetting most stared repos from the past 24 hours")
-    results.append(
-        {"name": "last_24_hours", "data": star_events.get_stars_in_timeslice(hours=24)}
-    )
+    # Get the most stared repos for every window from the trend state (or a single pass over the widest one)
+    windows = {24: "last_24_hours", 24 * 7: "last_7_days", 24 * 30: "last_30_days"}
 
-    # Get the most stared repos from the past 7 days
-    print("\nGetting most stared repos from the past 7 days")
-    results.append(
-        {
-            "name": "last_7_days",
-            "data": star_events.get_stars_in_timeslice(hours=24 * 7),
-        }
+    # the trend state and the rollups only hold the hours since rollups were turned on (unless older hours were
+    # backfilled), so the windows they don't cover yet are counted from the raw events instead
+    reads_rollups = star_events.use_trend_state or (
+        star_events.use_rollups and not star_events.backend.vectorized
     )
-
-    # # Get the most stared repos from the past 30 days
-    # print("\nGetting most stared repos from the past 30 days")
-    # results.append(
-    #     {
-    #         "name": "last_30_days",
-    #         "data": star_events.get_stars_in_timeslice(hours=24 * 30),
-    #     }
-    # )
+    raw = [
+        hours
+        for hours in windows
+        if reads_rollups and not star_events.rollups_cover(hours)
+    ]
+
+    # scanning 30 days of raw events is only cheap enough on a vectorized backend
+    if (
+        not FORCE_LAST_30_DAYS
+        and not star_events.backend.vectorized
+        and (24 * 30 in raw or not reads_rollups)
+    ):
+        print(
+            "Skipping last_30_days - the hourly rollups don't cover it and a raw scan of 30 days is too slow"
+        )
+        del windows[24 * 30]
+        raw = [hours for hours in raw if hours in windows]
+
+    # the state is read once and shared by the windows and both velocity rankings
+    state = star_events.load_trend_state() if star_events.use_trend_state else None
+
+    print(f"\nGetting most stared repos for {', '.join(windows.values())}")
+    # the per language and per topic indexes are ranked from a deeper pool of candidates than the main lists
+    limit = max(TRENDS_LIMIT, INDEX_CANDIDATES) if USE_INDEXES else TRENDS_LIMIT
+    trends = {}
+    covered = [hours for hours in windows if hours not in raw]
+    if covered:
+        trends.update(star_events.get_trends(covered, limit=limit, state=state))
+    if raw:
+        print(
+            f"Counting {', '.join(windows[hours] for hours in raw)} from the raw events"
+        )
+        trends.update(
+            star_events.get_stars_in_timeslices(
+                raw,
+                limit=limit,
+                rollups=False,
+                newest=state.newest_hour if state is not None else None,
+            )
+        )
+
+    results = [
+        {"name": name, "data": trends[hours][:TRENDS_LIMIT]}
+        for hours, name in windows.items()
+    ]
+
+    # repos trending relative to their own baseline, scored from the decayed counters in the trend state
+    if USE_VELOCITY and star_events.use_trend_state and star_events.velocity_half_lives:
+        for by in ("velocity", "acceleration"):
+            results.append(
+                {
+                    "name": by,
+                    "data": star_events.get_velocity_trends(
+                        by=by, limit=TRENDS_LIMIT, state=state
+                    ),
+                }
+            )
+
+    extra = {}
+    if USE_INDEXES:
+        with registry.stage("aggregate"):
+            indexes = build_indexes(
+                {name: trends[hours] for hours, name in windows.items()},
+                limit=TRENDS_LIMIT,
+                min_repos=INDEX_MIN_REPOS,
+                max_keys=INDEX_MAX_KEYS,
+            )
+            shards, manifest = index_files(indexes, list(windows.values()))
+        results += shards
+        extra["manifest"] = manifest
+        print(
+            f"Built {len(manifest['language'])} language and {len(manifest['topic'])} topic indexes"
+        )
 
     # Upload to S3
     print("\nUploading to S3...")
-    for result in results:
-        upload_to_s3(result)
+    s3 = boto3.client(
+        "s3",
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+    )
+    publisher = S3Publisher(
+        s3,
+        BUCKET_NAME,
+        STAR_TRENDS_PATH,
+        cache_control=CACHE_CONTROL,
+        encoding=CONTENT_ENCODING,
+        concurrency=UPLOAD_CONCURRENCY,
+        log=star_events.log,
+    )
+    with registry.stage("upload"):
+        published = publisher.publish(results, split=SPLIT_DETAILS, extra=extra)
+
+    print(
+        f"Uploaded {len(publisher.uploaded)} files ({len(publisher.unchanged)} unchanged)"
+    )
+    star_events.write_metrics("star_trends_to_s3")
+    if not published:
+        print("❌ Failed to upload every file")
+        sys.exit(1)
 
     print("\nDone!")
 
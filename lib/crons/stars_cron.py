@@ -11,6 +11,7 @@ if __name__ == "__main__":
     # NOTE: We get the events from 2 hours ago because the gharchive data for the last hour can be incomplete
     star_events = StarEvents()
     result = star_events.run()
+    star_events.write_metrics("stars_cron")
     if result:
         print("✅ Completed successfully")
     else:
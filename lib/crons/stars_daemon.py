@@ -0,0 +1,29 @@
+import os
+import signal
+import sys
+from pathlib import Path
+
+path_to_utils = Path(__file__).parent.parent / "stars"
+sys.path.insert(0, str(path_to_utils))
+
+from daemon import IngestDaemon
+from stars import StarEvents
+
+POLL_INTERVAL = int(os.environ.get("DAEMON_POLL_INTERVAL", 60))
+MAX_POLL_INTERVAL = int(os.environ.get("DAEMON_MAX_POLL_INTERVAL", 300))
+
+if __name__ == "__main__":
+    # Long-running alternative to stars_cron.py - ingests every gharchive hour a few minutes after it is published
+    star_events = StarEvents()
+    daemon = IngestDaemon(
+        star_events,
+        poll_interval=POLL_INTERVAL,
+        max_poll_interval=MAX_POLL_INTERVAL,
+    )
+
+    # finish the hour being written before exiting
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+
+    daemon.run()
+    print("✅ Stopped")
@@ -0,0 +1,38 @@
+import os
+import signal
+import sys
+from pathlib import Path
+
+path_to_utils = Path(__file__).parent.parent / "stars"
+sys.path.insert(0, str(path_to_utils))
+
+from api import serve
+from stars import StarEvents
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", 8080))
+API_CACHE_SIZE = int(os.environ.get("API_CACHE_SIZE", 256))
+API_CACHE_TTL = int(os.environ.get("API_CACHE_TTL", 300))
+
+if __name__ == "__main__":
+    # Query service for arbitrary windows and limits - GET /trends?hours=48&limit=50&language=rust
+    star_events = StarEvents()
+    server = serve(
+        star_events,
+        host=API_HOST,
+        port=API_PORT,
+        cache_size=API_CACHE_SIZE,
+        ttl=API_CACHE_TTL,
+    )
+
+    # shutdown blocks until serve_forever returns, so it can't be called from the signal handler's thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    star_events.log.info(f"Serving trends on http://{API_HOST}:{API_PORT}")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+    print("✅ Stopped")
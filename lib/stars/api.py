@@ -0,0 +1,330 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from indexes import slugify
+from metrics import registry
+from publisher import encode_json
+
+# max window and number of repos a query can ask for
+MAX_HOURS = 24 * 30
+MAX_LIMIT = 100
+
+# repos ranked and enriched before filtering by language
+LANGUAGE_CANDIDATES = 200
+
+
+class QueryError(Exception):
+    """
+    Raised for invalid query parameters (returned to the client as a 400)
+    """
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of query results with a TTL and request coalescing
+    Concurrent requests for a key which is being computed wait for that computation instead of starting their own,
+    so a burst of identical queries only hits storage once
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        """
+        Initialize the ResultCache class
+        :param max_entries: max number of results to keep (least recently used results are evicted first)
+        :param ttl: seconds a result stays fresh
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, compute):
+        """
+        Get a fresh result for a key, computing it at most once at a time
+        :param key: hashable cache key
+        :param compute: function which returns the result
+        :return: the result
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            waiter = self.in_flight.get(key)
+            if waiter is None:
+                # this request computes the result - everyone else waits for it
+                waiter = self.in_flight[key] = [threading.Event(), None, None]
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            waiter[0].wait()
+            if waiter[2] is not None:
+                raise waiter[2]
+            return waiter[1]
+
+        try:
+            waiter[1] = compute()
+        except Exception as e:
+            # errors are passed to the waiting requests but never cached
+            waiter[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if waiter[2] is None:
+                    self.entries[key] = (time.monotonic() + self.ttl, waiter[1])
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            waiter[0].set()
+
+        return waiter[1]
+
+
+class CachedResponse:
+    """
+    Encoded response body with its ETag and a gzipped copy, built once per cached result
+    """
+
+    def __init__(self, data):
+        self.body = encode_json(data)
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+class TrendQueryService:
+    """
+    Answers trend queries with StarEvents, caching the encoded responses
+    """
+
+    def __init__(self, star_events, cache_size=256, ttl=300):
+        """
+        Initialize the TrendQueryService class
+        :param star_events: StarEvents object used to run the queries
+        :param cache_size: max number of cached responses
+        :param ttl: seconds a cached response stays fresh (also sent as the Cache-Control max-age)
+        """
+        self.star_events = star_events
+        self.cache = ResultCache(max_entries=cache_size, ttl=ttl)
+        self.ttl = ttl
+        # queries for different keys run concurrently (the cache coalesces identical ones), only reloading the
+        # shared trend state is serialized
+        self.state_lock = threading.Lock()
+        # the loaded trend state and the modification time of the state file it was read from
+        self.state = None
+        self.state_mtime = None
+
+    def parse(self, query_string):
+        """
+        Parse and validate the query parameters
+        :param query_string: raw query string (e.g. hours=24&limit=10&language=rust)
+        :return: normalized (hours, limit, language, enrich) tuple, used as the cache key
+        """
+        params = {key: values[-1] for key, values in parse_qs(query_string).items()}
+        try:
+            hours = int(params.get("hours", 24))
+            limit = int(params.get("limit", 20))
+        except ValueError:
+            raise QueryError("hours and limit must be integers")
+
+        if not 1 <= hours <= MAX_HOURS:
+            raise QueryError(f"hours must be between 1 and {MAX_HOURS}")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+
+        language = params.get("language")
+        language = slugify(language) if language else None
+        enrich = params.get("enrich", "true").lower() != "false"
+
+        # the language of a repo is only known once it is enriched
+        if language:
+            enrich = True
+
+        return hours, limit, language, enrich
+
+    def trend_state(self):
+        """
+        Get the trend state for a query, only reading the state file again once it has been rewritten
+        The returned state is never modified, so queries can keep reading it while a newer one is loaded
+        Windows the state doesn't track are read from the database, but still end with the newest hour of the
+        state so every window of a response ends at the same point
+        :return: TrendState, or None if there is no state file
+        """
+        star_events = self.star_events
+        if not star_events.use_trend_state:
+            return None
+
+        try:
+            mtime = os.stat(star_events.trend_state_path).st_mtime_ns
+        except FileNotFoundError:
+            # get_trends rebuilds the state from the rollups until the first ingest writes the file
+            return None
+
+        with self.state_lock:
+            if self.state is None or mtime != self.state_mtime:
+                self.state = star_events.load_trend_state()
+                self.state_mtime = mtime
+            return self.state
+
+    def run_query(self, hours, limit, language, enrich):
+        """
+        Run a trend query against storage
+        :return: list of repos (enriched dicts, or [repo_name, stars] pairs when enrich is off)
+        """
+        candidates = max(limit, LANGUAGE_CANDIDATES) if language else limit
+        repos = self.star_events.get_trends(
+            [hours], enrich=enrich, limit=candidates, state=self.trend_state()
+        )[hours]
+
+        if language:
+            repos = [repo for repo in repos if slugify(repo["language"]) == language]
+        return repos[:limit]
+
+    def query(self, query_string):
+        """
+        Get the cached response for a query, running it if needed
+        :param query_string: raw query string
+        :return: CachedResponse
+        """
+        key = self.parse(query_string)
+        return self.cache.get(key, lambda: CachedResponse(self.run_query(*key)))
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Check an ETag against an If-None-Match header
+    :param etag: quoted strong ETag of the response
+    :param if_none_match: header value - * or a comma separated list of (optionally weak) quoted ETags
+    :return: bool
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        # If-None-Match uses the weak comparison, so W/"x" matches "x"
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class TrendRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the trend query service
+    GET /trends?hours=24&limit=20&language=rust&enrich=true, GET /healthz and GET /metrics
+    """
+
+    # keep-alive connections
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes - without TCP_NODELAY the body waits for the client's delayed ack
+    disable_nagle_algorithm = True
+
+    # set by serve
+    service = None
+
+    def log_message(self, format, *args):
+        self.service.star_events.log.debug(format % args)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        start = time.perf_counter()
+
+        if url.path == "/healthz":
+            self.send_body(200, b"ok\n", "text/plain")
+            return
+
+        if url.path == "/metrics":
+            self.send_body(
+                200, registry.prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            )
+            return
+
+        if url.path != "/trends":
+            self.send_body(404, encode_json({"error": "not found"}), "application/json")
+            return
+
+        try:
+            response = self.service.query(url.query)
+        except QueryError as e:
+            self.send_body(400, encode_json({"error": str(e)}), "application/json")
+            return
+        except Exception as e:
+            self.service.star_events.log.error(f"Query {url.query} failed: {e}")
+            registry.increment("api_responses", status="500")
+            self.send_body(
+                500, encode_json({"error": "query failed"}), "application/json"
+            )
+            return
+
+        headers = {
+            "ETag": response.etag,
+            "Cache-Control": f"public, max-age={self.service.ttl}",
+            "Vary": "Accept-Encoding",
+        }
+
+        # cheap revalidation - the client already has this exact body
+        if etag_matches(response.etag, self.headers.get("If-None-Match")):
+            status = 304
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            status = 200
+            body = response.body
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = response.gzipped
+                headers["Content-Encoding"] = "gzip"
+            self.send_body(200, body, "application/json", headers)
+
+        registry.increment("api_responses", status=str(status))
+        registry.observe("api_request_seconds", time.perf_counter() - start)
+
+    do_HEAD = do_GET
+
+
+def serve(star_events, host="127.0.0.1", port=8080, cache_size=256, ttl=300):
+    """
+    Build the trend query http server
+    :param star_events: StarEvents object used to run the queries
+    :param host: address to listen on
+    :param port: port to listen on (0 for any free port)
+    :param cache_size: max number of cached responses
+    :param ttl: seconds a cached response stays fresh
+    :return: ThreadingHTTPServer (call serve_forever to start it)
+    """
+    service = TrendQueryService(star_events, cache_size=cache_size, ttl=ttl)
+    handler = type("Handler", (TrendRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import registry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class CachedResponse:
+    """
+    Minimal response object returned by the ApiCache
+    """
+
+    def __init__(self, status_code, data=None, from_cache=False, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.from_cache = from_cache
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+class ApiCache:
+    """
+    Persistent on-disk cache for GitHub API responses (SQLite)
+    Fresh entries skip the request entirely, stale entries are revalidated with a conditional request
+    """
+
+    def __init__(self, path, ttl=3600, max_age=7 * 24 * 3600):
+        """
+        Initialize the ApiCache class
+        :param path: path to the SQLite database file
+        :param ttl: seconds an entry is served without revalidation
+        :param max_age: seconds after which an entry is evicted
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute(SCHEMA)
+        self.db.commit()
+        self.evict()
+
+    def lookup(self, url):
+        """
+        Get a cached entry
+        :param url: url the response was fetched from
+        :return: tuple of (etag, last_modified, data, fetched_at) or None
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, body, fetched_at FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        etag, last_modified, body, fetched_at = row
+        return etag, last_modified, json.loads(body), fetched_at
+
+    def store(self, url, etag, last_modified, data):
+        """
+        Store a response in the cache
+        :param url: url the response was fetched from
+        :param etag: ETag header of the response
+        :param last_modified: Last-Modified header of the response
+        :param data: decoded json body
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, json.dumps(data), time.time()),
+            )
+            self.db.commit()
+
+    def touch(self, url):
+        """
+        Mark a cached entry as fresh again after a 304 Not Modified response
+        :param url: url the response was fetched from
+        """
+        with self.lock:
+            self.db.execute(
+                "UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url)
+            )
+            self.db.commit()
+
+    def evict(self):
+        """
+        Remove every entry older than max_age
+        :return: number of evicted entries
+        """
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM responses WHERE fetched_at < ?",
+                (time.time() - self.max_age,),
+            )
+            self.db.commit()
+        return cursor.rowcount
+
+    def get(self, session, url, headers=None):
+        """
+        GET a json url through the cache
+        :param session: requests module or requests.Session used for the request
+        :param url: url to fetch
+        :param headers: request headers
+        :return: CachedResponse
+        """
+        cached = self.lookup(url)
+        headers = dict(headers or {})
+
+        if cached is not None:
+            etag, last_modified, data, fetched_at = cached
+
+            # fresh entries don't need a request at all
+            if time.time() - fetched_at < self.ttl:
+                with self.lock:
+                    self.hits += 1
+                registry.increment("api_requests", result="hit")
+                return CachedResponse(200, data, from_cache=True)
+
+            # stale entries are revalidated - 304s don't count against the rate limit
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        resp = session.get(url, headers=headers)
+
+        if resp.status_code == 304 and cached is not None:
+            with self.lock:
+                self.revalidated += 1
+            registry.increment("api_requests", result="revalidated")
+            self.touch(url)
+            return CachedResponse(200, cached[2], from_cache=True, headers=resp.headers)
+
+        with self.lock:
+            self.misses += 1
+        registry.increment("api_requests", result="miss")
+        if resp.status_code != 200:
+            return CachedResponse(resp.status_code, headers=resp.headers)
+
+        registry.increment("bytes", len(resp.content), stage="enrich")
+        data = resp.json()
+        self.store(
+            url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), data
+        )
+        return CachedResponse(200, data, headers=resp.headers)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,288 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from azure.core.exceptions import ResourceExistsError
+from azure.data.tables import TableServiceClient
+
+from backends import StorageBackend
+from ledger import TableLedger
+from metrics import registry
+from partitions import LEGACY_PARTITION, chunk_by_partition, hour_bucket
+from rollups import ACTOR_STAR_LIMIT, decode_sketch, rollup_chunks, rollup_stats
+from writer import TableWriter
+
+
+class AzureTableBackend(StorageBackend):
+    """
+    Azure Table Storage backend
+    Raw star events go in one table (one partition per hour) and hourly rollups go in another
+    """
+
+    def __init__(
+        self,
+        log,
+        connection_string,
+        table_name,
+        rollup_table_name,
+        partition_scheme="hour",
+        scan_legacy=True,
+        create_tables=False,
+        write_concurrency=8,
+        write_retries=5,
+        read_concurrency=16,
+        ledger_table_name="ingestledger",
+        actor_star_limit=ACTOR_STAR_LIMIT,
+    ):
+        """
+        Initialize the AzureTableBackend class
+        :param log: logger object
+        :param connection_string: Azure storage connection string
+        :param table_name: name of the raw star events table
+        :param rollup_table_name: name of the hourly rollup table
+        :param partition_scheme: "hour" for per-hour partitions, "single" for the legacy "stars" partition
+        :param scan_legacy: with the hour scheme, also read the events which are still in the legacy partition
+            in raw scans (until script/migrate_partitions.py has moved them)
+        :param create_tables: create the raw events table if it doesn't exist (for local emulators)
+        :param write_concurrency: max number of transactions in flight
+        :param write_retries: number of times to retry a failed transaction
+        :param read_concurrency: max number of partition queries in flight
+        :param ledger_table_name: name of the ingest ledger table
+        :param actor_star_limit: stars per hour an actor can give before their stars are down-weighted
+        """
+        self.log = log
+        self.partition_scheme = partition_scheme
+        self.scan_legacy = scan_legacy
+        self.read_concurrency = read_concurrency
+        self.actor_star_limit = actor_star_limit
+
+        table_service_client = TableServiceClient.from_connection_string(
+            conn_str=connection_string
+        )
+
+        # local emulators start out empty so make sure the table exists
+        if create_tables:
+            table_service_client.create_table_if_not_exists(table_name=table_name)
+
+        # set the table class variable to the Azure table client
+        self.table = table_service_client.get_table_client(table_name=table_name)
+
+        # concurrent batched writer which shares the table client connection
+        self.writer = TableWriter(
+            self.table,
+            self.log,
+            max_concurrency=write_concurrency,
+            max_retries=write_retries,
+        )
+
+        # pre-aggregated hourly star counts per repo
+        table_service_client.create_table_if_not_exists(table_name=rollup_table_name)
+        self.rollup_table = table_service_client.get_table_client(
+            table_name=rollup_table_name
+        )
+        self.rollup_writer = TableWriter(
+            self.rollup_table,
+            self.log,
+            max_concurrency=write_concurrency,
+            max_retries=write_retries,
+        )
+
+        # record of the gharchive hours which have been ingested
+        table_service_client.create_table_if_not_exists(table_name=ledger_table_name)
+        self.ledger = TableLedger(
+            table_service_client.get_table_client(table_name=ledger_table_name)
+        )
+
+        self.log.info(f"Created client to connect to storage table: {table_name}")
+
+    def write(self, entities):
+        """
+        Write a batch of entities to the Azure Table Storage
+        :param entities: entities to write to the Azure Table Storage (list)
+        :return: created entity object if successful, None if the entity already exists, False if there is an error
+        """
+        # loop through all the entitites and add them to a list of 'upsert' operations
+        operations = []
+        for entity in entities:
+            operations.append(("upsert", entity))
+
+        try:
+            # execute the batch of operations
+            return self.table.submit_transaction(operations)
+        except ResourceExistsError:
+            self.log.warning(f"Skipping RowKey: {entity['RowKey']} - already exists")
+            return None
+        except Exception as e:
+            self.log.error(f"Error writing entity to Azure Table Storage: {e}")
+            return False
+
+    def read(self, query, listify=True):
+        """
+        Execute a query against the Azure Table Storage
+        :param query: query to execute
+        :param listify: return a list of entities (True) or a generator (False)
+        :return: results from the query (list or generator)
+        """
+        with registry.stage("query") as timer:
+            try:
+                results = self.table.query_entities(query)
+
+                if listify:
+                    # convert the generator object to a list
+                    results = list(results)
+                error = None
+            except Exception as e:
+                error = e
+
+        if error is not None:
+            registry.increment("errors", stage="query")
+            self.log.error(f"Read query failed in {round(timer.elapsed, 2)} seconds")
+            self.log.error(f"Error executing read query: {error}")
+            return None
+
+        self.log.info(f"Read query executed in {round(timer.elapsed, 2)} seconds")
+        return results
+
+    def read_partitions(self, table, partitions, query=None, select=None):
+        """
+        Query many partitions at the same time and yield entities as each partition finishes
+        :param table: table client to query
+        :param partitions: list of PartitionKeys to query
+        :param query: optional extra filter which is added to every partition query
+        :param select: optional list of properties to return
+        :return: generator of entities
+        """
+
+        def read_partition(partition):
+            partition_query = f"PartitionKey eq '{partition}'"
+            if query:
+                partition_query = f"{partition_query} and {query}"
+            return list(table.query_entities(partition_query, select=select))
+
+        with ThreadPoolExecutor(max_workers=self.read_concurrency) as pool:
+            futures = [pool.submit(read_partition, p) for p in partitions]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def partition_key(self, created_at):
+        """
+        Helper function to get the PartitionKey for a raw star event
+        :param created_at: datetime the star event was created
+        :return: PartitionKey (hour bucket, or "stars" for the legacy single partition)
+        """
+        if self.partition_scheme == "single":
+            return LEGACY_PARTITION
+
+        return hour_bucket(created_at)
+
+    def write_events(self, events, committed=None):
+        entities = [
+            {
+                "PartitionKey": self.partition_key(event["created_at"]),
+                "RowKey": event["id"],
+                "repo_name": event["repo_name"],
+                "created_at": event["created_at"],
+                "actor_login": event["actor_login"],
+            }
+            for event in events
+        ]
+
+        # split the entities into chunks of 100 (max batch size) which share a partition
+        chunks = chunk_by_partition(entities)
+        total_chunks = len(chunks)
+
+        self.log.info(
+            f"Attempting to write {total_chunks} chunks containing {len(entities)} events to the database"
+        )
+
+        stats = self.writer.write_chunks(chunks, committed=committed)
+        stats.record(registry, "write")
+        summary = stats.summary()
+
+        self.log.info(
+            f"Wrote {summary['chunks']}/{total_chunks} chunks in {summary['elapsed']} seconds "
+            f"({summary['events_per_second']} events/sec, p50: {summary['latency_p50']}s, "
+            f"p95: {summary['latency_p95']}s, retries: {summary['retries']}, throttled: {summary['throttled']}, already written: {summary['skipped']})"
+        )
+
+        return stats.failed == 0, summary["events"]
+
+    def write_rollups(self, events, bucket=None):
+        chunks = rollup_chunks(
+            rollup_stats(events, self.actor_star_limit, bucket=bucket)
+        )
+        if len(chunks) == 0:
+            return True
+
+        stats = self.rollup_writer.write_chunks(chunks)
+        stats.record(registry, "rollups")
+        summary = stats.summary()
+
+        self.log.info(
+            f"Wrote {summary['events']} rollup rows in {summary['chunks']} chunks in {summary['elapsed']} seconds"
+        )
+
+        return stats.failed == 0
+
+    def scan_rollups(self, buckets):
+        data = self.read_partitions(
+            self.rollup_table,
+            buckets,
+            select=["PartitionKey", "repo_name", "stars"],
+        )
+        for entity in data:
+            yield entity["PartitionKey"], entity["repo_name"], entity["stars"]
+
+    def scan_rollup_stats(self, buckets, repos=None):
+        data = self.read_partitions(
+            self.rollup_table,
+            buckets,
+            select=["PartitionKey", "repo_name", "stars", "weighted", "stargazers"],
+        )
+        for entity in data:
+            repo_name = entity["repo_name"]
+            if repos is not None and repo_name not in repos:
+                continue
+            stars = entity["stars"]
+            yield (
+                entity["PartitionKey"],
+                repo_name,
+                stars,
+                entity.get("weighted", stars),
+                decode_sketch(entity.get("stargazers")),
+            )
+
+    def scan_events(self, lower, upper, buckets):
+        upper_bound = upper.isoformat(timespec="seconds") + "Z"
+        lower_bound = lower.isoformat(timespec="seconds") + "Z"
+
+        # query the Azure Table Storage for the events within the time period
+        query = f"created_at gt datetime'{lower_bound}' and created_at lt datetime'{upper_bound}'"
+        if self.partition_scheme == "single":
+            for entity in self.read(query, listify=False):
+                yield entity["repo_name"], entity["created_at"].replace(tzinfo=None)
+            return
+
+        # events written before the switch to hour partitions stay in the legacy partition until they are migrated
+        legacy_ids = set()
+        if self.scan_legacy:
+            legacy = self.read_partitions(
+                self.table,
+                [LEGACY_PARTITION],
+                query=query,
+                select=["RowKey", "repo_name", "created_at"],
+            )
+            for entity in legacy:
+                legacy_ids.add(entity["RowKey"])
+                yield entity["repo_name"], entity["created_at"].replace(tzinfo=None)
+
+        # point queries against every hour partition in the window, all at the same time
+        data = self.read_partitions(
+            self.table,
+            buckets,
+            query=query,
+            select=["RowKey", "repo_name", "created_at"],
+        )
+        for entity in data:
+            # copied into its hour partition but not deleted from the legacy partition yet
+            if entity["RowKey"] in legacy_ids:
+                continue
+            yield entity["repo_name"], entity["created_at"].replace(tzinfo=None)
@@ -0,0 +1,319 @@
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from events import Dictionary, from_epoch, to_epoch
+from ledger import FileLedger
+from partitions import hour_bucket, window_buckets
+from rollups import ACTOR_STAR_LIMIT, actor_weight
+from sketches import HyperLogLog, hash64
+
+
+class StorageBackend:
+    """
+    Interface for the storage backends which hold star events
+    Events passed to a backend are a StarEventBatch (or any re-iterable of dicts) with id, repo_name, actor_login
+    and created_at (naive UTC datetime)
+    """
+
+    # True if the backend can count repos per window itself (see count_windows)
+    vectorized = False
+
+    # IngestLedger which records the gharchive hours that have been ingested
+    ledger = None
+
+    def write_events(self, events, committed=None):
+        """
+        Store star events
+        :param events: StarEventBatch of star events
+        :param committed: optional set of chunk ids which are already stored - they are skipped and the ids of
+            newly written chunks are added to it
+        :return: tuple of (True if successful, number of events written)
+        """
+        raise NotImplementedError
+
+    def write_rollups(self, events, bucket=None):
+        """
+        Update the per-hour, per-repo star counts for a batch of star events
+        :param events: StarEventBatch of star events
+        :param bucket: hour bucket of the gharchive file the events came from (see rollups.rollup_counts)
+        :return: True if successful
+        """
+        raise NotImplementedError
+
+    def scan_rollups(self, buckets):
+        """
+        Read the per-hour, per-repo star counts for a list of hour buckets
+        :param buckets: list of hour buckets
+        :return: iterable of (bucket, repo_name, stars) tuples
+        """
+        raise NotImplementedError
+
+    def scan_rollup_stats(self, buckets, repos=None):
+        """
+        Read the per-hour, per-repo star statistics used for ranking by distinct stargazers or weighted stars
+        :param buckets: list of hour buckets
+        :param repos: optional set of repo names to read (rows for other repos are skipped)
+        :return: iterable of (bucket, repo_name, stars, weighted, stargazers) tuples - stargazers is a
+            HyperLogLog, or None for rows written before sketches existed (weighted then equals stars)
+        """
+        raise NotImplementedError
+
+    def scan_events(self, lower, upper, buckets):
+        """
+        Read the raw star events created between two timestamps
+        :param lower: lower bound (naive UTC datetime, exclusive)
+        :param upper: upper bound (naive UTC datetime, exclusive)
+        :param buckets: hour buckets which cover the range
+        :return: iterable of (repo_name, created_at) tuples
+        """
+        raise NotImplementedError
+
+    def count_windows(self, windows, now):
+        """
+        Count stars per repo for several windows ending now (only for vectorized backends)
+        :param windows: list of window sizes in hours
+        :param now: end of every window (naive UTC datetime)
+        :return: tuple of (dict of hours -> Counter of repo_name -> stars, number of events counted)
+        """
+        raise NotImplementedError
+
+
+class Segment:
+    """
+    One hour of star events stored as parallel typed arrays, sorted by created_at
+    """
+
+    MAGIC = b"GHTS1\n"
+
+    def __init__(self):
+        self.created_at = array("q")
+        self.repo = array("I")
+        self.actor = array("I")
+        self.ids = array("q")
+
+    def __len__(self):
+        return len(self.created_at)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a segment from disk
+        :param path: path to the segment file
+        :return: Segment
+        """
+        segment = cls()
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a star event segment")
+            count = int(f.readline())
+            for column in (
+                segment.created_at,
+                segment.repo,
+                segment.actor,
+                segment.ids,
+            ):
+                column.fromfile(f, count)
+        return segment
+
+    def save(self, path):
+        """
+        Atomically write the segment to disk
+        :param path: path to the segment file
+        """
+        partial_path = f"{path}.part"
+        with open(partial_path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(f"{len(self)}\n".encode())
+            for column in (self.created_at, self.repo, self.actor, self.ids):
+                column.tofile(f)
+        os.replace(partial_path, path)
+
+
+class ColumnarBackend(StorageBackend):
+    """
+    Local columnar backend - one segment file of typed arrays per hour, grouped in per-day directories
+    repo_name and actor_login are dictionary encoded so counting stars is a C-speed Counter over an int array
+    Designed for a single writer process
+    """
+
+    vectorized = True
+
+    def __init__(self, log, root, actor_star_limit=ACTOR_STAR_LIMIT):
+        """
+        Initialize the ColumnarBackend class
+        :param log: logger object
+        :param root: directory to store the segments in
+        :param actor_star_limit: stars per hour an actor can give before their stars are down-weighted
+        """
+        self.log = log
+        self.root = root
+        self.actor_star_limit = actor_star_limit
+        # stable hashes of actor ids for the stargazer sketches
+        self.actor_hashes = {}
+        os.makedirs(root, exist_ok=True)
+        self.repos = Dictionary(os.path.join(root, "repos.dict"))
+        self.actors = Dictionary(os.path.join(root, "actors.dict"))
+        self.segments = {}
+        self.ledger = FileLedger(os.path.join(root, "ledger.json"))
+
+        self.log.info(f"Using local columnar storage in {root}")
+
+    def segment_path(self, bucket):
+        day, hour = bucket.split("T")
+        return os.path.join(self.root, day, f"{hour}.seg")
+
+    def read_segment(self, bucket):
+        """
+        Load the segment for an hour bucket (cached until the file changes)
+        :param bucket: hour bucket
+        :return: Segment or None if there is no data for the hour
+        """
+        path = self.segment_path(bucket)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        cached = self.segments.get(bucket)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, Segment.load(path))
+            self.segments[bucket] = cached
+            # the segment can use repos and actors another process added since the dictionaries were read
+            # (the writer appends them to the dictionaries before it saves the segment)
+            self.repos.refresh()
+            self.actors.refresh()
+
+        return cached[1]
+
+    def write_events(self, events, committed=None):
+        hours = {}
+        for event in events:
+            hours.setdefault(hour_bucket(event["created_at"]), []).append(event)
+
+        written = 0
+        for bucket, hour_events in hours.items():
+            created_at = [to_epoch(event["created_at"]) for event in hour_events]
+            repos = self.repos.encode([event["repo_name"] for event in hour_events])
+            actors = self.actors.encode([event["actor_login"] for event in hour_events])
+            ids = [int(event["id"]) for event in hour_events]
+
+            # merge with what is already stored for the hour - event ids are unique so rewrites are idempotent
+            rows = {}
+            existing = self.read_segment(bucket)
+            if existing is not None:
+                for row in zip(
+                    existing.ids, existing.created_at, existing.repo, existing.actor
+                ):
+                    rows[row[0]] = row
+            for row in zip(ids, created_at, repos, actors):
+                rows[row[0]] = row
+
+            segment = Segment()
+            for event_id, timestamp, repo, actor in sorted(
+                rows.values(), key=lambda row: row[1]
+            ):
+                segment.ids.append(event_id)
+                segment.created_at.append(timestamp)
+                segment.repo.append(repo)
+                segment.actor.append(actor)
+
+            path = self.segment_path(bucket)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            segment.save(path)
+            written += len(hour_events)
+
+            # every hour is written in one piece
+            if committed is not None:
+                committed.add(bucket)
+
+        return True, written
+
+    def write_rollups(self, events, bucket=None):
+        # hourly counts are computed straight from the segments so there is nothing to maintain
+        return True
+
+    def scan_rollups(self, buckets):
+        for bucket in buckets:
+            segment = self.read_segment(bucket)
+            if segment is None:
+                continue
+            for repo, stars in Counter(segment.repo).items():
+                yield bucket, self.repos.names[repo], stars
+
+    def scan_rollup_stats(self, buckets, repos=None):
+        wanted = None
+        if repos is not None:
+            self.repos.refresh()
+            wanted = {self.repos.ids[name] for name in repos if name in self.repos.ids}
+
+        names = self.actors.names
+        for bucket in buckets:
+            segment = self.read_segment(bucket)
+            if segment is None:
+                continue
+
+            # sketches are built straight from the actor column, like the rollup counts
+            actor_stars = Counter(segment.actor)
+            stats = {}
+            for repo, actor in zip(segment.repo, segment.actor):
+                if wanted is not None and repo not in wanted:
+                    continue
+                if repo not in stats:
+                    stats[repo] = [0, 0.0, HyperLogLog()]
+                row = stats[repo]
+                row[0] += 1
+                row[1] += actor_weight(actor_stars[actor], self.actor_star_limit)
+                if actor not in self.actor_hashes:
+                    self.actor_hashes[actor] = hash64(names[actor])
+                row[2].add_hash(self.actor_hashes[actor])
+
+            for repo, (stars, weighted, sketch) in stats.items():
+                yield bucket, self.repos.names[repo], stars, weighted, sketch
+
+    def scan_events(self, lower, upper, buckets):
+        lower_ts = to_epoch(lower)
+        upper_ts = to_epoch(upper)
+        for bucket in buckets:
+            segment = self.read_segment(bucket)
+            if segment is None:
+                continue
+            start = bisect_left(segment.created_at, lower_ts + 1)
+            end = bisect_left(segment.created_at, upper_ts)
+            for index in range(start, end):
+                yield self.repos.names[segment.repo[index]], from_epoch(
+                    segment.created_at[index]
+                )
+
+    def count_windows(self, windows, now):
+        ordered = sorted(windows)
+        now_ts = to_epoch(now)
+        lower_bounds = [now_ts - hours * 3600 for hours in ordered]
+
+        # count each band between two consecutive window boundaries exactly once
+        bands = [Counter() for _ in ordered]
+        rows = 0
+        for bucket in window_buckets(ordered[-1] + 1, now=now):
+            segment = self.read_segment(bucket)
+            if segment is None:
+                continue
+
+            end = bisect_left(segment.created_at, now_ts)
+            for band, lower_ts in enumerate(lower_bounds):
+                start = bisect_left(segment.created_at, lower_ts + 1)
+                if start < end:
+                    bands[band].update(segment.repo[start:end])
+                    rows += end - start
+                    end = start
+
+        # every window is the sum of its own band and all of the narrower ones
+        counts = {}
+        running = Counter()
+        for hours, band in zip(ordered, bands):
+            running.update(band)
+            counts[hours] = Counter(
+                {self.repos.names[repo]: stars for repo, stars in running.items()}
+            )
+
+        return counts, rows
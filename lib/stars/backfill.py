@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from events import StarEventBatch
+from gharchive import (
+    FileDigest,
+    decompress_stream,
+    hash_chunks,
+    iter_file_chunks,
+    iter_lines,
+    iter_url_chunks,
+    parse_star_events,
+)
+from ledger import ledger_key
+from mirror import mirrored_events
+
+GHARCHIVE_BASE_URL = "https://data.gharchive.org"
+
+# sentinel placed on the writer queue to tell the writer thread to stop
+_DONE = object()
+
+
+def parse_chunks(chunks):
+    """
+    Decompress and parse the compressed chunks of a gharchive file into star events
+    :param chunks: iterable of gzip compressed bytes
+    :return: generator of star event dicts
+    """
+    return parse_star_events(iter_lines(decompress_stream(chunks)))
+
+
+def collect_hour(source, mirror=None):
+    """
+    Download (or read), decompress and parse a single gharchive hour
+    This runs inside a worker process so it must stay a module level function
+    :param source: path to a local .json.gz file or a gharchive timestamp
+    :param mirror: optional HourMirror which gharchive timestamps are read from (and added to on a miss)
+    :return: tuple of the source, the sha256 of the compressed file, a StarEventBatch of star events
+        (compact, so it is cheap to send between processes) and the number of seconds it took
+    """
+    start = time.time()
+    digest = FileDigest()
+    url = f"{GHARCHIVE_BASE_URL}/{source}.json.gz"
+    if os.path.isfile(source):
+        events = parse_chunks(hash_chunks(iter_file_chunks(source), digest))
+    elif mirror is not None:
+        events = mirrored_events(
+            mirror, source, lambda: iter_url_chunks(url), parse_chunks, digest
+        )
+    else:
+        events = parse_chunks(hash_chunks(iter_url_chunks(url), digest))
+
+    events = StarEventBatch.from_events(events)
+    return source, digest.hexdigest(), events, time.time() - start
+
+
+class Backfill:
+    """
+    Parallel backfill engine for rebuilding star event history
+    Hours are parsed across a process pool while a single writer thread commits them to the database
+    """
+
+    def __init__(self, star_events, workers=None, max_pending=None):
+        """
+        Initialize the Backfill class
+        :param star_events: StarEvents object used to write events to the database
+        :param workers: number of parser processes (default: number of cpus)
+        :param max_pending: max number of parsed hours waiting to be written (default: workers)
+        """
+        self.star_events = star_events
+        self.log = star_events.log
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers
+        self.completed = []
+        self.failed = []
+        self.skipped = []
+
+    def writer(self, pending):
+        """
+        Writer stage - commits parsed hours to the database one at a time
+        :param pending: queue of (source, checksum, events, collect_seconds) tuples
+        """
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+
+            source, checksum, events, collect_seconds = item
+            start = time.time()
+
+            # records the hour in the ingest ledger so a re-run skips it (or resumes it if it partially failed)
+            try:
+                result = self.star_events.write_hour(
+                    ledger_key(source),
+                    events,
+                    checksum=checksum,
+                    collect_seconds=collect_seconds,
+                )
+            except Exception as e:
+                self.log.error(f"Error writing events for {source}: {e}")
+                result = False
+            finally:
+                self.star_events.clear_events()
+
+            if result:
+                self.completed.append(source)
+            else:
+                self.failed.append(source)
+
+            self.log.info(
+                f"Wrote {len(events)} events for {source} in {round(time.time() - start, 2)} seconds"
+            )
+
+    def run(self, sources):
+        """
+        Parse and write all of the given hours
+        :param sources: list of local .json.gz paths or gharchive timestamps
+        :return: True if every hour was written successfully, False if not
+        """
+        start = time.time()
+        sources = list(sources)
+
+        # hours which are already in the ingest ledger don't need to be downloaded or parsed again
+        if self.star_events.use_ledger:
+            done = self.star_events.backend.ledger.completed(
+                [ledger_key(source) for source in sources]
+            )
+            if done:
+                self.log.info(f"Skipping {len(done)} hours which were already ingested")
+                self.skipped = [s for s in sources if ledger_key(s) in done]
+                sources = [s for s in sources if ledger_key(s) not in done]
+
+        total = len(sources)
+
+        self.log.info(f"Backfilling {total} hours with {self.workers} workers")
+
+        # bounded queue between the parsers and the writer - parsers stall when the writer falls behind
+        pending = queue.Queue(maxsize=self.max_pending)
+        writer_thread = threading.Thread(target=self.writer, args=(pending,))
+        writer_thread.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                remaining = iter(sources)
+                in_flight = {}
+
+                def submit_next():
+                    source = next(remaining, None)
+                    if source is not None:
+                        in_flight[
+                            pool.submit(collect_hour, source, self.star_events.mirror)
+                        ] = source
+
+                # keep every worker busy with one hour queued behind it
+                for _ in range(self.workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        source = in_flight.pop(future)
+                        submit_next()
+
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            self.log.error(f"Error collecting events for {source}: {e}")
+                            self.failed.append(source)
+                            continue
+
+                        self.log.info(f"Parsed {len(result[2])} events from {source}")
+                        pending.put(result)
+        finally:
+            pending.put(_DONE)
+            writer_thread.join()
+
+        self.log.info(
+            f"Backfilled {len(self.completed)}/{total} hours in {round(time.time() - start, 2)} seconds"
+        )
+
+        return len(self.failed) == 0
@@ -0,0 +1,249 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from events import StarEventBatch
+from gharchive import FileDigest
+
+# hour format used to compare gharchive hours (gharchive itself doesn't zero pad the hour)
+HOUR_FORMAT = "%Y-%m-%d-%H"
+
+# hours which still aren't published this long after they ended are given up on (gharchive has a few gaps)
+GIVE_UP_AFTER = timedelta(hours=6)
+
+
+def hour_end(hour):
+    """
+    Get the time a gharchive hour ends (the earliest time its file can be complete)
+    :param hour: gharchive timestamp (e.g. 2022-09-10-5)
+    :return: naive UTC datetime
+    """
+    return datetime.strptime(hour, HOUR_FORMAT) + timedelta(hours=1)
+
+
+class IngestDaemon:
+    """
+    Long-running ingest loop
+    Keeps the http session and the database clients warm between hours, polls gharchive with HEAD requests
+    until the next hour is published and pipelines the stages: a collector thread downloads and parses the next
+    hour while the current one is being written
+    """
+
+    def __init__(
+        self,
+        star_events,
+        poll_interval=60,
+        max_poll_interval=300,
+        max_pending=1,
+    ):
+        """
+        Initialize the IngestDaemon class
+        :param star_events: StarEvents object used to collect and write events (ledger must be enabled)
+        :param poll_interval: seconds between HEAD requests while waiting for an hour to be published
+        :param max_poll_interval: max seconds between HEAD requests (the interval doubles while nothing changes)
+        :param max_pending: max number of collected hours waiting to be written
+        """
+        import requests
+
+        self.star_events = star_events
+        self.log = star_events.log
+        self.metrics = star_events.metrics
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_pending = max_pending
+        self.stopping = threading.Event()
+        # hours which have been handed to the collector and aren't written yet
+        self.queued = set()
+        # hours which were never published (see GIVE_UP_AFTER)
+        self.unavailable = set()
+        # hours which failed to write -> earliest time to try them again
+        self.retry_at = {}
+        self.lock = threading.Lock()
+        self.completed = []
+        self.failed = []
+
+        # one keep-alive session for every HEAD and download
+        self.session = requests.Session()
+        self.star_events.session = self.session
+
+    def stop(self):
+        """
+        Ask the daemon to stop once the hour being written is done
+        """
+        self.stopping.set()
+
+    def next_hour(self):
+        """
+        Get the oldest hour which is due, not ingested yet and not already queued
+        :return: gharchive timestamp or None if every hour up to the last complete hour is done
+        """
+        now = datetime.utcnow()
+        missing = self.star_events.missing_hours(newest=now - timedelta(hours=1))
+        with self.lock:
+            for hour in missing:
+                if hour in self.queued or hour in self.unavailable:
+                    continue
+                if self.retry_at.get(hour, now) > now:
+                    continue
+                return hour
+        return None
+
+    def available(self, hour):
+        """
+        Check whether gharchive has published an hour without downloading it
+        :param hour: gharchive timestamp
+        :return: True if the file exists
+        """
+        url = f"{self.star_events.base_url}/{hour}.json.gz"
+        try:
+            resp = self.session.head(url, allow_redirects=True, timeout=30)
+        except Exception as e:
+            self.log.warning(f"HEAD {url} failed: {e}")
+            return False
+        self.metrics.increment("polls", 1, status=str(resp.status_code))
+        return resp.status_code == 200
+
+    def collect(self, hour):
+        """
+        Download and parse one hour
+        :param hour: gharchive timestamp
+        :return: tuple of (hour, sha256 of the compressed file, StarEventBatch, seconds it took)
+        """
+        digest = FileDigest()
+        with self.metrics.stage("collect") as timer:
+            events = StarEventBatch.from_events(
+                self.star_events.iter_star_events(timestamp=hour, digest=digest)
+            )
+        self.metrics.increment("events", len(events), stage="parse")
+        return hour, digest.hexdigest(), events, timer.elapsed
+
+    def collector(self, pending):
+        """
+        Collector stage - waits for each hour to be published, then downloads and parses it
+        :param pending: queue of collected hours for the writer
+        """
+        wait = self.poll_interval
+        while not self.stopping.is_set():
+            hour = self.next_hour()
+
+            if hour is None:
+                # every hour is done - sleep until the current hour ends
+                now = datetime.utcnow()
+                next_due = now.replace(minute=0, second=0, microsecond=0) + timedelta(
+                    hours=1
+                )
+                self.stopping.wait(
+                    min((next_due - now).total_seconds() + 1, self.max_poll_interval)
+                )
+                wait = self.poll_interval
+                continue
+
+            if not self.available(hour):
+                if datetime.utcnow() - hour_end(hour) > GIVE_UP_AFTER:
+                    self.log.warning(f"{hour} was never published - skipping it")
+                    self.unavailable.add(hour)
+                    continue
+
+                # gharchive usually publishes an hour a few minutes after it ends - back off while it doesn't
+                self.stopping.wait(wait)
+                wait = min(wait * 2, self.max_poll_interval)
+                continue
+
+            wait = self.poll_interval
+            with self.lock:
+                self.queued.add(hour)
+
+            try:
+                item = self.collect(hour)
+            except BaseException as e:
+                # gharchive_stream exits on a bad response, which must not take the collector thread down
+                self.log.error(f"Error collecting events for {hour}: {e!r}")
+                with self.lock:
+                    self.queued.discard(hour)
+                self.stopping.wait(self.poll_interval)
+                continue
+
+            self.log.info(f"Collected {len(item[2])} events for {hour}")
+
+            # blocks while the writer is busy, so at most max_pending hours are held in memory
+            while not self.stopping.is_set():
+                try:
+                    pending.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def write(self, item):
+        """
+        Writer stage - stores one collected hour (write_hour also slides the trend windows forward)
+        :param item: tuple from collect
+        :return: True if successful, False if not
+        """
+        hour, checksum, events, collect_seconds = item
+        star_events = self.star_events
+        star_events.events = events
+        star_events.checksum = checksum
+
+        try:
+            success = star_events.write_hour(
+                hour, events, checksum, collect_seconds=collect_seconds
+            )
+        except Exception as e:
+            self.log.error(f"Error writing events for {hour}: {e}")
+            success = False
+        finally:
+            star_events.clear_events()
+            with self.lock:
+                self.queued.discard(hour)
+
+        self.metrics.increment("hours", 1, status="ok" if success else "failed")
+        if not success:
+            self.failed.append(hour)
+            with self.lock:
+                self.retry_at[hour] = datetime.utcnow() + timedelta(
+                    seconds=self.max_poll_interval
+                )
+            return False
+
+        # time between the end of the hour and its events being queryable
+        lag = (datetime.utcnow() - hour_end(hour)).total_seconds()
+        self.metrics.observe("ingest_lag_seconds", lag)
+        self.completed.append(hour)
+        self.log.info(f"Ingested {hour} with a lag of {round(lag / 60, 1)} minutes")
+        return True
+
+    def run(self, max_hours=None):
+        """
+        Ingest hours as they are published until stop is called
+        :param max_hours: stop after this many hours have been written (default: run forever)
+        """
+        if not self.star_events.use_ledger:
+            raise ValueError("the ingest daemon needs the ingest ledger (USE_LEDGER)")
+
+        pending = queue.Queue(maxsize=self.max_pending)
+        collector = threading.Thread(
+            target=self.collector, args=(pending,), daemon=True
+        )
+        collector.start()
+        self.log.info("Ingest daemon started")
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    item = pending.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+                self.write(item)
+                self.star_events.write_metrics("stars_daemon")
+
+                if max_hours and len(self.completed) + len(self.failed) >= max_hours:
+                    break
+        finally:
+            self.stop()
+            collector.join()
+            self.session.close()
+
+        self.log.info(
+            f"Ingest daemon stopped ({len(self.completed)} hours written, {len(self.failed)} failed)"
+        )
@@ -0,0 +1,168 @@
+import os
+import time
+from array import array
+from bisect import bisect_left
+
+from events import from_epoch
+from partitions import hour_bucket
+
+# max number of hours of ids kept in memory (the daemon and backfills go through hours in order)
+MAX_CACHED_HOURS = 48
+
+
+def collapse_repeat_stars(events, indexes=None):
+    """
+    Keep only the first star of every (actor, repo) pair within an hour
+    Starring, unstarring and starring again creates a new WatchEvent each time, which shouldn't count as more stars
+    :param events: StarEventBatch
+    :param indexes: event indexes to consider, in order (default: every event)
+    :return: list of the indexes to keep
+    """
+    if indexes is None:
+        indexes = range(len(events))
+
+    actors = events.actors.names
+    seen = set()
+    keep = []
+    for index in indexes:
+        # stars without an actor (e.g. migrated legacy rows) can't be told apart, so they are all kept
+        if not actors[events.actor[index]]:
+            keep.append(index)
+            continue
+        key = (
+            events.actor[index],
+            events.repo[index],
+            events.created_at[index] // 3600,
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        keep.append(index)
+    return keep
+
+
+def contains(ids, event_id):
+    """
+    Check a sorted array for an event id
+    :param ids: sorted array of event ids
+    :param event_id: event id (int)
+    :return: bool
+    """
+    index = bisect_left(ids, event_id)
+    return index < len(ids) and ids[index] == event_id
+
+
+class DedupIndex:
+    """
+    Exact index of the star event ids which are already stored, as one sorted array of ids per hour on disk
+    (2022-09-10T14.ids in the index directory)
+    Overlapping cron runs and replayed backfills drop the events the index already has before any network
+    write - unlike a Bloom filter there are no false positives, so a new event is never dropped by mistake
+    Hour files which haven't been used for the retention period are pruned, so the index only holds the hours
+    which are still being rewritten
+    Designed for a single writer process
+    """
+
+    def __init__(self, path, retention_hours=72):
+        """
+        Initialize the DedupIndex class
+        :param path: directory of the index
+        :param retention_hours: prune hours which haven't been read or written for this many hours
+        """
+        self.path = path
+        self.retention_hours = retention_hours
+        # hour (hours since the epoch) -> sorted array of event ids, or None if the hour has no file
+        self.hours = {}
+        os.makedirs(path, exist_ok=True)
+
+    def hour_path(self, hour):
+        return os.path.join(self.path, f"{hour_bucket(from_epoch(hour * 3600))}.ids")
+
+    def load(self, hour):
+        """
+        Get the stored event ids of an hour
+        :param hour: hours since the epoch
+        :return: sorted array of event ids, or None if nothing is stored for the hour
+        """
+        if hour in self.hours:
+            return self.hours[hour]
+
+        ids = None
+        path = self.hour_path(hour)
+        try:
+            with open(path, "rb") as f:
+                ids = array("q")
+                ids.frombytes(f.read())
+            # reading an hour counts as using it, so hours which are still being replayed aren't pruned
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.cache(hour, ids)
+        return ids
+
+    def cache(self, hour, ids):
+        self.hours.pop(hour, None)
+        self.hours[hour] = ids
+        while len(self.hours) > MAX_CACHED_HOURS:
+            del self.hours[next(iter(self.hours))]
+
+    def new_events(self, events, indexes=None):
+        """
+        Find the events which aren't stored yet
+        :param events: StarEventBatch
+        :param indexes: event indexes to consider, in order (default: every event)
+        :return: list of the indexes of events which aren't in the index (the first one of any repeated id)
+        """
+        if indexes is None:
+            indexes = range(len(events))
+
+        keep = []
+        # the same event can also be in a batch more than once
+        seen = set()
+        for index in indexes:
+            event_id = events.ids[index]
+            if event_id in seen:
+                continue
+            stored = self.load(events.created_at[index] // 3600)
+            if stored is None or not contains(stored, event_id):
+                seen.add(event_id)
+                keep.append(index)
+        return keep
+
+    def add(self, events):
+        """
+        Record events as stored - only call this once they are all written
+        :param events: StarEventBatch
+        """
+        hours = {}
+        for event_id, created_at in zip(events.ids, events.created_at):
+            hours.setdefault(created_at // 3600, set()).add(event_id)
+
+        for hour, ids in hours.items():
+            stored = self.load(hour)
+            if stored is not None:
+                ids.update(stored)
+            merged = array("q", sorted(ids))
+
+            path = self.hour_path(hour)
+            partial_path = f"{path}.part"
+            with open(partial_path, "wb") as f:
+                merged.tofile(f)
+            os.replace(partial_path, path)
+            self.cache(hour, merged)
+
+    def prune(self):
+        """
+        Delete the hours which haven't been used for the retention period
+        :return: number of hours deleted
+        """
+        cutoff = time.time() - self.retention_hours * 3600
+        pruned = 0
+        for item in os.scandir(self.path):
+            if item.name.endswith(".ids") and item.stat().st_mtime < cutoff:
+                os.remove(item.path)
+                pruned += 1
+        if pruned:
+            self.hours.clear()
+        return pruned
@@ -0,0 +1,239 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import registry
+
+# number of contributors to keep for each repo
+MAX_CONTRIBUTORS = 10
+
+# http status codes GitHub uses when a rate limit is hit
+RATE_LIMIT_STATUS_CODES = (403, 429)
+
+
+def build_enriched_repo(repo_name, stars, repo_data, contributors):
+    """
+    Build the enriched repo object which is published to the frontend
+    :param repo_name: repo name (owner/name)
+    :param stars: number of stars in the time period
+    :param repo_data: /repos/{repo_name} response
+    :param contributors: list of contributors
+    :return: enriched repo dict
+    """
+    return {
+        "repo_name": repo_name,
+        "stars": stars,
+        "repo_url": f"https://github.com/{repo_name}",
+        "description": repo_data["description"],
+        "stargazers_count": repo_data["stargazers_count"],
+        "language": repo_data["language"],
+        "forks_count": repo_data["forks_count"],
+        "updated_at": repo_data["updated_at"],
+        "watchers_count": repo_data["watchers_count"],
+        "open_issues_count": repo_data["open_issues_count"],
+        "topics": repo_data["topics"],
+        "license": repo_data["license"],
+        "contributors": contributors[:MAX_CONTRIBUTORS],
+    }
+
+
+class Enricher:
+    """
+    Concurrent GitHub API enrichment client
+    Uses asyncio to pipeline the repo and contributor lookups of many repos over a pooled keep-alive session,
+    with bounded concurrency that slows down automatically as the rate limit runs low
+    """
+
+    def __init__(
+        self,
+        log,
+        cache,
+        token=None,
+        base_url="https://api.github.com",
+        concurrency=16,
+        min_remaining=100,
+        max_retries=3,
+    ):
+        """
+        Initialize the Enricher class
+        :param log: logger object
+        :param cache: ApiCache used for every request
+        :param token: GitHub token
+        :param base_url: GitHub API base url
+        :param concurrency: max number of requests in flight
+        :param min_remaining: start pacing requests once fewer than this many are left in the rate limit window
+        :param max_retries: number of times to retry a rate limited request
+        """
+        self.log = log
+        self.cache = cache
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.min_remaining = min_remaining
+        self.max_retries = max_retries
+
+        # one keep-alive connection pool shared by every request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.remaining = None
+        self.reset_at = None
+        self.paused_until = 0
+
+    def observe(self, headers):
+        """
+        Track the rate limit state from the response headers
+        :param headers: response headers
+        """
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_at = headers.get("X-RateLimit-Reset")
+        retry_after = headers.get("Retry-After")
+
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_at is not None:
+            self.reset_at = int(reset_at)
+        if retry_after is not None:
+            self.paused_until = max(self.paused_until, time.time() + int(retry_after))
+
+    def is_rate_limited(self, resp):
+        """
+        Helper function to check if a response was rejected by a rate limit
+        403s are also used for permission errors so only count them when the rate limit headers say so
+        :param resp: CachedResponse
+        :return: True if the request was rate limited
+        """
+        if resp.status_code not in RATE_LIMIT_STATUS_CODES:
+            return False
+
+        return (
+            resp.status_code == 429
+            or "Retry-After" in resp.headers
+            or resp.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def delay(self):
+        """
+        Work out how long to wait before the next request
+        :return: seconds to sleep (0 when there is plenty of rate limit left)
+        """
+        now = time.time()
+        if self.paused_until > now:
+            return self.paused_until - now
+
+        if self.remaining is None or self.reset_at is None:
+            return 0
+
+        if self.remaining <= 0:
+            return max(0, self.reset_at - now)
+
+        # spread the remaining requests evenly over what is left of the window
+        if self.remaining < self.min_remaining:
+            return max(0, self.reset_at - now) / self.remaining
+
+        return 0
+
+    async def fetch(self, url, semaphore):
+        """
+        GET a json url through the cache, respecting concurrency and rate limits
+        :param url: url to fetch
+        :param semaphore: asyncio.Semaphore of the enrich_all call (bound to its event loop)
+        :return: CachedResponse
+        """
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                delay = self.delay()
+                if delay > 0:
+                    self.log.info(
+                        f"Rate limit is low - waiting {round(delay, 2)} seconds"
+                    )
+                    registry.observe("rate_limit_wait_seconds", delay)
+                    await asyncio.sleep(delay)
+
+                start = time.perf_counter()
+                resp = await loop.run_in_executor(
+                    self.executor, self.cache.get, self.session, url
+                )
+                registry.observe("request_seconds", time.perf_counter() - start)
+
+            self.observe(resp.headers)
+
+            if not self.is_rate_limited(resp) or attempt == self.max_retries:
+                return resp
+
+            # rate limited - back off until the window resets before trying again
+            registry.increment("retries", stage="enrich")
+            if self.paused_until <= time.time():
+                self.paused_until = time.time() + max(self.delay(), 2**attempt)
+            self.log.warning(f"Rate limited fetching {url} - retrying...")
+
+        return resp
+
+    async def enrich_repo(self, repo_name, stars, semaphore):
+        """
+        Fetch the repo and then its contributors
+        :param repo_name: repo name (owner/name)
+        :param stars: number of stars in the time period
+        :param semaphore: asyncio.Semaphore of the enrich_all call
+        :return: enriched repo dict or None if it could not be enriched
+        """
+        resp = await self.fetch(f"{self.base_url}/repos/{repo_name}", semaphore)
+
+        if resp.status_code == 404:
+            self.log.warning(f"Repo {repo_name} not found - skipping...")
+            return None
+
+        if resp.status_code != 200:
+            self.log.error(
+                f"Error getting repo enrichment data for {repo_name} - HTTP: {resp.status_code}"
+            )
+            return None
+
+        repo_data = resp.json()
+
+        # make an API call to get repo contributors data
+        contributors_resp = await self.fetch(repo_data["contributors_url"], semaphore)
+
+        if contributors_resp.status_code != 200:
+            self.log.error(
+                f"Error getting contributors enrichment data for {repo_name} - HTTP: {contributors_resp.status_code}"
+            )
+            return None
+
+        return build_enriched_repo(
+            repo_name, stars, repo_data, contributors_resp.json()
+        )
+
+    async def enrich_all(self, repos):
+        """
+        Enrich every repo concurrently
+        :param repos: list of (repo_name, stars) tuples
+        :return: list of enriched repo dicts in the same order (repos which failed are left out)
+        """
+        # one semaphore per call - concurrent enrich calls (e.g. from the query api's threads) each run their
+        # own event loop, and the shared thread pool still caps the requests in flight
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(
+                self.enrich_repo(repo_name, stars, semaphore)
+                for repo_name, stars in repos
+            )
+        )
+        return [result for result in results if result is not None]
+
+    def enrich(self, repos):
+        """
+        Enrich every repo concurrently (blocking entry point)
+        :param repos: list of (repo_name, stars) tuples
+        :return: list of enriched repo dicts
+        """
+        return asyncio.run(self.enrich_all(repos))
@@ -0,0 +1,232 @@
+import os
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(timestamp):
+    """
+    Convert a naive UTC datetime to epoch seconds
+    :param timestamp: naive UTC datetime
+    :return: epoch seconds (int)
+    """
+    return int((timestamp - EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    """
+    Convert epoch seconds to a naive UTC datetime
+    :param seconds: epoch seconds
+    :return: naive UTC datetime
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class Dictionary:
+    """
+    Append-only dictionary encoding of strings to integer ids
+    When a path is given the strings are persisted to it, one string per line - other processes reading the
+    same file pick up new strings with refresh
+    Reads and appends are serialized, so queries on several threads can refresh the same dictionary
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the Dictionary class
+        :param path: path to the dictionary file (None to keep it in memory only)
+        """
+        self.path = path
+        self.names = []
+        self.ids = {}
+        # bytes of the dictionary file which have been read
+        self.offset = 0
+        self.lock = threading.Lock()
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Read the strings which were appended to the dictionary file since it was last read
+        Only complete lines are read, so a string another process is still writing is picked up next time
+        """
+        if not self.path:
+            return
+
+        with self.lock:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                return
+            if size <= self.offset:
+                return
+
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+
+            end = data.rfind(b"\n") + 1
+            for name in data[:end].decode("utf-8").split("\n")[:-1]:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+            self.offset += end
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """
+        Get the id for a single string, adding it to the (in-memory) dictionary if it is new
+        :param name: string to encode
+        :return: id (int)
+        """
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+        return index
+
+    def encode(self, names):
+        """
+        Get the ids for a list of strings, adding any new ones to the dictionary file
+        :param names: list of strings (must not contain newlines)
+        :return: array of ids
+        """
+        with self.lock:
+            start = len(self.names)
+            ids = array("I", (self.add(name) for name in names))
+
+            if self.path and len(self.names) > start:
+                with open(self.path, "ab") as f:
+                    f.write(
+                        "".join(f"{name}\n" for name in self.names[start:]).encode(
+                            "utf-8"
+                        )
+                    )
+                    self.offset = f.tell()
+
+        return ids
+
+
+class StarEventBatch:
+    """
+    Compact container for a batch of star events
+    Events are stored as parallel typed arrays - repo names and actor logins are dictionary encoded
+    and timestamps are epoch seconds - so each event costs a few dozen bytes instead of two dicts of strings
+    """
+
+    def __init__(self, repos=None, actors=None):
+        """
+        Initialize the StarEventBatch class
+        :param repos: Dictionary of repo names to share with another batch (optional)
+        :param actors: Dictionary of actor logins to share with another batch (optional)
+        """
+        self.repos = repos if repos is not None else Dictionary()
+        self.actors = actors if actors is not None else Dictionary()
+        self.ids = array("q")
+        self.actor_ids = array("q")
+        self.repo_ids = array("q")
+        self.created_at = array("q")
+        self.repo = array("I")
+        self.actor = array("I")
+        # epoch seconds of every "YYYY-MM-DDTHH" prefix seen so far - an hour file only has one or two
+        self.hours = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_events(cls, events):
+        """
+        Build a batch from parsed star events
+        :param events: iterable of star event dicts (see gharchive.parse_star_events)
+        :return: StarEventBatch
+        """
+        batch = cls()
+        for event in events:
+            batch.append(event)
+        return batch
+
+    def epoch(self, created_at):
+        """
+        Convert a gharchive timestamp (YYYY-MM-DDTHH:MM:SSZ) to epoch seconds
+        :param created_at: timestamp string
+        :return: epoch seconds (int)
+        """
+        prefix = created_at[:13]
+        base = self.hours.get(prefix)
+        if base is None:
+            base = to_epoch(datetime.strptime(prefix, "%Y-%m-%dT%H"))
+            self.hours[prefix] = base
+        return base + int(created_at[14:16]) * 60 + int(created_at[17:19])
+
+    def append(self, event):
+        """
+        Add a parsed star event to the batch
+        :param event: star event dict (see gharchive.parse_star_events)
+        """
+        self.ids.append(int(event["id"] or 0))
+        self.actor_ids.append(event["actor_id"] or 0)
+        self.repo_ids.append(event["repo_id"] or 0)
+        self.created_at.append(self.epoch(event["created_at"]))
+        self.repo.append(self.repos.add(event["repo_name"]))
+        self.actor.append(self.actors.add(event["actor_login"]))
+
+    def extend(self, events):
+        """
+        Add many parsed star events to the batch
+        :param events: iterable of star event dicts
+        """
+        for event in events:
+            self.append(event)
+
+    def keys(self):
+        """
+        Iterate over the event id and repo name of every event without building any dicts
+        :return: generator of (event_id, repo_name) tuples ("" for a missing event id)
+        """
+        names = self.repos.names
+        for event_id, repo in zip(self.ids, self.repo):
+            yield str(event_id) if event_id else "", names[repo]
+
+    def select(self, indexes):
+        """
+        Build a new batch with a subset of the events (the dictionaries are shared, not copied)
+        :param indexes: iterable of event indexes to keep, in order
+        :return: StarEventBatch
+        """
+        batch = StarEventBatch(self.repos, self.actors)
+        for index in indexes:
+            batch.ids.append(self.ids[index])
+            batch.actor_ids.append(self.actor_ids[index])
+            batch.repo_ids.append(self.repo_ids[index])
+            batch.created_at.append(self.created_at[index])
+            batch.repo.append(self.repo[index])
+            batch.actor.append(self.actor[index])
+        return batch
+
+    def __iter__(self):
+        """
+        Lazily decode every event into the dict format the storage backends write
+        :return: generator of dicts with id, actor_id, actor_login, repo_id, repo_name and created_at (naive UTC datetime)
+        """
+        repo_names = self.repos.names
+        actor_logins = self.actors.names
+        for event_id, actor_id, repo_id, created_at, repo, actor in zip(
+            self.ids,
+            self.actor_ids,
+            self.repo_ids,
+            self.created_at,
+            self.repo,
+            self.actor,
+        ):
+            yield {
+                "id": str(event_id),
+                "actor_id": actor_id,
+                "actor_login": actor_logins[actor],
+                "repo_id": repo_id,
+                "repo_name": repo_names[repo],
+                "created_at": from_epoch(created_at),
+            }
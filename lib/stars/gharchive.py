@@ -0,0 +1,217 @@
+import hashlib
+import os
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional, fall back to the standard library parser
+    from json import loads as json_loads
+
+# size of each chunk read from the http response body (1 MiB)
+CHUNK_SIZE = 1024 * 1024
+
+# zlib window bits value which tells zlib to expect a gzip header
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# raw bytes that every WatchEvent line contains (gharchive never escapes plain ascii in json strings)
+WATCH_EVENT_MARKER = b'"WatchEvent"'
+
+
+def decompress_stream(chunks):
+    """
+    Incrementally decompress an iterable of gzip compressed byte chunks
+    Concatenated (multi-member) gzip streams are handled as well
+    :param chunks: iterable of gzip compressed bytes
+    :return: generator of decompressed bytes (raises EOFError if the stream is cut off inside a gzip member)
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    # whether the current gzip member has been fed any bytes yet
+    started = False
+    for chunk in chunks:
+        while chunk:
+            started = True
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+
+            # if a gzip member ended inside this chunk, start a new decompressor for the rest
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                started = False
+            else:
+                chunk = b""
+
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+    # a truncated download otherwise looks like a complete (shorter) hour
+    if started and not decompressor.eof:
+        raise EOFError(
+            "Compressed file ended before the end-of-stream marker was reached"
+        )
+
+
+def iter_lines(blocks):
+    """
+    Split an iterable of byte blocks into lines without buffering more than one block
+    :param blocks: iterable of bytes
+    :return: generator of non-empty lines (bytes, without the trailing newline)
+    """
+    pending = b""
+    for block in blocks:
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+
+    if pending:
+        yield pending
+
+
+def tee_to_file(chunks, path):
+    """
+    Pass chunks through unchanged while also writing them to a file
+    The file is written to a temporary path and only renamed into place once the stream is complete
+    :param chunks: iterable of bytes
+    :param path: path to write the chunks to
+    :return: generator of the same chunks
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    partial_path = f"{path}.part"
+    with open(partial_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+    os.replace(partial_path, path)
+
+
+class FileDigest:
+    """
+    sha256 of a compressed gharchive file
+    Fed the file as it streams, or set directly when the events are replayed from a mirror extract
+    (the extract records the hash of the file it was cut from)
+    """
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.known = None
+
+    def update(self, data):
+        self.hash.update(data)
+
+    def hexdigest(self):
+        return self.known or self.hash.hexdigest()
+
+
+def hash_chunks(chunks, digest):
+    """
+    Pass chunks through unchanged while also feeding them to a hash
+    :param chunks: iterable of bytes
+    :param digest: hashlib object to update
+    :return: generator of the same chunks
+    """
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Read a file from disk in chunks
+    :param path: path to the file
+    :param chunk_size: size of each chunk in bytes
+    :return: generator of bytes
+    """
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_url_chunks(url, chunk_size=CHUNK_SIZE):
+    """
+    Stream the body of a http response in chunks
+    :param url: url to download
+    :param chunk_size: size of each chunk in bytes
+    :return: generator of bytes (raises requests.HTTPError on a non-200 response)
+    """
+    import requests
+
+    with requests.get(url, stream=True) as resp:
+        resp.raise_for_status()
+        yield from resp.iter_content(chunk_size=chunk_size)
+
+
+def gharchive_hours(start, end):
+    """
+    Build the list of gharchive timestamps between two hours (inclusive)
+    :param start: first hour in YYYY-MM-DD-HH format
+    :param end: last hour in YYYY-MM-DD-HH format
+    :return: list of timestamps in gharchive format (hours are not zero padded)
+    """
+    current = datetime.strptime(start, "%Y-%m-%d-%H")
+    last = datetime.strptime(end, "%Y-%m-%d-%H")
+
+    hours = []
+    while current <= last:
+        hours.append(f"{current.strftime('%Y-%m-%d')}-{current.hour}")
+        current += timedelta(hours=1)
+
+    return hours
+
+
+def filter_star_lines(lines):
+    """
+    Skip every raw gharchive line which can't be a star event, without any json decoding
+    :param lines: iterable of raw json lines (bytes)
+    :return: generator of lines which contain the WatchEvent marker
+    """
+    for line in lines:
+        # fast path: the vast majority of lines are not star events
+        if WATCH_EVENT_MARKER in line:
+            yield line
+
+
+def parse_star_lines(lines):
+    """
+    Decode candidate lines into star events
+    :param lines: iterable of raw json lines (bytes) which contain the WatchEvent marker
+    :return: generator of star event dicts
+    """
+    for line in lines:
+        event = json_loads(line)
+
+        # the marker can also appear inside a payload (commit messages, issue bodies, etc)
+        if event["type"] != "WatchEvent":
+            continue
+
+        actor = event["actor"]
+        repo = event["repo"]
+        yield {
+            "id": event["id"],
+            "actor_id": actor["id"],
+            "actor_login": actor["login"],
+            "repo_id": repo["id"],
+            "repo_name": repo["name"],
+            "created_at": event["created_at"],
+        }
+
+
+def parse_star_events(lines):
+    """
+    Parse raw gharchive lines into star events
+    Lines without the WatchEvent marker are skipped before any json decoding happens
+    :param lines: iterable of raw json lines (bytes)
+    :return: generator of star event dicts
+    """
+    return parse_star_lines(filter_star_lines(lines))
@@ -0,0 +1,102 @@
+import re
+from datetime import datetime
+
+# kinds of secondary index and the enriched repo field each one groups by
+INDEX_KINDS = ("language", "topic")
+
+# shard key used for repos without a language (the frontend shows these as "Other")
+OTHER = "other"
+
+
+def slugify(name):
+    """
+    Turn a language or topic into a url safe shard key
+    :param name: language (e.g. C++) or topic (e.g. machine-learning)
+    :return: slug (e.g. cplusplus)
+    """
+    if not name:
+        return OTHER
+    name = name.lower().replace("+", "plus").replace("#", "sharp")
+    return re.sub(r"[^a-z0-9]+", "-", name).strip("-") or OTHER
+
+
+def repo_keys(kind, repo):
+    """
+    Get the index keys of an enriched repo
+    :param kind: language or topic
+    :param repo: enriched repo dict (see enrich.build_enriched_repo)
+    :return: list of (slug, display name) tuples
+    """
+    if kind == "language":
+        language = repo.get("language")
+        return [(slugify(language), language or "Other")]
+    return [(slugify(topic), topic) for topic in repo.get("topics") or []]
+
+
+def build_indexes(results, limit=20, min_repos=2, max_keys=100):
+    """
+    Group the ranked repos of every window by language and by topic
+    :param results: dict of window name -> list of enriched repos, highest first
+    :param limit: number of repos to keep in each shard
+    :param min_repos: skip keys which never have at least this many repos in a window
+    :param max_keys: max number of keys of each kind (the keys with the most repos are kept)
+    :return: dict of kind -> dict of slug -> {"name": display name, "windows": dict of window name -> repos}
+    """
+    indexes = {}
+    for kind in INDEX_KINDS:
+        shards = {}
+        for window, repos in results.items():
+            for repo in repos:
+                for slug, name in repo_keys(kind, repo):
+                    shard = shards.setdefault(slug, {"name": name, "windows": {}})
+                    rows = shard["windows"].setdefault(window, [])
+                    # repos arrive highest first so the shard is already ranked
+                    if len(rows) < limit:
+                        rows.append(repo)
+
+        size = {
+            slug: max(len(rows) for rows in shard["windows"].values())
+            for slug, shard in shards.items()
+        }
+        keep = sorted(
+            (slug for slug in shards if size[slug] >= min_repos),
+            key=lambda slug: (-size[slug], slug),
+        )[:max_keys]
+        indexes[kind] = {slug: shards[slug] for slug in sorted(keep)}
+    return indexes
+
+
+def shard_name(kind, slug, window):
+    """
+    Get the name of a shard file (relative to the trends path, without .json)
+    :param kind: language or topic
+    :param slug: shard key
+    :param window: window name (e.g. last_24_hours)
+    :return: name (e.g. language/rust/last_24_hours)
+    """
+    return f"{kind}/{slug}/{window}"
+
+
+def index_files(indexes, windows):
+    """
+    Build the shard files and the manifest which lists them
+    :param indexes: output of build_indexes
+    :param windows: list of window names, in display order
+    :return: (list of dicts with a name and data, manifest dict)
+    """
+    files = []
+    manifest = {
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "windows": windows,
+    }
+    for kind, shards in indexes.items():
+        entries = {}
+        for slug, shard in shards.items():
+            counts = {}
+            for window in windows:
+                rows = shard["windows"].get(window, [])
+                counts[window] = len(rows)
+                files.append({"name": shard_name(kind, slug, window), "data": rows})
+            entries[slug] = {"name": shard["name"], "repos": counts}
+        manifest[kind] = entries
+    return files, manifest
@@ -0,0 +1,144 @@
+import json
+import os
+
+# status of an hour which has been fully written (raw events and rollups)
+COMPLETE = "complete"
+
+# status of an hour where some chunks failed to write - only the missing chunks are written on the next run
+PARTIAL = "partial"
+
+# status of an hour which could not be collected or written at all
+FAILED = "failed"
+
+# PartitionKey used for every row in the ledger table
+LEDGER_PARTITION = "ledger"
+
+
+def ledger_key(source):
+    """
+    Get the ledger key for an hour
+    :param source: gharchive timestamp or path to a gharchive .json.gz file
+    :return: gharchive timestamp (e.g. 2022-09-10-5)
+    """
+    name = os.path.basename(source)
+    if name.endswith(".json.gz"):
+        name = name[: -len(".json.gz")]
+    return name
+
+
+class IngestLedger:
+    """
+    Interface for the record of which gharchive hours have been ingested
+    Entries are dicts with status, checksum, events, committed (list of committed chunk ids), started_at,
+    finished_at, collect_seconds and write_seconds
+    """
+
+    def get(self, hour):
+        """
+        Get the ledger entry for an hour
+        :param hour: gharchive timestamp
+        :return: entry dict or None if the hour has never been ingested
+        """
+        raise NotImplementedError
+
+    def put(self, hour, entry):
+        """
+        Store the ledger entry for an hour
+        :param hour: gharchive timestamp
+        :param entry: entry dict
+        """
+        raise NotImplementedError
+
+    def completed(self, hours):
+        """
+        Get the hours which have been completely ingested
+        :param hours: list of gharchive timestamps
+        :return: set of gharchive timestamps
+        """
+        completed = set()
+        for hour in hours:
+            entry = self.get(hour)
+            if entry is not None and entry["status"] == COMPLETE:
+                completed.add(hour)
+        return completed
+
+
+class FileLedger(IngestLedger):
+    """
+    Ledger stored in a local json file (used with the columnar backend)
+    Designed for a single writer process
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the FileLedger class
+        :param path: path to the ledger file
+        """
+        self.path = path
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, hour):
+        return self.entries.get(hour)
+
+    def put(self, hour, entry):
+        self.entries[hour] = entry
+
+        partial_path = f"{self.path}.part"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(partial_path, self.path)
+
+
+class TableLedger(IngestLedger):
+    """
+    Ledger stored in an Azure Storage table (one row per hour in a single partition)
+    """
+
+    def __init__(self, table):
+        """
+        Initialize the TableLedger class
+        :param table: table client for the ledger table
+        """
+        self.table = table
+
+    def get(self, hour):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            entity = self.table.get_entity(partition_key=LEDGER_PARTITION, row_key=hour)
+        except ResourceNotFoundError:
+            return None
+
+        entry = {
+            key: value
+            for key, value in entity.items()
+            if key not in ("PartitionKey", "RowKey")
+        }
+        # table properties can't hold lists so the committed chunk ids are stored comma separated
+        committed = entry.get("committed") or ""
+        entry["committed"] = committed.split(",") if committed else []
+        return entry
+
+    def put(self, hour, entry):
+        entity = dict(entry, PartitionKey=LEDGER_PARTITION, RowKey=hour)
+        entity["committed"] = ",".join(entry.get("committed", []))
+        self.table.upsert_entity(entity)
+
+    def completed(self, hours):
+        # a single range query is cheaper than a point read for every hour
+        wanted = set(hours)
+        if not wanted:
+            return set()
+
+        # hours aren't zero padded (2022-09-10-5 sorts after 2022-09-10-23) so the range is the first and last
+        # key in string order - it covers every wanted hour and only the few others in between are filtered here
+        rows = self.table.query_entities(
+            f"PartitionKey eq '{LEDGER_PARTITION}' and RowKey ge '{min(wanted)}' "
+            f"and RowKey le '{max(wanted)}' and status eq '{COMPLETE}'",
+            select=["RowKey"],
+        )
+        return {row["RowKey"] for row in rows if row["RowKey"] in wanted}
@@ -0,0 +1,352 @@
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+    10,
+    30,
+    60,
+    300,
+)
+
+# number of samples each histogram keeps for percentiles
+RESERVOIR_SIZE = 1024
+
+# prefix of every metric name in the Prometheus output
+PROMETHEUS_PREFIX = "ghtrending"
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=None):
+    """
+    Format labels for the Prometheus text format
+    :param key: tuple of (name, value) label pairs
+    :param extra: optional extra (name, value) pair
+    :return: label string (e.g. {stage="parse"}) or an empty string
+    """
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets (for Prometheus) and a bounded reservoir of samples (for percentiles)
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+        self.random = random.Random(0)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+        # reservoir sampling keeps a uniform sample of every observation in bounded memory
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            index = self.random.randrange(self.count)
+            if index < RESERVOIR_SIZE:
+                self.samples[index] = value
+
+    def percentile(self, pct):
+        """
+        Get a percentile from the sampled observations
+        :param pct: percentile to get (0-100)
+        :return: value (0 if nothing was observed)
+        """
+        if not self.samples:
+            return 0
+        ordered = sorted(self.samples)
+        return ordered[
+            min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        ]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Timer:
+    """
+    Result of a timed stage - elapsed is the wall time of the stage including any nested stages
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+
+class Metrics:
+    """
+    Counters and latency histograms for every stage of a run
+    Stage timings are exclusive: time spent in a nested stage only counts towards the nested stage,
+    so the stage totals add up to the wall time of the run
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear every metric (e.g. at the start of a new run)
+        """
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started_at = datetime.utcnow()
+            self.start = time.time()
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add to a counter
+        :param name: counter name
+        :param value: amount to add
+        :param labels: labels of the counter (e.g. stage="download")
+        """
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value in a histogram
+        :param name: histogram name
+        :param value: value to record (seconds for latencies)
+        :param labels: labels of the histogram
+        """
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def stack(self):
+        # per thread stack of the time spent in nested stages
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def enter(self):
+        self.stack().append(0.0)
+        return time.perf_counter()
+
+    def leave(self, start):
+        """
+        Pop a stage off the stack of the current thread
+        :param start: value returned by enter
+        :return: (elapsed, exclusive) seconds - exclusive leaves out the time spent in nested stages
+        """
+        elapsed = time.perf_counter() - start
+        stack = self.stack()
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        return elapsed, elapsed - nested
+
+    def exit(self, name, start):
+        elapsed, exclusive = self.leave(start)
+        self.observe("stage_seconds", exclusive, stage=name)
+        return elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as a stage
+        :param name: stage name (download, decompress, parse, filter, write, query, aggregate, enrich, upload)
+        :return: Timer with the elapsed time once the block is done
+        """
+        timer = Timer()
+        start = self.enter()
+        try:
+            yield timer
+        finally:
+            timer.elapsed = self.exit(name, start)
+
+    def timed_iter(self, name, iterable, size=None):
+        """
+        Time every step of an iterator as a stage
+        The steps are added up and recorded as a single call once the iterator is exhausted (or closed), so
+        wrapping an iterator of millions of rows doesn't cost a histogram update per row
+        :param name: stage name
+        :param iterable: iterable to wrap
+        :param size: optional function which returns the size of an item in bytes (counted as bytes for the stage)
+        :return: generator of the same items
+        """
+        iterator = iter(iterable)
+        seconds = 0.0
+        size_total = 0
+        try:
+            while True:
+                start = self.enter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += self.leave(start)[1]
+
+                if size is not None:
+                    size_total += size(item)
+                yield item
+        finally:
+            self.observe("stage_seconds", seconds, stage=name)
+            if size is not None:
+                self.increment("bytes", size_total, stage=name)
+
+    def stages(self):
+        """
+        Summarize the time spent in every stage
+        :return: dict of stage -> dict of calls, seconds and latency percentiles
+        """
+        stages = {}
+        for (name, labels), histogram in self.histograms.items():
+            if name != "stage_seconds":
+                continue
+            summary = histogram.summary()
+            stages[dict(labels)["stage"]] = {
+                "calls": summary["count"],
+                "seconds": round(summary["sum"], 3),
+                "p50": summary["p50"],
+                "p95": summary["p95"],
+                "max": summary["max"],
+            }
+        return stages
+
+    def report(self):
+        """
+        Build the run report
+        :return: json serializable dict
+        """
+        with self.lock:
+            counters = {
+                name + format_labels(labels): value
+                for (name, labels), value in sorted(self.counters.items())
+            }
+            histograms = {
+                name + format_labels(labels): histogram.summary()
+                for (name, labels), histogram in sorted(self.histograms.items())
+                if name != "stage_seconds"
+            }
+            stages = self.stages()
+
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds") + "Z",
+            "elapsed": round(time.time() - self.start, 3),
+            "stages": stages,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """
+        Render every metric in the Prometheus text exposition format
+        :param prefix: prefix for every metric name
+        :return: string
+        """
+        lines = []
+        with self.lock:
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(
+                            f"{prefix}_{name}_total{format_labels(labels)} {value}"
+                        )
+
+            names = sorted({name for name, _ in self.histograms})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                for (histogram_name, labels), histogram in sorted(
+                    self.histograms.items()
+                ):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(
+                        list(histogram.buckets) + ["+Inf"], histogram.counts
+                    ):
+                        cumulative += count
+                        lines.append(
+                            f"{prefix}_{name}_bucket{format_labels(labels, ('le', bound))} {cumulative}"
+                        )
+                    lines.append(
+                        f"{prefix}_{name}_sum{format_labels(labels)} {histogram.sum}"
+                    )
+                    lines.append(
+                        f"{prefix}_{name}_count{format_labels(labels)} {histogram.count}"
+                    )
+
+        lines.append(f"# TYPE {prefix}_run_seconds gauge")
+        lines.append(f"{prefix}_run_seconds {round(time.time() - self.start, 3)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, content):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        partial_path = f"{path}.part"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(partial_path, path)
+
+    def write_report(self, path, **extra):
+        """
+        Write the run report as json
+        :param path: path of the report
+        :param extra: extra top level fields (e.g. the name of the run)
+        :return: the report dict
+        """
+        report = dict(self.report(), **extra)
+        self.write(path, json.dumps(report, indent=2))
+        return report
+
+    def write_prometheus(self, path):
+        """
+        Write every metric in the Prometheus text format (e.g. for the node_exporter textfile collector)
+        :param path: path of the .prom file
+        """
+        self.write(path, self.prometheus())
+
+
+# metrics of the current process, shared by every module like a logger
+registry = Metrics()
@@ -0,0 +1,371 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+
+from gharchive import CHUNK_SIZE, FileDigest, hash_chunks, iter_lines, json_loads
+from metrics import registry
+
+# not available on windows - eviction just isn't serialized between processes there
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, extracts fall back to gzip
+    zstandard = None
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:  # orjson is optional, fall back to the standard library encoder
+
+    def json_dumps(data):
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+# once the mirror is over its size cap, evict down to this fraction of it so eviction doesn't run on every store
+EVICT_TO = 0.9
+
+# temporary files older than this are left over from a crashed process and are removed during eviction
+STALE_TEMP_SECONDS = 3600
+
+
+class HourMirror:
+    """
+    Local content-addressed mirror of gharchive hour files
+    Every file is stored under its sha256 (objects/ab/abcd....json.gz) and each hour has a small index file
+    (hours/2022-09-10-5.json) pointing at its objects, so the same hour is never downloaded twice and a file is
+    verified against its own name before it is reused
+    Files are written to a temporary file and renamed into place, and readers verify and stream from one open
+    file handle, so any number of processes can share a mirror while another one is evicting from it
+    Optionally each hour also gets an extract of just its star events (newline delimited json, zstd compressed
+    when zstandard is installed and gzip otherwise) - a few hundred KB instead of the full hour
+    """
+
+    def __init__(self, path, max_bytes=20 * 1024**3, extracts=False):
+        """
+        Initialize the HourMirror class
+        :param path: directory of the mirror
+        :param max_bytes: size cap of the mirror - the least recently used files are evicted above it
+        :param extracts: also store (and replay from) an extract of each hour's star events
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.extracts = extracts
+        self.codec = "zstd" if zstandard is not None else "gzip"
+
+    def object_path(self, sha256, suffix):
+        return os.path.join(self.path, "objects", sha256[:2], f"{sha256}{suffix}")
+
+    def index_path(self, hour):
+        return os.path.join(self.path, "hours", f"{hour}.json")
+
+    def entry(self, hour):
+        """
+        Get the index entry of an hour
+        :param hour: gharchive timestamp (e.g. 2022-09-10-5)
+        :return: dict with the sha256 and size of the hour file and its optional extract, or None
+        """
+        try:
+            with open(self.index_path(hour), "rb") as f:
+                return json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def write_index(self, hour, entry):
+        self.write_atomic(self.index_path(hour), json_dumps(entry))
+
+    def write_atomic(self, path, data):
+        """
+        Write a file so that readers only ever see the complete file
+        """
+        fd, temp_path = self.temp_file(path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            self.remove(temp_path)
+            raise
+
+    def temp_file(self, path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # unique per process, in the same directory so the rename is atomic
+        return tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def verified(self, path, sha256, size):
+        """
+        Open a mirrored file and check it against its hash
+        The handle stays valid even if the file is evicted by another process while it is being read
+        :return: open file positioned at the start, or None if the file is missing or corrupt
+        """
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        digest = hashlib.sha256()
+        read = 0
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            read += len(chunk)
+
+        if read != size or digest.hexdigest() != sha256:
+            f.close()
+            self.remove(path)
+            registry.increment("mirror", result="corrupt")
+            return None
+
+        f.seek(0)
+        # the modification time is the lru clock (access times are often disabled)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return f
+
+    def open(self, hour):
+        """
+        Open the mirrored file of an hour
+        :param hour: gharchive timestamp
+        :return: tuple of (open file, sha256) or None if the hour isn't mirrored
+        """
+        entry = self.entry(hour)
+        f = None
+        if entry is not None:
+            f = self.verified(
+                self.object_path(entry["sha256"], ".json.gz"),
+                entry["sha256"],
+                entry["size"],
+            )
+
+        registry.increment("mirror", result="miss" if f is None else "hit")
+        if f is None:
+            return None
+        return f, entry["sha256"]
+
+    def iter_chunks(self, hour):
+        """
+        Read the mirrored file of an hour in chunks
+        :param hour: gharchive timestamp
+        :return: generator of compressed bytes, or None if the hour isn't mirrored
+        """
+        opened = self.open(hour)
+        if opened is None:
+            return None
+
+        def chunks(f):
+            with f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        return chunks(opened[0])
+
+    def store(self, hour, chunks):
+        """
+        Pass the chunks of a downloading hour file through unchanged while also adding it to the mirror
+        Nothing is stored unless the stream completes
+        :param hour: gharchive timestamp
+        :param chunks: iterable of compressed bytes
+        :return: generator of the same chunks
+        """
+        digest = hashlib.sha256()
+        size = 0
+        # downloads go to objects/tmp/ until their hash (and so their name) is known
+        fd, temp_path = self.temp_file(
+            os.path.join(self.path, "objects", "tmp", "hour")
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+
+            sha256 = digest.hexdigest()
+            path = self.object_path(sha256, ".json.gz")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except BaseException:
+            self.remove(temp_path)
+            raise
+
+        entry = self.entry(hour) or {}
+        # an extract cut from an older version of the file no longer matches it
+        if entry.get("sha256") != sha256:
+            entry = {"hour": hour, "sha256": sha256, "size": size}
+            self.write_index(hour, entry)
+        registry.increment("mirror", result="stored")
+        self.evict()
+
+    def compress(self, data):
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+    def decompress(self, data, codec):
+        if codec == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def read_extract(self, hour):
+        """
+        Read the star events of an hour from its extract
+        :param hour: gharchive timestamp
+        :return: tuple of (list of star event dicts, sha256 of the hour file the extract was cut from), or None
+        """
+        if not self.extracts:
+            return None
+
+        entry = self.entry(hour)
+        extract = entry and entry.get("extract")
+        if not extract or (extract["codec"] == "zstd" and zstandard is None):
+            return None
+
+        path = self.object_path(extract["sha256"], f".ndjson.{extract['codec']}")
+        f = self.verified(path, extract["sha256"], extract["size"])
+        if f is None:
+            registry.increment("mirror", result="extract_miss")
+            return None
+
+        with f:
+            data = self.decompress(f.read(), extract["codec"])
+
+        registry.increment("mirror", result="extract_hit")
+        events = [json_loads(line) for line in iter_lines([data])]
+        return events, entry["sha256"]
+
+    def store_extract(self, hour, events, sha256):
+        """
+        Pass the parsed star events of an hour through unchanged while also storing them as its extract
+        Nothing is stored unless every event was read
+        :param hour: gharchive timestamp
+        :param events: iterable of star event dicts
+        :param sha256: function which returns the sha256 of the hour file (only known once it is fully read)
+        :return: generator of the same events
+        """
+        lines = []
+        for event in events:
+            lines.append(json_dumps(event))
+            yield event
+
+        data = self.compress(b"\n".join(lines))
+        extract_sha256 = hashlib.sha256(data).hexdigest()
+        self.write_atomic(
+            self.object_path(extract_sha256, f".ndjson.{self.codec}"), data
+        )
+
+        # the index only points at the extract if it was cut from the mirrored version of the file
+        entry = self.entry(hour)
+        if entry is None or entry["sha256"] != sha256():
+            return
+        entry["extract"] = {
+            "sha256": extract_sha256,
+            "size": len(data),
+            "codec": self.codec,
+            "events": len(lines),
+        }
+        self.write_index(hour, entry)
+
+    def evict(self):
+        """
+        Delete the least recently used files until the mirror is back under its size cap
+        Index files whose objects were evicted are treated as misses, so only objects are deleted here
+        """
+        objects = os.path.join(self.path, "objects")
+        os.makedirs(self.path, exist_ok=True)
+
+        with open(os.path.join(self.path, ".lock"), "wb") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # another process is already evicting
+                    return
+
+            now = time.time()
+            files = []
+            total = 0
+            for directory in os.scandir(objects):
+                if not directory.is_dir():
+                    continue
+                for item in os.scandir(directory.path):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    if item.name.endswith(".tmp"):
+                        if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                            self.remove(item.path)
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            target = self.max_bytes * EVICT_TO
+            evicted = 0
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                self.remove(path)
+                total -= size
+                evicted += 1
+
+        registry.increment("mirror", evicted, result="evicted")
+
+
+def mirrored_events(mirror, hour, fetch, parse, digest=None):
+    """
+    Collect the star events of an hour through a mirror
+    Replays the extract if there is one, otherwise reads the mirrored file and only downloads on a miss
+    :param mirror: HourMirror
+    :param hour: gharchive timestamp
+    :param fetch: function which returns the compressed chunks of the hour from gharchive (called on a miss)
+    :param parse: function which turns compressed chunks into star event dicts
+    :param digest: optional FileDigest which is fed the compressed file
+    :return: generator of star event dicts
+    """
+    if digest is None:
+        digest = FileDigest()
+
+    extract = mirror.read_extract(hour)
+    if extract is not None:
+        events, digest.known = extract
+        yield from events
+        return
+
+    chunks = mirror.iter_chunks(hour)
+    if chunks is None:
+        chunks = mirror.store(hour, fetch())
+
+    events = parse(hash_chunks(chunks, digest))
+    if mirror.extracts:
+        events = mirror.store_extract(hour, events, digest.hexdigest)
+    try:
+        yield from events
+    except (EOFError, zlib.error):
+        # the file is truncated or corrupt (the hash only proves it is the file that was downloaded),
+        # so the hour is downloaded again next time
+        mirror.remove(mirror.index_path(hour))
+        raise
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+# format of the hour bucket used as the PartitionKey for time-bucketed tables
+BUCKET_FORMAT = "%Y-%m-%dT%H"
+
+# PartitionKey used by every raw star event before time-bucketed partitions existed
+LEGACY_PARTITION = "stars"
+
+# max number of entities in a single table transaction
+MAX_BATCH_SIZE = 100
+
+
+def hour_bucket(created_at):
+    """
+    Get the hour bucket for a star event timestamp
+    :param created_at: event timestamp (gharchive string or datetime)
+    :return: hour bucket string (e.g. 2022-09-10T14)
+    """
+    if isinstance(created_at, datetime):
+        return created_at.strftime(BUCKET_FORMAT)
+
+    # gharchive timestamps look like 2022-09-10T14:05:33Z so the bucket is just a prefix
+    return created_at[:13]
+
+
+def gharchive_bucket(timestamp):
+    """
+    Get the hour bucket of a gharchive file
+    :param timestamp: gharchive timestamp (e.g. 2022-09-10-5)
+    :return: hour bucket string (e.g. 2022-09-10T05)
+    """
+    return datetime.strptime(timestamp, "%Y-%m-%d-%H").strftime(BUCKET_FORMAT)
+
+
+def window_buckets(hours, now=None):
+    """
+    Get the hour buckets which make up a window ending now (the current hour counts as the first bucket)
+    :param hours: size of the window in hours
+    :param now: end of the window (default: current UTC time)
+    :return: list of hour buckets, newest first
+    """
+    now = now or datetime.utcnow()
+    return [
+        (now - timedelta(hours=offset)).strftime(BUCKET_FORMAT)
+        for offset in range(hours)
+    ]
+
+
+def chunk_by_partition(entities):
+    """
+    Split entities into transaction sized chunks
+    Every entity in a transaction must share the same PartitionKey so chunks never span partitions
+    :param entities: iterable of table entities
+    :return: list of entity chunks
+    """
+    partitions = {}
+    for entity in entities:
+        partitions.setdefault(entity["PartitionKey"], []).append(entity)
+
+    chunks = []
+    for partition in partitions.values():
+        chunks.extend(
+            partition[x : x + MAX_BATCH_SIZE]
+            for x in range(0, len(partition), MAX_BATCH_SIZE)
+        )
+
+    return chunks
@@ -0,0 +1,254 @@
+import gzip
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from metrics import registry
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:  # orjson is optional, fall back to the standard library encoder
+    import json
+
+    def json_dumps(data):
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# metadata key holding the sha256 of the uncompressed json
+CONTENT_HASH_KEY = "content-sha256"
+
+# fields of an enriched repo which the frontend renders in the trending list (see src/components/stars)
+INDEX_FIELDS = (
+    "repo_name",
+    "repo_url",
+    "stars",
+    "description",
+    "language",
+    "stargazers_count",
+    "forks_count",
+    "open_issues_count",
+)
+
+# number of topics the frontend shows for each repo
+INDEX_TOPICS = 3
+
+
+def encode_json(data):
+    """
+    Encode data as minified json
+    :param data: json serializable data
+    :return: bytes
+    """
+    return json_dumps(data)
+
+
+def compress(body, encoding):
+    """
+    Compress a body for a Content-Encoding
+    Output is deterministic (gzip mtime is fixed) so an unchanged body always has the same ETag
+    :param body: bytes
+    :param encoding: gzip, br or identity
+    :return: compressed bytes
+    """
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return body
+
+
+def index_repo(repo):
+    """
+    Strip an enriched repo down to what the trending list renders
+    :param repo: enriched repo dict (see enrich.build_enriched_repo)
+    :return: dict
+    """
+    row = {field: repo.get(field) for field in INDEX_FIELDS}
+    row["topics"] = (repo.get("topics") or [])[:INDEX_TOPICS]
+    row["contributors"] = [
+        {"avatar_url": contributor["avatar_url"]}
+        for contributor in repo.get("contributors") or []
+        if "avatar_url" in contributor
+    ]
+    return row
+
+
+class S3Publisher:
+    """
+    Publishes json files to S3 for the frontend
+    Bodies are minified and pre-compressed, uploads run concurrently over a single client and a file is only
+    uploaded when its content differs from the object already in the bucket
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket,
+        prefix,
+        cache_control="7200",
+        encoding="gzip",
+        concurrency=8,
+        log=None,
+    ):
+        """
+        Initialize the S3Publisher class
+        :param client: boto3 s3 client (shared by every upload - boto3 clients are thread safe)
+        :param bucket: bucket name
+        :param prefix: key prefix (e.g. trends/stars)
+        :param cache_control: max-age in seconds for the Cache-Control header
+        :param encoding: Content-Encoding of the bodies (gzip, br or identity)
+        :param concurrency: number of uploads to run at the same time
+        :param log: optional logger
+        """
+        if encoding == "br" and brotli is None:
+            encoding = "gzip"
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.cache_control = cache_control
+        self.encoding = encoding
+        self.concurrency = concurrency
+        self.log = log
+        self.uploaded = []
+        self.unchanged = []
+
+    def key(self, name):
+        return f"{self.prefix}/{name}.json"
+
+    def etags(self):
+        """
+        Get the ETag of every object under the prefix with a single paginated listing instead of a HEAD per file
+        :return: dict of key -> ETag (without quotes) - empty if the bucket can't be listed (e.g. the credentials
+            only allow s3:PutObject), so every file is uploaded
+        """
+        etags = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(
+                Bucket=self.bucket, Prefix=f"{self.prefix}/"
+            ):
+                for item in page.get("Contents", []):
+                    etags[item["Key"]] = item["ETag"].strip('"')
+        except ClientError as e:
+            registry.increment("errors", stage="list")
+            if self.log:
+                self.log.warning(
+                    f"Failed to list {self.bucket}/{self.prefix} - uploading every file: {e}"
+                )
+            return {}
+        return etags
+
+    def head_hash(self, key):
+        """
+        Get the content hash stored in the metadata of an object
+        :param key: object key
+        :return: sha256 hex digest or None (also None when the object was stored with another Content-Encoding)
+        """
+        try:
+            resp = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError:
+            return None
+        if resp.get("ContentEncoding", "identity") != self.encoding:
+            return None
+        return resp.get("Metadata", {}).get(CONTENT_HASH_KEY)
+
+    def put(self, key, body, etag):
+        """
+        Upload one file unless the object in the bucket already has the same content
+        :param key: object key
+        :param body: minified json (bytes)
+        :param etag: ETag of the existing object (None if it doesn't exist)
+        :return: True if the file was uploaded, False if it was unchanged
+        """
+        content_hash = hashlib.sha256(body).hexdigest()
+        compressed = compress(body, self.encoding)
+
+        # the ETag of a single part upload is the md5 of the stored bytes - if that doesn't match (e.g. SSE-KMS
+        # buckets or a different compression level) fall back to the content hash in the object metadata
+        if etag is not None and (
+            etag == hashlib.md5(compressed).hexdigest()
+            or self.head_hash(key) == content_hash
+        ):
+            return False
+
+        kwargs = {}
+        if self.encoding != "identity":
+            kwargs["ContentEncoding"] = self.encoding
+
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=compressed,
+            ContentType="application/json",
+            CacheControl=f"public,max-age={self.cache_control}",
+            Metadata={CONTENT_HASH_KEY: content_hash},
+            **kwargs,
+        )
+        registry.increment("bytes", len(compressed), stage="upload")
+        return True
+
+    def files(self, results, split=False, extra=None):
+        """
+        Build the files to publish
+        :param results: list of dicts with a name and data (list of enriched repos)
+        :param split: write a slim index file for each result plus one detail file per repo
+        :param extra: optional dict of name -> data for files which are published as is (e.g. a manifest)
+        :return: dict of key -> minified json (bytes)
+        """
+        files = {
+            self.key(name): encode_json(data) for name, data in (extra or {}).items()
+        }
+        for result in results:
+            data = result["data"]
+            if split:
+                data = [index_repo(repo) for repo in result["data"]]
+                for repo in result["data"]:
+                    # repos are shared between windows - the detail file doesn't depend on the window
+                    detail = {k: v for k, v in repo.items() if k != "stars"}
+                    files[self.key(f"repos/{repo['repo_name']}")] = encode_json(detail)
+            files[self.key(result["name"])] = encode_json(data)
+        return files
+
+    def publish(self, results, split=False, extra=None):
+        """
+        Publish every result concurrently
+        :param results: list of dicts with a name and data (list of enriched repos)
+        :param split: also publish per repo detail files and slim down the main files (see files)
+        :param extra: optional dict of name -> data for files which are published as is (e.g. a manifest)
+        :return: True if every file was published (or already up to date)
+        """
+        files = self.files(results, split=split, extra=extra)
+        etags = self.etags()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                key: executor.submit(self.put, key, body, etags.get(key))
+                for key, body in files.items()
+            }
+
+        success = True
+        for key, future in futures.items():
+            try:
+                uploaded = future.result()
+            except Exception as e:
+                success = False
+                registry.increment("errors", stage="upload")
+                if self.log:
+                    self.log.error(f"Failed to upload {key}: {e}")
+                continue
+
+            if uploaded:
+                self.uploaded.append(key)
+            else:
+                self.unchanged.append(key)
+
+        registry.increment("files", len(self.uploaded), stage="upload")
+        registry.increment("files_unchanged", len(self.unchanged), stage="upload")
+        return success
@@ -0,0 +1,145 @@
+import base64
+from collections import Counter
+
+from partitions import chunk_by_partition, hour_bucket
+from sketches import HyperLogLog, hash64
+
+# actors who star more repos than this in one hour only count for a share of a star on each of them
+ACTOR_STAR_LIMIT = 50
+
+
+class RepoStats:
+    """
+    Star statistics of one repo in one hour
+    stars is the raw number of star events, weighted down-weights actors who star very many repos in the hour
+    and stargazers is a HyperLogLog sketch of the distinct actors
+    """
+
+    __slots__ = ("stars", "weighted", "stargazers")
+
+    def __init__(self):
+        self.stars = 0
+        self.weighted = 0.0
+        self.stargazers = HyperLogLog()
+
+
+def actor_weight(stars, limit=ACTOR_STAR_LIMIT):
+    """
+    Get the weight of each star from an actor
+    An actor's stars add up to at most `limit` per hour however many repos they star
+    :param stars: number of repos the actor starred in the hour
+    :param limit: number of stars per hour which count in full (0 to disable weighting)
+    :return: weight between 0 and 1
+    """
+    if not limit or stars <= limit:
+        return 1.0
+    return limit / stars
+
+
+def encode_sketch(sketch):
+    return base64.b64encode(sketch.to_bytes()).decode("ascii")
+
+
+def decode_sketch(value):
+    """
+    Decode a stargazers sketch stored in a rollup row
+    :param value: base64 string (or None for rows written before sketches existed)
+    :return: HyperLogLog or None
+    """
+    if not value:
+        return None
+    return HyperLogLog.from_bytes(base64.b64decode(value))
+
+
+def encode_row_key(repo_name):
+    """
+    Encode a repo name so it can be used as a RowKey ('/' is not allowed in keys)
+    :param repo_name: repo name (owner/name)
+    :return: encoded RowKey
+    """
+    return repo_name.replace("/", ":")
+
+
+def rollup_counts(events, bucket=None):
+    """
+    Count star events per hour bucket and repo
+    Buckets are overwritten when an hour is processed again, so the events of a gharchive file are all counted
+    in the file's own hour - a file also carries a few stragglers created in the hour before, which would
+    otherwise replace that whole hour with just themselves
+    :param events: iterable of star event dicts
+    :param bucket: hour bucket of the gharchive file the events came from (default: count each event in the
+        hour it was created in, for batches which hold every event of their hours)
+    :return: dict of hour bucket -> Counter of repo_name -> stars
+    """
+    counts = {}
+    for event in events:
+        event_bucket = bucket or hour_bucket(event["created_at"])
+        if event_bucket not in counts:
+            counts[event_bucket] = Counter()
+        counts[event_bucket][event["repo_name"]] += 1
+
+    return counts
+
+
+def rollup_stats(events, actor_star_limit=ACTOR_STAR_LIMIT, bucket=None):
+    """
+    Build the star statistics of every repo in every hour bucket
+    :param events: re-iterable of star event dicts (e.g. a StarEventBatch)
+    :param actor_star_limit: see actor_weight
+    :param bucket: hour bucket of the gharchive file the events came from (see rollup_counts)
+    :return: dict of hour bucket -> dict of repo_name -> RepoStats
+    """
+    buckets = [bucket or hour_bucket(event["created_at"]) for event in events]
+
+    # the weight of a star depends on how many repos the actor starred in the whole hour
+    actor_stars = Counter(
+        (event_bucket, event["actor_login"])
+        for event_bucket, event in zip(buckets, events)
+    )
+
+    hashes = {}
+    stats = {}
+    for event_bucket, event in zip(buckets, events):
+        actor = event["actor_login"]
+        repo = stats.setdefault(event_bucket, {}).get(event["repo_name"])
+        if repo is None:
+            repo = stats[event_bucket][event["repo_name"]] = RepoStats()
+
+        repo.stars += 1
+        repo.weighted += actor_weight(
+            actor_stars[event_bucket, actor], actor_star_limit
+        )
+        if actor:
+            if actor not in hashes:
+                hashes[actor] = hash64(actor)
+            repo.stargazers.add_hash(hashes[actor])
+
+    return stats
+
+
+def rollup_chunks(counts):
+    """
+    Convert rollup counts into transaction sized chunks of table entities
+    :param counts: dict of hour bucket -> mapping of repo_name -> stars (or RepoStats, see rollup_stats)
+    :return: list of entity chunks
+    """
+
+    def entity(bucket, repo_name, value):
+        row = {
+            "PartitionKey": bucket,
+            "RowKey": encode_row_key(repo_name),
+            "repo_name": repo_name,
+        }
+        if isinstance(value, RepoStats):
+            row["stars"] = value.stars
+            row["weighted"] = round(value.weighted, 4)
+            row["stargazers"] = encode_sketch(value.stargazers)
+        else:
+            row["stars"] = value
+        return row
+
+    return chunk_by_partition(
+        entity(bucket, repo_name, value)
+        for bucket, repos in counts.items()
+        for repo_name, value in repos.items()
+    )
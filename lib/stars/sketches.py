@@ -0,0 +1,244 @@
+import hashlib
+import heapq
+import math
+import struct
+from operator import itemgetter
+
+# HyperLogLog index bits - 4096 registers, about 1.6% standard error and at most 4KB per sketch
+HLL_PRECISION = 12
+
+
+def top_k(counts, limit):
+    """
+    Select the top N items from a mapping of counts without sorting every item
+    Ties keep their insertion order, just like a stable sort would
+    :param counts: mapping of key -> count
+    :param limit: number of items to return
+    :return: list of (key, count) tuples, highest count first
+    """
+    return heapq.nlargest(limit, counts.items(), key=itemgetter(1))
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters sketch
+    Tracks at most `capacity` keys so memory stays bounded no matter how many distinct keys are seen
+    Any key with a true count above total / capacity is guaranteed to be tracked
+    """
+
+    def __init__(self, capacity):
+        """
+        Initialize the SpaceSaving class
+        :param capacity: max number of keys to track
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # lazy min-heap of (count, key) - stale entries are skipped when popped
+        self.heap = []
+
+    def add(self, key, count=1):
+        """
+        Add an observation of a key to the sketch
+        :param key: key to count
+        :param count: number of observations to add
+        """
+        self.total += count
+
+        if key in self.counts:
+            self.counts[key] += count
+            heapq.heappush(self.heap, (self.counts[key], key))
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+            heapq.heappush(self.heap, (count, key))
+            return
+
+        # evict the key with the smallest count and let the new key inherit it as its error
+        while True:
+            minimum, evicted = heapq.heappop(self.heap)
+            if self.counts.get(evicted) == minimum:
+                break
+
+        del self.counts[evicted]
+        del self.errors[evicted]
+        self.counts[key] = minimum + count
+        self.errors[key] = minimum
+        heapq.heappush(self.heap, (self.counts[key], key))
+
+        # keep the lazy heap from growing without bound
+        if len(self.heap) > self.capacity * 4:
+            self.heap = [(c, k) for k, c in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def update(self, keys):
+        """
+        Add an observation for every key in an iterable
+        :param keys: iterable of keys
+        """
+        for key in keys:
+            self.add(key)
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __setitem__(self, key, value):
+        # supports counter[key] += n so the sketch can stand in for a Counter
+        self.add(key, value - self.counts.get(key, 0))
+
+    def items(self):
+        return self.counts.items()
+
+    def values(self):
+        return self.counts.values()
+
+    def top(self, limit):
+        """
+        Get the top N keys by estimated count
+        :param limit: number of keys to return
+        :return: list of (key, estimated count) tuples
+        """
+        return top_k(self.counts, limit)
+
+
+def hash64(value):
+    """
+    Stable 64-bit hash of a string (the builtin hash is salted per process so it can't be stored)
+    :param value: string to hash
+    :return: int
+    """
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter
+    Small sets are kept sparse (register -> rank) and switch to a dense array of 2^precision registers
+    once that is smaller, so a repo with a handful of stargazers only costs a few bytes
+    Sketches with the same precision can be merged, e.g. hourly sketches into a window
+    """
+
+    SPARSE = b"S"
+    DENSE = b"D"
+
+    def __init__(self, precision=HLL_PRECISION):
+        """
+        Initialize the HyperLogLog class
+        :param precision: number of index bits (standard error is about 1.04 / sqrt(2^precision))
+        """
+        self.precision = precision
+        self.size = 1 << precision
+        self.sparse = {}
+        self.registers = None
+
+    def add_hash(self, value):
+        """
+        Add a 64-bit hash to the sketch
+        :param value: hash (see hash64)
+        """
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+
+        if self.registers is not None:
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+            return
+
+        if rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) * 3 > self.size:
+                self.densify()
+
+    def add(self, value):
+        """
+        Add a string to the sketch
+        :param value: string (e.g. an actor login)
+        """
+        self.add_hash(hash64(value))
+
+    def densify(self):
+        registers = bytearray(self.size)
+        for index, rank in self.sparse.items():
+            registers[index] = rank
+        self.registers = registers
+        self.sparse = {}
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one (the union of both sets)
+        :param other: HyperLogLog with the same precision
+        """
+        if other.precision != self.precision:
+            raise ValueError("can't merge sketches with a different precision")
+
+        if other.registers is not None:
+            if self.registers is None:
+                self.densify()
+            self.registers = bytearray(map(max, self.registers, other.registers))
+            return
+
+        for index, rank in other.sparse.items():
+            if self.registers is not None:
+                if rank > self.registers[index]:
+                    self.registers[index] = rank
+            elif rank > self.sparse.get(index, 0):
+                self.sparse[index] = rank
+
+        if self.registers is None and len(self.sparse) * 3 > self.size:
+            self.densify()
+
+    def count(self):
+        """
+        Estimate the number of distinct values added to the sketch
+        :return: int
+        """
+        if self.registers is None:
+            zeros = self.size - len(self.sparse)
+            total = zeros + sum(2.0**-rank for rank in self.sparse.values())
+        else:
+            zeros = self.registers.count(0)
+            total = sum(2.0**-rank for rank in self.registers)
+
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / total
+
+        # linear counting is far more accurate while many registers are still empty
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """
+        Serialize the sketch (sparse sketches are 3 bytes per register)
+        :return: bytes
+        """
+        if self.registers is not None:
+            return self.DENSE + bytes(self.registers)
+        return self.SPARSE + b"".join(
+            struct.pack(">HB", index, rank)
+            for index, rank in sorted(self.sparse.items())
+        )
+
+    @classmethod
+    def from_bytes(cls, data, precision=HLL_PRECISION):
+        """
+        Load a serialized sketch
+        :param data: bytes from to_bytes
+        :param precision: precision the sketch was built with
+        :return: HyperLogLog
+        """
+        sketch = cls(precision)
+        if data[:1] == cls.DENSE:
+            sketch.registers = bytearray(data[1:])
+        else:
+            sketch.sparse = {
+                index: rank for index, rank in struct.iter_unpack(">HB", data[1:])
+            }
+        return sketch
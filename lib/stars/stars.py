@@ -1,14 +1,32 @@
-import gzip
-import json
 import logging
 import os
 import sys
-import time
+import threading
+from bisect import bisect_right
+from collections import Counter
 from datetime import datetime, timedelta
 
-import requests
-from azure.core.exceptions import ResourceExistsError
-from azure.data.tables import TableServiceClient
+from events import StarEventBatch
+from gharchive import (
+    CHUNK_SIZE,
+    FileDigest,
+    decompress_stream,
+    filter_star_lines,
+    gharchive_hours,
+    hash_chunks,
+    iter_file_chunks,
+    iter_lines,
+    parse_star_lines,
+    tee_to_file,
+)
+from dedup import DedupIndex, collapse_repeat_stars
+from ledger import COMPLETE, FAILED, PARTIAL
+from metrics import registry
+from mirror import HourMirror, mirrored_events
+from partitions import gharchive_bucket, window_buckets
+from rollups import rollup_counts
+from sketches import SpaceSaving, top_k
+from trends import TrendState
 
 
 class StarEvents:
@@ -21,18 +39,125 @@ class StarEvents:
         Initialize the StarEvents class
         """
         self.gh_token = os.environ.get("GH_TOKEN", None)
+        self.gh_cache_path = os.environ.get("GH_CACHE_PATH", "tmp/github_cache.sqlite3")
+        self.gh_cache_ttl = int(os.environ.get("GH_CACHE_TTL", 3600))
+        self.gh_cache_max_age = int(os.environ.get("GH_CACHE_MAX_AGE", 7 * 24 * 3600))
+        self.enrich_concurrency = int(os.environ.get("ENRICH_CONCURRENCY", 16))
         self.table_name = os.environ.get("TABLE_NAME", "stars")
+        self.rollup_table_name = os.environ.get("ROLLUP_TABLE_NAME", "starsrollup")
+        # read timeslices from the hourly rollup table instead of scanning raw star events
+        self.use_rollups = os.environ.get("USE_ROLLUPS", "true").lower() == "true"
+        self.read_concurrency = int(os.environ.get("READ_CONCURRENCY", 16))
+        # "hour" stores raw star events in per-hour partitions, "single" keeps the legacy "stars" partition
+        self.partition_scheme = os.environ.get("PARTITION_SCHEME", "hour")
+        # raw scans also read the events still in the legacy partition - turn off once
+        # script/migrate_partitions.py --delete has emptied it
+        self.scan_legacy_partition = (
+            os.environ.get("SCAN_LEGACY_PARTITION", "true").lower() == "true"
+        )
+        # when set, raw timeslice queries count with a Space-Saving sketch of this many repos
+        self.sketch_capacity = int(os.environ.get("SKETCH_CAPACITY", 0))
         self.storage_account_name = os.environ.get("STORAGE_ACCOUNT_NAME", "ghtrending")
         self.azure_access_key = os.environ.get("AZURE_ACCESS_KEY", None)
+        # optional full connection string (e.g. for a local Azurite emulator)
+        self.azure_connection_string = os.environ.get("AZURE_CONNECTION_STRING", None)
+        self.write_concurrency = int(os.environ.get("WRITE_CONCURRENCY", 8))
+        self.write_retries = int(os.environ.get("WRITE_RETRIES", 5))
+        # "azure" (Azure Table Storage) or "columnar" (local columnar files in COLUMNAR_PATH)
+        self.storage_backend = os.environ.get("STORAGE_BACKEND", "azure")
+        self.columnar_path = os.environ.get("COLUMNAR_PATH", "tmp/columnar")
+        # sliding window star counts which are updated after every ingested hour
+        self.use_trend_state = (
+            os.environ.get("USE_TREND_STATE", "true").lower() == "true"
+        )
+        self.trend_state_path = os.environ.get(
+            "TREND_STATE_PATH", "tmp/trend_state.json.gz"
+        )
+        self.trend_windows = [
+            int(hours)
+            for hours in os.environ.get("TREND_WINDOWS", "24,168,720").split(",")
+        ]
+        # half-lives (in hours) of the decayed counters used for velocity scoring - short, fast and baseline
+        self.velocity_half_lives = [
+            int(hours)
+            for hours in os.environ.get("VELOCITY_HALF_LIVES", "6,24,168").split(",")
+            if hours
+        ]
+        # record every ingested hour so completed hours are skipped and partial ones are resumed
+        self.use_ledger = os.environ.get("USE_LEDGER", "true").lower() == "true"
+        self.ledger_table_name = os.environ.get("LEDGER_TABLE_NAME", "ingestledger")
+        # number of hours (ending at the newest available hour) checked for gaps on every run
+        self.ledger_lookback = int(os.environ.get("LEDGER_LOOKBACK", 6))
+        # json run report and optional Prometheus textfile written at the end of every cron run
+        self.metrics_path = os.environ.get("METRICS_PATH", "tmp/metrics/run.json")
+        self.metrics_prometheus_path = os.environ.get("METRICS_PROMETHEUS_PATH", None)
+        # warn when a run takes longer than this many seconds (0 to disable)
+        self.run_budget = int(os.environ.get("RUN_BUDGET_SECONDS", 0))
+        # rank repos by raw "stars", distinct "stargazers" or actor "weighted" stars
+        self.rank_by = os.environ.get("RANK_BY", "stars")
+        # actors who star more repos than this in an hour are down-weighted (0 to disable)
+        self.actor_star_limit = int(os.environ.get("ACTOR_STAR_LIMIT", 50))
+        # number of repos per window (by raw stars) which are re-scored when ranking by stargazers or weighted
+        self.rank_candidates = int(os.environ.get("RANK_CANDIDATES", 200))
+        # index of the star event ids already stored, so reruns and replays skip them before any write
+        self.use_dedup = os.environ.get("USE_DEDUP", "true").lower() == "true"
+        # (default: kept next to the columnar segments, or per storage account and table for azure)
+        self.dedup_path = os.environ.get("DEDUP_PATH", None)
+        self.dedup_retention_hours = int(os.environ.get("DEDUP_RETENTION_HOURS", 72))
+        # only count the first star of an (actor, repo) pair within an hour
+        self.collapse_repeat_stars = (
+            os.environ.get("COLLAPSE_REPEAT_STARS", "true").lower() == "true"
+        )
+        # local content-addressed mirror of gharchive hour files (disabled unless a path is set)
+        self.mirror_path = os.environ.get("MIRROR_PATH", None)
+        self.mirror_max_mb = int(os.environ.get("MIRROR_MAX_MB", 20 * 1024))
+        # also keep an extract of each hour's star events in the mirror and replay from it
+        self.mirror_extracts = (
+            os.environ.get("MIRROR_EXTRACTS", "false").lower() == "true"
+        )
         self.prod = os.environ.get("ENV", False) == "production"
         self.log = self.log_config()
-        self.table = None
+        self.metrics = registry
+        self.backend = None
         self.db_config()
         self.base_url = "https://data.gharchive.org"
+        self.dedup = None
+        if self.use_dedup:
+            # the index is only valid for the storage it was built against
+            if self.dedup_path is None:
+                if self.storage_backend == "columnar":
+                    self.dedup_path = os.path.join(self.columnar_path, "dedup")
+                else:
+                    self.dedup_path = os.path.join(
+                        "tmp/dedup", f"{self.storage_account_name}-{self.table_name}"
+                    )
+            self.dedup = DedupIndex(
+                self.dedup_path, retention_hours=self.dedup_retention_hours
+            )
+            self.dedup.prune()
+        self.mirror = None
+        if self.mirror_path:
+            self.mirror = HourMirror(
+                self.mirror_path,
+                max_bytes=self.mirror_max_mb * 1024 * 1024,
+                extracts=self.mirror_extracts,
+            )
+        # optional requests.Session reused for every gharchive request (kept warm by the ingest daemon)
+        self.session = None
         self.gh_base_url = "https://api.github.com"
         self.hours = 2
-        self.events = []
+        self.events = StarEventBatch()
+        # sha256 of the compressed gharchive file the current events were collected from
+        self.checksum = None
+        # hour bucket of the gharchive file the current events were collected from (None if it isn't known)
+        self.source_bucket = None
+        # (events, selected events, skipped count) of the last select_events call
+        self.selected = None
         self.most_stared = []
+        self.api_cache = None
+        self.enricher = None
+        # the enrichment client is created on first use, possibly by several api queries at once
+        self.enricher_lock = threading.Lock()
         self.schema = {
             "id": 0,
             "actor_id": 1,
@@ -72,18 +197,39 @@ class StarEvents:
     def db_config(self):
         """
         Database connections and configuration
-        Currently using Azure Table Storage
+        Uses Azure Table Storage by default, or a local columnar store when STORAGE_BACKEND=columnar
         """
-        connection_string = f"DefaultEndpointsProtocol=https;AccountName={self.storage_account_name};AccountKey={self.azure_access_key};EndpointSuffix=core.windows.net"
-        table_service_client = TableServiceClient.from_connection_string(
-            conn_str=connection_string
-        )
-        self.log.debug(f"Created table service client for {self.storage_account_name}")
+        # backends are imported here so the azure SDK (azure_backend) is only loaded when it is used
+        if self.storage_backend == "columnar":
+            from backends import ColumnarBackend
 
-        # set the table class variable to the Azure table client
-        self.table = table_service_client.get_table_client(table_name=self.table_name)
+            self.backend = ColumnarBackend(
+                self.log, self.columnar_path, actor_star_limit=self.actor_star_limit
+            )
+            return
 
-        self.log.info(f"Created client to connect to storage table: {self.table_name}")
+        if self.azure_connection_string:
+            connection_string = self.azure_connection_string
+        else:
+            connection_string = f"DefaultEndpointsProtocol=https;AccountName={self.storage_account_name};AccountKey={self.azure_access_key};EndpointSuffix=core.windows.net"
+
+        from azure_backend import AzureTableBackend
+
+        self.log.debug(f"Creating table service client for {self.storage_account_name}")
+        self.backend = AzureTableBackend(
+            self.log,
+            connection_string,
+            self.table_name,
+            self.rollup_table_name,
+            partition_scheme=self.partition_scheme,
+            scan_legacy=self.scan_legacy_partition,
+            create_tables=bool(self.azure_connection_string),
+            write_concurrency=self.write_concurrency,
+            write_retries=self.write_retries,
+            read_concurrency=self.read_concurrency,
+            ledger_table_name=self.ledger_table_name,
+            actor_star_limit=self.actor_star_limit,
+        )
 
     def write(self, entities):
         """
@@ -91,20 +237,7 @@ class StarEvents:
         :param entities: entities to write to the Azure Table Storage (list)
         :return: created entity object if successful, None if the entity already exists, False if there is an error
         """
-        # loop through all the entitites and add them to a list of 'upsert' operations
-        operations = []
-        for entity in entities:
-            operations.append(("upsert", entity))
-
-        try:
-            # execute the batch of operations
-            return self.table.submit_transaction(operations)
-        except ResourceExistsError:
-            self.log.warning(f"Skipping RowKey: {entity['RowKey']} - already exists")
-            return None
-        except Exception as e:
-            self.log.error(f"Error writing entity to Azure Table Storage: {e}")
-            return False
+        return self.backend.write(entities)
 
     def read(self, query, listify=True):
         """
@@ -113,27 +246,15 @@ class StarEvents:
         :param listify: return a list of entities (True) or a generator (False)
         :return: results from the query (list or generator)
         """
-        start = time.time()
-        try:
-            results = self.table.query_entities(query)
-
-            if listify:
-                # convert the generator object to a list
-                results = list(results)
-
-            end = time.time()
-            self.log.info(f"Read query executed in {round(end - start, 2)} seconds")
-            return results
-        except Exception as e:
-            end = time.time()
-            self.log.error(f"Read query failed in {round(end - start, 2)} seconds")
-            self.log.error(f"Error executing read query: {e}")
+        return self.backend.read(query, listify=listify)
 
     def clear_events(self):
         """
-        Clears all events from the events list
+        Clears all events from the events batch
         """
-        self.events = []
+        self.events = StarEventBatch()
+        self.source_bucket = None
+        self.selected = None
 
     def gharchive_timestamp_fmt(self, timestamp):
         """
@@ -164,75 +285,201 @@ class StarEvents:
 
         return gharchive_timestamp
 
+    def gharchive_url(self, timestamp):
+        """
+        Helper function to build the gharchive url for a given time period
+        :param timestamp: time period to collect events for (String or None)
+        :return: tuple of the gharchive timestamp and the url to download
+        """
+        gharchive_timestamp = self.gharchive_timestamp_fmt(timestamp)
+        return gharchive_timestamp, f"{self.base_url}/{gharchive_timestamp}.json.gz"
+
+    def http(self):
+        """
+        Get the http client for gharchive requests
+        requests is imported lazily since it is one of the slowest imports and not every entrypoint needs it
+        :return: the shared requests.Session if one is set, otherwise the requests module
+        """
+        if self.session is not None:
+            return self.session
+
+        import requests
+
+        return requests
+
     def gharchive_download(self, timestamp):
         """
         Helper function to download the gharchive file
         :param timestamp: time period to collect events for in gharchive format
         :return: raw data from the http request from the gharchive url
         """
-        gharchive_timestamp = self.gharchive_timestamp_fmt(timestamp)
-
-        url = f"https://data.gharchive.org/{gharchive_timestamp}.json.gz"
+        gharchive_timestamp, url = self.gharchive_url(timestamp)
 
         self.log.info(f"Downloading events from {url}")
 
-        resp = requests.get(url)
+        resp = self.http().get(url, stream=True)
 
         if resp.status_code != 200:
             self.log.critical(f"Error downloading {url} - HTTP: {resp.status_code}")
             sys.exit(1)
 
-        # create the tmp/ directory if it doesn't exist
-        if not os.path.exists("tmp"):
-            os.makedirs("tmp")
-
-        # save the raw data from the http request to a file
+        # save the raw data from the http request to a file without buffering it in memory
         path = f"tmp/{gharchive_timestamp}.json.gz"
-        with open(f"tmp/{gharchive_timestamp}.json.gz", "wb") as f:
-            f.write(resp.content)
+        chunks = self.metrics.timed_iter(
+            "download", resp.iter_content(chunk_size=CHUNK_SIZE), size=len
+        )
+        for _ in tee_to_file(chunks, path):
+            pass
 
         return path
 
-    def get_star_events(self, timestamp=None, direct_path=None, keep_file=False):
+    def gharchive_chunks(self, url):
         """
-        Get all GitHub star events for the given time period
+        Stream the compressed body of a gharchive file
+        :param url: gharchive url
+        :return: generator of compressed bytes
+        """
+        self.log.info(f"Streaming events from {url}")
+
+        resp = self.http().get(url, stream=True)
+
+        if resp.status_code != 200:
+            self.log.critical(f"Error downloading {url} - HTTP: {resp.status_code}")
+            sys.exit(1)
+
+        try:
+            yield from resp.iter_content(chunk_size=CHUNK_SIZE)
+        finally:
+            resp.close()
+
+    def gharchive_stream(self, timestamp, keep_file=False, digest=None):
+        """
+        Stream the decompressed lines of a gharchive file as the http body arrives
         :param timestamp: time period to collect events for in gharchive format
-        :param direct_path: path to the gharchive file
-        :param keep_file: keep the downloaded file
+        :param keep_file: also write the compressed file to tmp/ as it streams
+        :param digest: optional FileDigest which is fed the compressed body
+        :return: generator of raw json lines (bytes)
         """
-        events = []
+        gharchive_timestamp, url = self.gharchive_url(timestamp)
+
+        chunks = self.metrics.timed_iter(
+            "download", self.gharchive_chunks(url), size=len
+        )
+        if digest is not None:
+            chunks = hash_chunks(chunks, digest)
+
+        # optionally tee the compressed body to disk while it is being parsed
+        if keep_file:
+            chunks = tee_to_file(chunks, f"tmp/{gharchive_timestamp}.json.gz")
+
+        return self.decompress_lines(chunks)
+
+    def decompress_lines(self, chunks):
+        """
+        Decompress gzip chunks and split them into lines
+        :param chunks: iterable of gzip compressed bytes
+        :return: generator of raw json lines (bytes)
+        """
+        blocks = self.metrics.timed_iter(
+            "decompress", decompress_stream(chunks), size=len
+        )
+        return iter_lines(blocks)
+
+    def iter_star_events(
+        self, timestamp=None, direct_path=None, keep_file=False, digest=None
+    ):
+        """
+        Lazily yield all GitHub star events for the given time period
+        Events are parsed while the file is still downloading so memory use stays flat
+        :param timestamp: time period to collect events for in gharchive format
+        :param direct_path: path to a local gharchive file (skips the download)
+        :param keep_file: keep a copy of the downloaded file in tmp/
+        :param digest: optional FileDigest which is fed the compressed file
+        :return: generator of star event dicts
+        """
+        if self.mirror is not None and not direct_path and not keep_file:
+            # reads the hour from the local mirror, only downloading it (and adding it to the mirror) on a miss
+            gharchive_timestamp, url = self.gharchive_url(timestamp)
+            yield from mirrored_events(
+                self.mirror,
+                gharchive_timestamp,
+                lambda: self.gharchive_chunks(url),
+                self.parse_chunks,
+                digest,
+            )
+            return
 
         if direct_path:
-            path = direct_path
+            chunks = self.metrics.timed_iter(
+                "download", iter_file_chunks(direct_path), size=len
+            )
+            if digest is not None:
+                chunks = hash_chunks(chunks, digest)
+            lines = self.decompress_lines(chunks)
         else:
-            path = self.gharchive_download(timestamp)
+            lines = self.gharchive_stream(timestamp, keep_file=keep_file, digest=digest)
 
-        with gzip.open(path, "rb") as f:
-            for line in f:
+        yield from self.parse_lines(lines)
 
-                event = json.loads(line.decode("utf-8"))
+    def parse_lines(self, lines):
+        """
+        Parse raw gharchive lines into star events
+        :param lines: iterable of raw json lines (bytes)
+        :return: generator of star event dicts
+        """
+        # splitting lines and the WatchEvent prefilter are timed together as "filter", json decoding as "parse"
+        candidates = self.metrics.timed_iter("filter", filter_star_lines(lines))
+        return self.metrics.timed_iter("parse", parse_star_lines(candidates))
 
-                if event["type"] != "WatchEvent" and event["public"] == True:
-                    continue
+    def parse_chunks(self, chunks):
+        """
+        Decompress and parse the compressed chunks of a gharchive file into star events
+        :param chunks: iterable of gzip compressed bytes (network or mirror reads are timed as "download")
+        :return: generator of star event dicts
+        """
+        chunks = self.metrics.timed_iter("download", chunks, size=len)
+        return self.parse_lines(self.decompress_lines(chunks))
 
-                events.append(
-                    {
-                        "id": event["id"],
-                        "actor_id": event["actor"]["id"],
-                        "actor_login": event["actor"]["login"],
-                        "repo_id": event["repo"]["id"],
-                        "repo_name": event["repo"]["name"],
-                        "created_at": event["created_at"],
-                    }
+    def get_star_events(
+        self, timestamp=None, direct_path=None, keep_file=False, stream=True
+    ):
+        """
+        Get all GitHub star events for the given time period
+        :param timestamp: time period to collect events for in gharchive format
+        :param direct_path: path to the gharchive file
+        :param keep_file: keep the downloaded file
+        :param stream: parse the http body as it downloads instead of saving it to disk first
+        """
+        digest = FileDigest()
+
+        if stream and not direct_path:
+            events = StarEventBatch.from_events(
+                self.iter_star_events(
+                    timestamp=timestamp, keep_file=keep_file, digest=digest
                 )
+            )
+        else:
+            if direct_path:
+                path = direct_path
+            else:
+                path = self.gharchive_download(timestamp)
 
-        self.log.info(f"Collected {len(events)} GitHub star events")
+            events = StarEventBatch.from_events(
+                self.iter_star_events(direct_path=path, digest=digest)
+            )
 
-        # remove the downloaded file
-        if keep_file == False:
-            os.remove(path)
+            # remove the downloaded file
+            if keep_file == False:
+                os.remove(path)
+
+        self.log.info(f"Collected {len(events)} GitHub star events")
+        self.metrics.increment("events", len(events), stage="parse")
 
         self.events = events
+        self.checksum = digest.hexdigest()
+        self.source_bucket = (
+            gharchive_bucket(timestamp) if timestamp and not direct_path else None
+        )
 
     def sanitize(self, field_name):
         """
@@ -250,143 +497,453 @@ class StarEvents:
 
         return field_name.encode("utf-8").decode("utf-8")
 
-    def write_star_events(self):
+    def select_events(self):
         """
-        Helper function to use the values in self.events to write to the database
-        Loops through all events and commits them to the database
-        :return: Boolean - True if successful, False if there is an error
+        Select the events in self.events which are stored - valid events, with repeated stars collapsed
+        The raw rows, the rollups and the trend state are all built from this batch so they always agree
+        :return: tuple of (StarEventBatch, number of invalid events which were skipped)
         """
-        success = True
+        # the same batch is written and then added to the trend state, so it is only selected once
+        if self.selected is not None and self.selected[0] is self.events:
+            return self.selected[1], self.selected[2]
+
         skipped_events = 0
 
-        fmt_events = []
-        for event in self.events:
+        # only the event id and repo name are needed to validate an event - the events are decoded
+        # into dicts lazily by the backend at write time
+        valid = []
+        for index, (event_id, repo_name) in enumerate(self.events.keys()):
 
-            # sanitize the repo_name
-            repo_name = self.sanitize(event["repo_name"])
-            if not repo_name:
+            # sanitize the repo_name and the id (star event_id)
+            if not self.sanitize(repo_name) or not self.sanitize(event_id):
                 skipped_events += 1
                 continue
 
-            # sanitize the id (star event_id)
-            event_id = self.sanitize(event["id"])
-            if not event_id:
-                skipped_events += 1
-                continue
+            valid.append(index)
 
-            # append the formatted event to the list
-            fmt_events.append(
-                {
-                    "PartitionKey": "stars",
-                    "RowKey": event_id,
-                    "repo_name": repo_name,
-                    "created_at": datetime.strptime(
-                        event["created_at"], "%Y-%m-%dT%H:%M:%SZ"
-                    ),
-                    "actor_login": event["actor_login"],
-                    # event["actor_id"],
-                    # event["repo_id"],
-                }
-            )
+        if self.collapse_repeat_stars:
+            collapsed = collapse_repeat_stars(self.events, valid)
+            if len(collapsed) < len(valid):
+                self.log.info(
+                    f"Collapsed {len(valid) - len(collapsed)} repeated stars of the same repo by the same actor"
+                )
+                self.metrics.increment(
+                    "events_deduplicated", len(valid) - len(collapsed), reason="repeat"
+                )
+            valid = collapsed
+
+        if len(valid) < len(self.events):
+            selected = self.events.select(valid)
+        else:
+            selected = self.events
+
+        self.selected = (self.events, selected, skipped_events)
+        return selected, skipped_events
+
+    def write_star_events(self, committed=None):
+        """
+        Helper function to use the values in self.events to write to the database
+        Loops through all events and commits them to the database
+        :param committed: optional set of chunk ids which are already in the database (updated in place)
+        :return: Boolean - True if successful, False if there is an error
+        """
+        fmt_events, skipped_events = self.select_events()
 
         # if there are no new events, exit
         if len(fmt_events) == 0:
             self.log.info("No new events to write to the database")
             return
 
-        # split the fmt_events list into chunks of 100 (max batch size)
-        chunks = [fmt_events[x : x + 100] for x in range(0, len(fmt_events), 100)]
-        total_chunks = len(chunks)
+        # drop the events which are already stored (overlapping runs and replayed hours)
+        new_events = fmt_events
+        if self.dedup is not None:
+            new = self.dedup.new_events(fmt_events)
+            if len(new) < len(fmt_events):
+                self.log.info(
+                    f"Skipping {len(fmt_events) - len(new)} events which are already stored"
+                )
+                self.metrics.increment(
+                    "events_deduplicated", len(fmt_events) - len(new), reason="stored"
+                )
+                new_events = fmt_events.select(new)
 
-        self.log.info(
-            f"Attempting to write {total_chunks} chunks containing {len(fmt_events)} events to the database"
-        )
+            if len(new_events) == 0:
+                self.log.info("Every event is already stored - nothing to write")
+                return
 
-        counter = 1
-        for chunk in chunks:
-            start = time.time()
-            result = self.write(chunk)
-            end = time.time()
+        with self.metrics.stage("write") as timer:
+            success, written = self.backend.write_events(
+                new_events, committed=committed
+            )
 
-            if result:
-                self.log.info(
-                    f"Chunk {counter}/{total_chunks} written successfully in {round(end - start, 2)} seconds"
-                )
-            elif result is False:
-                # if the chunk failed to write, do additional logging/processing
-                self.log.warning(
-                    f"Chunk {counter}/{total_chunks} failed to write - retrying..."
+            # rollup rows replace the counts of their hour, so they are rebuilt from every event of the hours
+            # which got new events (hours without new events already have the right counts)
+            # when the source file is known every event is counted in the file's hour, so the stragglers it
+            # carries from the hour before don't replace that hour's row
+            rollup_events = fmt_events
+            if self.source_bucket is None and len(new_events) < len(fmt_events):
+                hours = {created_at // 3600 for created_at in new_events.created_at}
+                rollup_events = fmt_events.select(
+                    index
+                    for index, created_at in enumerate(fmt_events.created_at)
+                    if created_at // 3600 in hours
                 )
-                result = self.write(chunk)
-                if result is False:
-                    self.log.error(
-                        f"Chunk {counter}/{total_chunks} failed to write on retry - skipping..."
-                    )
-                    success = False
 
-            counter += 1
+            # update the hourly rollups with the counts from this batch of events
+            if not self.backend.write_rollups(rollup_events, bucket=self.source_bucket):
+                success = False
+
+        # only events which are known to be stored go in the index
+        if success and self.dedup is not None:
+            self.dedup.add(new_events)
 
         # log the number of events skipped
         if skipped_events > 0:
             self.log.info(f"Skipped {skipped_events} events")
+            self.metrics.increment("events_skipped", skipped_events, stage="write")
 
         # get the number of changes
+        self.metrics.increment("events", written, stage="write")
         self.log.info(
-            f"Committed {len(self.events) - skipped_events} changes to the database"
+            f"Committed {written} changes to the database in {round(timer.elapsed, 3)} seconds"
         )
 
         # return the success status of the entire batch operation
         return success
 
-    def get_stars_in_timeslice(self, hours=None, enrich=True, limit=20):
+    def new_counter(self):
         """
-        Query the database for the most stared repositories in a given time period
-        :param hours: a time period to limit the results to
+        Helper function to create the counter used for timeslice aggregation
+        :return: Counter, or a bounded SpaceSaving sketch when SKETCH_CAPACITY is set
+        """
+        if self.sketch_capacity:
+            return SpaceSaving(self.sketch_capacity)
+        return Counter()
+
+    def count_timeslices(self, windows, rollups=None, newest=None):
+        """
+        Count stars per repo for several nested time windows in a single pass
+        Only the widest window is read from the database, every narrower window is filled from the same rows
+        :param windows: list of window sizes in hours (e.g. [24, 168, 720])
+        :param rollups: read the hourly rollups instead of the raw events (default: USE_ROLLUPS)
+        :param newest: start of the last whole hour of every window, e.g. TrendState.newest_hour so the windows
+            line up with the trend state (default: the windows end at the current time)
+        :return: tuple of (dict of hours -> counter of repo_name -> stars, number of rows read)
+        """
+        widest = max(windows)
+        now = datetime.utcnow() if newest is None else newest + timedelta(hours=1)
+
+        # vectorized backends can count every window themselves
+        if self.backend.vectorized and not self.sketch_capacity:
+            return self.backend.count_windows(windows, now)
+
+        counts = {hours: self.new_counter() for hours in windows}
+        rows = 0
+
+        if rollups is None:
+            rollups = self.use_rollups
+
+        if rollups:
+            # merge the pre-aggregated hourly counts for every hour in the widest window
+            buckets = window_buckets(widest, now=newest or now)
+            offsets = {bucket: offset for offset, bucket in enumerate(buckets)}
+            data = self.metrics.timed_iter("query", self.backend.scan_rollups(buckets))
+            for bucket, repo_name, stars in data:
+                rows += 1
+                offset = offsets[bucket]
+                for hours, counter in counts.items():
+                    if offset < hours:
+                        counter[repo_name] += stars
+        else:
+            # stream every raw event in the widest window and count it towards each window it falls in
+            lower_bounds = {hours: now - timedelta(hours=hours) for hours in windows}
+            data = self.metrics.timed_iter(
+                "query",
+                self.backend.scan_events(
+                    lower_bounds[widest], now, window_buckets(widest + 1, now=now)
+                ),
+            )
+            for repo_name, created_at in data:
+                rows += 1
+                for hours, counter in counts.items():
+                    if created_at > lower_bounds[hours]:
+                        counter[repo_name] += 1
+
+        return counts, rows
+
+    def get_stars_in_timeslices(
+        self, windows, enrich=True, limit=20, rollups=None, newest=None
+    ):
+        """
+        Query the database for the most stared repositories in several time periods at once
+        The widest window is scanned once and every narrower window is computed in the same pass
+        :param windows: list of time periods in hours (e.g. [24, 168, 720])
         :param enrich: enrich the results with the GitHub API
-        :param limit: number of top repos to return (default: 20)
-        :return: list of most stared repositories
+        :param limit: number of top repos to return for each window (default: 20)
+        :param rollups: read the hourly rollups instead of the raw events (default: USE_ROLLUPS)
+        :param newest: start of the last whole hour of every window (see count_timeslices)
+        :return: dict of hours -> list of most stared repositories
         """
-        start = time.time()
+        # reading rows from the database is timed as "query", everything else as "aggregate"
+        with self.metrics.stage("aggregate") as timer:
+            counts, rows = self.count_timeslices(
+                windows, rollups=rollups, newest=newest
+            )
 
-        # the upper bound is now
-        upper_bound = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-        # the lower bound is now - the number of hours
-        lower_bound = (datetime.utcnow() - timedelta(hours=hours)).isoformat(
-            timespec="seconds"
-        ) + "Z"
+            # select the top N repos for every window (partial selection, no full sort)
+            results = self.rank(counts, limit, now=newest)
+
+        self.metrics.increment("rows", rows, stage="query")
+        self.log.info(
+            f"Processed {rows} results for {len(windows)} windows in {round(timer.elapsed, 3)} seconds"
+        )
 
-        # query the Azure Table Storage for the events within the time period
-        query = f"created_at gt datetime'{lower_bound}' and created_at lt datetime'{upper_bound}'"
-        data = self.read(query)
+        if not enrich:
+            return results
 
-        self.log.info(f"Processing {len(data)} events")
+        return self.enrich_results(results)
 
-        # loop through every result and count the total number of occurances for each repo_name
-        # this is done by creating a dictionary where the key is the repo_name and the value is the number of occurances
-        # the dictionary is then sorted by the number of occurances and returned
-        results = {}
-        for entry in data:
-            if entry["repo_name"] in results:
-                results[entry["repo_name"]] += 1
+    def rank(self, counts, limit, now=None):
+        """
+        Select the top repos of several windows by the configured ranking (RANK_BY)
+        :param counts: dict of hours -> counter of repo_name -> raw stars
+        :param limit: number of top repos to return for each window
+        :param now: end of every window (default: current UTC time)
+        :return: dict of hours -> list of (repo_name, score) tuples
+        """
+        if self.rank_by == "stars":
+            return {hours: top_k(counter, limit) for hours, counter in counts.items()}
+
+        if self.rank_by not in ("stargazers", "weighted"):
+            raise ValueError(f"Unknown RANK_BY: {self.rank_by}")
+
+        # both scores are never higher than the raw star count, so only the repos with the most raw stars
+        # are read back from the hourly rollups and memory is bounded by the number of candidates
+        size = max(limit, self.rank_candidates)
+        candidates = {
+            hours: {repo_name for repo_name, _ in top_k(counter, size)}
+            for hours, counter in counts.items()
+        }
+        windows = sorted(candidates)
+        buckets = window_buckets(windows[-1], now=now)
+        offsets = {bucket: offset for offset, bucket in enumerate(buckets)}
+
+        # every row is added to the band of the narrowest window it falls in - each window is the union of its
+        # own band and all of the narrower ones
+        bands = [{} for _ in windows]
+        repos = set().union(*candidates.values())
+        rows = self.metrics.timed_iter(
+            "query", self.backend.scan_rollup_stats(buckets, repos)
+        )
+        for bucket, repo_name, stars, weighted, sketch in rows:
+            band = bisect_right(windows, offsets[bucket])
+            score = bands[band].get(repo_name)
+            if score is None:
+                # [weighted stars, distinct stargazers sketch, stars from rows without a sketch]
+                score = bands[band][repo_name] = [0.0, None, 0]
+            score[0] += weighted
+            if sketch is None:
+                score[2] += stars
+            elif score[1] is None:
+                score[1] = sketch
             else:
-                results[entry["repo_name"]] = 1
+                score[1].merge(sketch)
 
-        # sort the results by the number of occurances
-        results = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+        results = {}
+        running = {}
+        for hours, band in zip(windows, bands):
+            for repo_name, (weighted, sketch, unsketched) in band.items():
+                total = running.get(repo_name)
+                if total is None:
+                    running[repo_name] = [weighted, sketch, unsketched]
+                    continue
+                total[0] += weighted
+                total[2] += unsketched
+                if sketch is not None:
+                    if total[1] is None:
+                        total[1] = sketch
+                    else:
+                        total[1].merge(sketch)
+
+            scores = {}
+            for repo_name in candidates[hours]:
+                total = running.get(repo_name)
+                if total is None:
+                    continue
+                if self.rank_by == "weighted":
+                    scores[repo_name] = int(round(total[0]))
+                else:
+                    scores[repo_name] = (total[1].count() if total[1] else 0) + total[2]
+            results[hours] = top_k(scores, limit)
 
-        # create a list of the top N repos using the limit parameter
-        top_stared_repos = list(results.items())[:limit]
+        self.log.info(
+            f"Ranked {len(repos)} candidate repos by {self.rank_by} for {len(windows)} windows"
+        )
+        return results
 
-        # update the object with the results
-        self.most_stared = top_stared_repos
+    def enrich_results(self, results):
+        """
+        Enrich the top repos of several windows with the GitHub API
+        Every repo is only enriched once, even when it shows up in more than one window
+        :param results: dict of hours -> list of (repo_name, stars) tuples
+        :return: dict of hours -> list of enriched repos
+        """
+        unique = {}
+        for top_stared_repos in results.values():
+            for repo_name, stars in top_stared_repos:
+                unique.setdefault(repo_name, stars)
+
+        enriched = {
+            repo["repo_name"]: repo for repo in self.enrich_repos(list(unique.items()))
+        }
+
+        return {
+            hours: [
+                dict(enriched[repo_name], stars=stars)
+                for repo_name, stars in top_stared_repos
+                if repo_name in enriched
+            ]
+            for hours, top_stared_repos in results.items()
+        }
+
+    def rollups_cover(self, hours, oldest=6):
+        """
+        Check that the hourly rollups go back far enough to count a window
+        Rollups only exist from when they were turned on, unless older hours were backfilled
+        (script/migrate_partitions.py --rollups or script/populate_database.py)
+        :param hours: size of the window in hours
+        :param oldest: number of the oldest hours of the window to look at (gharchive is missing the odd hour)
+        :return: bool
+        """
+        buckets = window_buckets(hours)[-oldest:]
+        for _ in self.backend.scan_rollups(buckets):
+            return True
+        return False
+
+    def load_trend_state(self):
+        """
+        Load the persisted trend state
+        When there is no state file yet (or it tracks different windows) it is rebuilt from the hourly rollups
+        :return: TrendState
+        """
+        state = TrendState.load(self.trend_state_path)
+        if (
+            state is not None
+            and state.windows == sorted(self.trend_windows)
+            and state.half_lives == (sorted(self.velocity_half_lives) or None)
+        ):
+            return state
+
+        with self.metrics.stage("aggregate") as timer:
+            widest = max(self.trend_windows)
+            buckets = window_buckets(widest + self.hours, now=datetime.utcnow())
+            rows = self.metrics.timed_iter("query", self.backend.scan_rollups(buckets))
+            state = TrendState.bootstrap(
+                self.trend_windows, rows, half_lives=self.velocity_half_lives
+            )
+
+        self.log.info(
+            f"Rebuilt the trend state for {len(state.hours)} hours in {round(timer.elapsed, 3)} seconds"
+        )
+        return state
+
+    def update_trend_state(self):
+        """
+        Add the hours in self.events to the persisted trend state
+        Only the repos in the new hours and in the hours which slid out of each window are touched
+        """
+        # counted from the same events as the stored rows and rollups (invalid events and repeat stars dropped)
+        events, _ = self.select_events()
+
+        with self.metrics.stage("aggregate") as timer:
+            state = self.load_trend_state()
+            # keyed by the hour of the source file, like the rollups, so stragglers don't replace the hour before
+            state.update(rollup_counts(events, bucket=self.source_bucket))
+            state.save(self.trend_state_path)
+
+        self.log.info(
+            f"Updated the trend state up to {state.newest} in {round(timer.elapsed, 3)} seconds"
+        )
+
+    def get_trends(self, windows, enrich=True, limit=20, state=None):
+        """
+        Get the most stared repositories for several time periods
+        Reads the incrementally maintained trend state when it tracks every window, otherwise queries the database
+        :param windows: list of time periods in hours (e.g. [24, 168, 720])
+        :param enrich: enrich the results with the GitHub API
+        :param limit: number of top repos to return for each window (default: 20)
+        :param state: already loaded TrendState to read (default: load it from the state file) - windows the
+            state doesn't track are read from the database but still end with its newest hour
+        :return: dict of hours -> list of most stared repositories
+        """
+        if not self.use_trend_state or not set(windows) <= set(self.trend_windows):
+            return self.get_stars_in_timeslices(
+                windows,
+                enrich=enrich,
+                limit=limit,
+                newest=state.newest_hour if state is not None else None,
+            )
+
+        if state is None:
+            state = self.load_trend_state()
+        results = self.rank(
+            {hours: state.totals[hours] for hours in windows},
+            limit,
+            now=state.newest_hour,
+        )
 
         self.log.info(
-            f"Processed {len(data)} results in {round(time.time() - start, 3)} seconds"
+            f"Read {len(windows)} windows from the trend state ending at {state.newest}"
         )
 
-        # if enrich is True, use the GitHub API to enrich the results
-        if enrich:
-            self.most_stared = self.enrich_most_stared()
+        if not enrich:
+            return results
+
+        return self.enrich_results(results)
+
+    def get_velocity_trends(self, by="velocity", enrich=True, limit=20, state=None):
+        """
+        Get the repos which are gaining stars fastest relative to their own trailing baseline
+        Scores come from the decayed counters in the trend state, so no stars are re-read from the database
+        :param by: velocity (fast rate vs baseline) or acceleration (short rate vs fast rate)
+        :param enrich: enrich the results with the GitHub API
+        :param limit: number of top repos to return (default: 20)
+        :param state: already loaded TrendState to read (default: load it from the state file)
+        :return: list of repos - enriched repos get the score and stars per day (as stars) added
+        """
+        if state is None:
+            state = self.load_trend_state()
+        if state.decayed is None:
+            raise ValueError("VELOCITY_HALF_LIVES must be set to score by velocity")
+
+        with self.metrics.stage("aggregate") as timer:
+            top = state.decayed.top(state.newest, limit, by=by)
+
+        self.log.info(
+            f"Scored {len(state.decayed.repos)} repos by {by} in {round(timer.elapsed, 3)} seconds"
+        )
+
+        if not enrich:
+            return top
+
+        scores = {repo_name: score for repo_name, score, _ in top}
+        enriched = self.enrich_results(
+            {by: [(repo_name, round(per_day)) for repo_name, _, per_day in top]}
+        )[by]
+        return [dict(repo, score=scores[repo["repo_name"]]) for repo in enriched]
+
+    def get_stars_in_timeslice(self, hours=None, enrich=True, limit=20):
+        """
+        Query the database for the most stared repositories in a given time period
+        :param hours: a time period to limit the results to
+        :param enrich: enrich the results with the GitHub API
+        :param limit: number of top repos to return (default: 20)
+        :return: list of most stared repositories
+        """
+        # update the object with the results
+        self.most_stared = self.get_stars_in_timeslices(
+            [hours], enrich=enrich, limit=limit
+        )[hours]
 
         # return the result
         return self.most_stared
@@ -397,74 +954,203 @@ class StarEvents:
         :return: list of most stared repositories with additional information
         Note: This function will also update the self.most_stared object with the enriched data
         """
+        self.most_stared = self.enrich_repos(self.most_stared)
+        return self.most_stared
+
+    def enrich_repos(self, repos):
+        """
+        Enrich repositories with additional information from the GitHub API
+        Safe to call from several threads at once (the trend query service runs queries concurrently)
+        :param repos: list of (repo_name, stars) tuples
+        :return: list of enriched repos
+        """
         self.log.info("Enriching repository data with the GitHub API")
-        start = time.time()
-        most_stared_enriched = []
 
-        # add github token to request for higher rate limit
-        headers = {"Authorization": f"Bearer {self.gh_token}"}
+        # concurrent enrichment client backed by a persistent cache of GitHub API responses
+        # (shared across windows and runs)
+        with self.enricher_lock:
+            if self.enricher is None:
+                # only the trends crons enrich, so the GitHub API client isn't imported by the ingest path
+                from api_cache import ApiCache
+                from enrich import Enricher
+
+                self.api_cache = ApiCache(
+                    self.gh_cache_path,
+                    ttl=self.gh_cache_ttl,
+                    max_age=self.gh_cache_max_age,
+                )
+                self.enricher = Enricher(
+                    self.log,
+                    self.api_cache,
+                    token=self.gh_token,
+                    base_url=self.gh_base_url,
+                    concurrency=self.enrich_concurrency,
+                )
 
-        # loop through all the most stared repos and get the additional information
-        for repo in self.most_stared:
-            resp = requests.get(f"{self.gh_base_url}/repos/{repo[0]}", headers=headers)
+        with self.metrics.stage("enrich") as timer:
+            enriched = self.enricher.enrich(repos)
 
-            if resp.status_code == 404:
-                self.log.warning(f"Repo {repo[0]} not found - skipping...")
-                continue
+        self.metrics.increment("repos", len(enriched), stage="enrich")
+        self.log.info(
+            f"Enriched {len(enriched)} repositories in {round(timer.elapsed, 3)} seconds "
+            f"(cache hits: {self.api_cache.hits}, revalidated: {self.api_cache.revalidated}, misses: {self.api_cache.misses})"
+        )
 
-            if resp.status_code != 200:
-                self.log.error(
-                    f"Error getting repo enrichment data for {repo[0]} - HTTP: {resp.status_code}"
-                )
-                continue
+        return enriched
 
-            repo_data = resp.json()
+    def write_metrics(self, run):
+        """
+        Write the metrics of this run as a json report (and in the Prometheus text format when configured)
+        :param run: name of the run (e.g. stars_cron)
+        :return: the report dict
+        """
+        report = self.metrics.write_report(self.metrics_path, run=run)
+        if self.metrics_prometheus_path:
+            self.metrics.write_prometheus(self.metrics_prometheus_path)
+
+        stages = ", ".join(
+            f"{stage}: {summary['seconds']}s"
+            for stage, summary in sorted(
+                report["stages"].items(), key=lambda item: -item[1]["seconds"]
+            )
+        )
+        self.log.info(f"{run} finished in {report['elapsed']} seconds ({stages})")
 
-            # make an API call to get repo contributors data
-            contributors_resp = requests.get(
-                repo_data["contributors_url"], headers=headers
+        if self.run_budget and report["elapsed"] > self.run_budget:
+            self.log.warning(
+                f"{run} took {report['elapsed']} seconds which is over the {self.run_budget} second budget"
             )
 
-            if contributors_resp.status_code != 200:
-                self.log.error(
-                    f"Error getting contributors enrichment data for {repo[0]} - HTTP: {contributors_resp.status_code}"
+        return report
+
+    def write_hour(self, hour, events, checksum=None, collect_seconds=0):
+        """
+        Write the star events of one gharchive hour, add it to the trend state and record the result in the ingest ledger
+        If an earlier attempt at the same file only partially succeeded, chunks it already wrote are skipped
+        :param hour: gharchive timestamp
+        :param events: StarEventBatch of the star events in the hour
+        :param checksum: sha256 of the compressed gharchive file
+        :param collect_seconds: time it took to download and parse the hour
+        :return: True if successful, False if not
+        """
+        committed = set()
+        if self.use_ledger:
+            entry = self.backend.ledger.get(hour)
+            # chunks are only stable if the source file is exactly the same as last time
+            if (
+                entry is not None
+                and entry["status"] == PARTIAL
+                and entry["checksum"] == checksum
+            ):
+                committed = set(entry["committed"])
+                self.log.info(
+                    f"Resuming {hour} - {len(committed)} chunks were already written"
                 )
-                continue
-            contributors_data = contributors_resp.json()
 
-            # only grab the first 10 contributors
-            contributors = contributors_data[:10]
+        started_at = datetime.utcnow()
 
-            most_stared_enriched.append(
+        self.events = events
+        self.source_bucket = gharchive_bucket(hour)
+        with self.metrics.stage("write") as timer:
+            try:
+                result = self.write_star_events(committed=committed)
+
+                # slide the trend windows forward with the hour before the ledger records it as complete,
+                # so every hour which is skipped from now on (ingest, daemon, backfill or catch-up) is in the state
+                if result is not False and self.use_trend_state:
+                    self.update_trend_state()
+            except Exception as e:
+                self.log.error(f"Error writing events for {hour}: {e}")
+                result = False
+
+        # write_star_events returns None when there was nothing to write
+        success = result is not False
+
+        if self.use_ledger:
+            if success:
+                status = COMPLETE
+            elif committed:
+                status = PARTIAL
+            else:
+                status = FAILED
+
+            self.backend.ledger.put(
+                hour,
                 {
-                    "repo_name": repo[0],
-                    "stars": repo[1],
-                    "repo_url": f"https://github.com/{repo[0]}",
-                    "description": repo_data["description"],
-                    "stargazers_count": repo_data["stargazers_count"],
-                    "language": repo_data["language"],
-                    "forks_count": repo_data["forks_count"],
-                    "updated_at": repo_data["updated_at"],
-                    "watchers_count": repo_data["watchers_count"],
-                    "open_issues_count": repo_data["open_issues_count"],
-                    "topics": repo_data["topics"],
-                    "license": repo_data["license"],
-                    "contributors": contributors,
-                }
+                    "status": status,
+                    "checksum": checksum,
+                    "events": len(events),
+                    "committed": sorted(committed),
+                    "started_at": started_at.isoformat(timespec="seconds") + "Z",
+                    "finished_at": datetime.utcnow().isoformat(timespec="seconds")
+                    + "Z",
+                    "collect_seconds": round(collect_seconds, 3),
+                    "write_seconds": round(timer.elapsed, 3),
+                },
             )
 
-        self.log.info(
-            f"Enriched {len(most_stared_enriched)} repositories in {round(time.time() - start, 3)} seconds"
+        return success
+
+    def ingest_hour(self, timestamp=None):
+        """
+        Collect and store the star events of one gharchive hour unless the ledger says it is already done
+        :param timestamp: time period to collect events for in gharchive format (default: self.hours ago)
+        :return: True if successful, False if not
+        """
+        hour = self.gharchive_timestamp_fmt(timestamp)
+
+        if self.use_ledger:
+            entry = self.backend.ledger.get(hour)
+            if entry is not None and entry["status"] == COMPLETE:
+                self.log.info(f"{hour} was already ingested - skipping")
+                return True
+
+        with self.metrics.stage("collect") as timer:
+            self.get_star_events(timestamp=hour)
+
+        success = self.write_hour(
+            hour, self.events, self.checksum, collect_seconds=timer.elapsed
         )
+        self.metrics.increment("hours", 1, status="ok" if success else "failed")
+        return success
 
-        self.most_stared = most_stared_enriched
-        return self.most_stared
+    def missing_hours(self, newest=None):
+        """
+        Find the hours in the lookback window which have not been completely ingested
+        :param newest: newest hour to check (default: self.hours ago)
+        :return: list of gharchive timestamps, oldest first
+        """
+        newest = newest or datetime.utcnow() - timedelta(hours=self.hours)
+        oldest = newest - timedelta(hours=self.ledger_lookback - 1)
+        hours = gharchive_hours(
+            oldest.strftime("%Y-%m-%d-%H"), newest.strftime("%Y-%m-%d-%H")
+        )
+
+        completed = self.backend.ledger.completed(hours)
+        return [hour for hour in hours if hour not in completed]
 
     def run(self):
         """
         Run the StarEvents class
         This method will collect and store the GitHub star events in the database
+        With the ingest ledger enabled every missing hour in the lookback window is caught up, oldest first
         :return: True if successful, False if not
         """
-        self.get_star_events()
-        return self.write_star_events()
+        if not self.use_ledger:
+            self.get_star_events(timestamp=self.gharchive_timestamp_fmt(None))
+            return self.write_star_events()
+
+        missing = self.missing_hours()
+        if not missing:
+            self.log.info("Every hour in the lookback window was already ingested")
+            return True
+
+        self.log.info(f"Ingesting {len(missing)} hours: {', '.join(missing)}")
+
+        success = True
+        for hour in missing:
+            self.clear_events()
+            if not self.ingest_hour(hour):
+                success = False
+
+        return success
@@ -0,0 +1,233 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from partitions import BUCKET_FORMAT
+from sketches import top_k
+from velocity import DecayedCounters
+
+# bump when the layout of the saved state changes so old files are rebuilt instead of misread
+STATE_VERSION = 2
+
+
+def bucket_offset(newest, bucket):
+    """
+    Get the number of hours between two hour buckets
+    :param newest: newer hour bucket
+    :param bucket: older hour bucket
+    :return: number of hours (0 when both are the same hour)
+    """
+    delta = datetime.strptime(newest, BUCKET_FORMAT) - datetime.strptime(
+        bucket, BUCKET_FORMAT
+    )
+    return int(delta.total_seconds() // 3600)
+
+
+def add_counts(totals, counts, sign=1):
+    """
+    Add (or subtract) counts in place, dropping repos which fall to zero so the totals stay small
+    :param totals: Counter to update
+    :param counts: mapping of repo_name -> stars
+    :param sign: 1 to add, -1 to subtract
+    """
+    for repo_name, stars in counts.items():
+        value = totals.get(repo_name, 0) + sign * stars
+        if value > 0:
+            totals[repo_name] = value
+        else:
+            totals.pop(repo_name, None)
+
+
+class TrendState:
+    """
+    Sliding window star counts maintained incrementally
+    Keeps a ring buffer of per-hour repo counts plus a running total for every window, so adding an hour only
+    touches the repos in that hour and in the hours which fall out of each window
+    Every window ends at the newest hour that has been added
+    Optionally keeps exponentially decayed counters of every repo as well (see velocity.DecayedCounters)
+    """
+
+    def __init__(self, windows, half_lives=None):
+        """
+        Initialize the TrendState class
+        :param windows: list of window sizes in hours (e.g. [24, 168, 720])
+        :param half_lives: optional half-lives in hours for the decayed velocity counters (e.g. [6, 24, 168])
+        """
+        self.windows = sorted(windows)
+        self.capacity = self.windows[-1]
+        self.newest = None
+        self.hours = {}
+        self.totals = {hours: Counter() for hours in self.windows}
+        self.decayed = DecayedCounters(half_lives) if half_lives else None
+
+    @property
+    def half_lives(self):
+        return self.decayed.half_lives if self.decayed is not None else None
+
+    @property
+    def newest_hour(self):
+        """
+        Start of the newest hour in the state - every window ends with this hour
+        :return: naive UTC datetime, or None if the state is empty
+        """
+        return datetime.strptime(self.newest, BUCKET_FORMAT) if self.newest else None
+
+    @classmethod
+    def bootstrap(cls, windows, rows, half_lives=None):
+        """
+        Build a trend state from hourly rollup rows
+        :param windows: list of window sizes in hours
+        :param rows: iterable of (bucket, repo_name, stars) tuples (see StorageBackend.scan_rollups)
+        :param half_lives: optional half-lives in hours for the decayed velocity counters
+        :return: TrendState
+        """
+        hours = {}
+        for bucket, repo_name, stars in rows:
+            hours.setdefault(bucket, Counter())[repo_name] += stars
+
+        state = cls(windows, half_lives)
+        state.update(hours)
+        return state
+
+    def advance(self, bucket):
+        """
+        Move the end of every window forward to a newer hour
+        Hours which fall out of a window are subtracted from its total and hours older than the widest
+        window are dropped from the ring buffer
+        :param bucket: new newest hour bucket
+        """
+        if self.newest is None:
+            self.newest = bucket
+            return
+
+        shift = bucket_offset(bucket, self.newest)
+        for old_bucket, counts in list(self.hours.items()):
+            offset = bucket_offset(self.newest, old_bucket)
+            for hours in self.windows:
+                if offset < hours <= offset + shift:
+                    add_counts(self.totals[hours], counts, -1)
+
+            if offset + shift >= self.capacity:
+                del self.hours[old_bucket]
+
+        self.newest = bucket
+
+    def set_hour(self, bucket, counts):
+        """
+        Set the star counts of one hour, replacing whatever was stored for it before
+        Hours are replaced rather than added to, just like the rollup table, so reprocessing an hour is idempotent
+        An hour holds every event of its gharchive file, including the stragglers created in the hour before
+        (see rollups.rollup_counts), so a file never replaces the counts of a neighbouring hour
+        :param bucket: hour bucket
+        :param counts: mapping of repo_name -> stars for the whole hour
+        """
+        if self.newest is None or bucket > self.newest:
+            self.advance(bucket)
+
+        offset = bucket_offset(self.newest, bucket)
+        if offset >= self.capacity:
+            return
+
+        previous = self.hours.get(bucket, {})
+        counts = Counter(counts)
+        for hours in self.windows:
+            if offset < hours:
+                add_counts(self.totals[hours], previous, -1)
+                add_counts(self.totals[hours], counts)
+
+        self.hours[bucket] = counts
+
+        # decayed counters are additive too, so replacing an hour swaps its old contribution for the new one
+        if self.decayed is not None:
+            self.decayed.add(bucket, previous, -1)
+            self.decayed.add(bucket, counts)
+
+    def update(self, counts):
+        """
+        Set the star counts of many hours
+        :param counts: dict of hour bucket -> mapping of repo_name -> stars (see rollups.rollup_counts)
+        """
+        for bucket in sorted(counts):
+            self.set_hour(bucket, counts[bucket])
+
+    def top(self, hours, limit):
+        """
+        Get the most stared repos in a window
+        :param hours: window size in hours (must be one of the tracked windows)
+        :param limit: number of repos to return
+        :return: list of (repo_name, stars) tuples, highest first
+        """
+        return top_k(self.totals[hours], limit)
+
+    def save(self, path):
+        """
+        Atomically write the state to a gzipped json file
+        Repo names are dictionary encoded once for the whole file
+        :param path: path to the state file
+        """
+        names = {}
+
+        def encode(counts):
+            repos = [names.setdefault(name, len(names)) for name in counts]
+            return [repos, list(counts.values())]
+
+        hours = {bucket: encode(counts) for bucket, counts in self.hours.items()}
+        totals = {str(hours): encode(self.totals[hours]) for hours in self.windows}
+        decayed = None
+        if self.decayed is not None:
+            self.decayed.compact(self.newest)
+            decayed = self.decayed.to_dict()
+        data = {
+            "version": STATE_VERSION,
+            "windows": self.windows,
+            "newest": self.newest,
+            "repos": list(names),
+            "hours": hours,
+            "totals": totals,
+            "decayed": decayed,
+        }
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        partial_path = f"{path}.part"
+        with gzip.open(partial_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a state file
+        :param path: path to the state file
+        :return: TrendState or None if there is no (compatible) state file
+        """
+        if not os.path.exists(path):
+            return None
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data.get("version") != STATE_VERSION:
+            return None
+
+        names = data["repos"]
+
+        def decode(encoded):
+            repos, stars = encoded
+            return Counter({names[repo]: count for repo, count in zip(repos, stars)})
+
+        state = cls(data["windows"])
+        if data.get("decayed"):
+            state.decayed = DecayedCounters.from_dict(data["decayed"])
+        state.newest = data["newest"]
+        state.hours = {
+            bucket: decode(encoded) for bucket, encoded in data["hours"].items()
+        }
+        state.totals = {
+            int(hours): decode(encoded) for hours, encoded in data["totals"].items()
+        }
+        return state
@@ -0,0 +1,177 @@
+import math
+from array import array
+from datetime import datetime
+
+from events import Dictionary, to_epoch
+from partitions import BUCKET_FORMAT
+from sketches import top_k
+
+# stars per day added to every baseline so repos with almost no history don't get infinite scores
+BASELINE_PRIOR = 1.0
+
+# repos whose baseline rate decays below this many stars per day are dropped when the counters are compacted
+PRUNE_BELOW = 0.01
+
+# renormalize the counters once the fastest one has been inflated by 2^RENORMALIZE_AFTER
+RENORMALIZE_AFTER = 256
+
+
+def bucket_hour(bucket):
+    """
+    Convert an hour bucket to hours since the epoch
+    :param bucket: hour bucket (e.g. 2022-09-10T14)
+    :return: int
+    """
+    return to_epoch(datetime.strptime(bucket, BUCKET_FORMAT)) // 3600
+
+
+class DecayedCounters:
+    """
+    Exponentially decayed star counters for every repo, one per half-life
+    Counters are stored relative to a fixed origin hour (value * 2^((hour - origin) / half_life)) so adding an
+    hour only touches the repos in it - nothing has to be decayed until the counters are read
+    Repo names are dictionary encoded and each counter is a typed array indexed by repo id, so scoring every
+    repo is a single pass over a few arrays
+    """
+
+    def __init__(self, half_lives):
+        """
+        Initialize the DecayedCounters class
+        :param half_lives: half-lives in hours, e.g. [6, 24, 168] for the short, fast and baseline counters
+        """
+        self.half_lives = sorted(half_lives)
+        self.origin = None
+        self.repos = Dictionary()
+        self.values = [array("d") for _ in self.half_lives]
+
+    def add(self, bucket, counts, sign=1):
+        """
+        Add (or subtract) the star counts of one hour
+        :param bucket: hour bucket the stars were given in
+        :param counts: mapping of repo_name -> stars
+        :param sign: 1 to add, -1 to subtract (used when an hour is replaced)
+        """
+        hour = bucket_hour(bucket)
+        if self.origin is None:
+            self.origin = hour
+        if (hour - self.origin) / self.half_lives[0] > RENORMALIZE_AFTER:
+            self.renormalize(hour)
+
+        factors = [
+            sign * 2.0 ** ((hour - self.origin) / half_life)
+            for half_life in self.half_lives
+        ]
+        for repo_name, stars in counts.items():
+            index = self.repos.add(repo_name)
+            for values, factor in zip(self.values, factors):
+                if index == len(values):
+                    values.append(0.0)
+                values[index] += stars * factor
+
+    def renormalize(self, hour):
+        """
+        Move the origin to a newer hour so the stored values stay within float range
+        :param hour: new origin (hours since the epoch)
+        """
+        for index, half_life in enumerate(self.half_lives):
+            scale = 2.0 ** ((self.origin - hour) / half_life)
+            self.values[index] = array(
+                "d", (value * scale for value in self.values[index])
+            )
+        self.origin = hour
+
+    def rates(self, newest):
+        """
+        Get the decayed star rate of every repo for every half-life
+        :param newest: hour bucket the counters are read at
+        :return: generator of (repo_name, list of stars per day, one per half-life)
+        """
+        hour = bucket_hour(newest)
+        # a constant rate r gives a decayed sum of r / (1 - 2^(-1 / half_life)), so undo that to get stars per day
+        scales = [
+            2.0 ** ((self.origin - hour) / half_life)
+            * (1 - 2.0 ** (-1 / half_life))
+            * 24
+            for half_life in self.half_lives
+        ]
+        names = self.repos.names
+        for index, values in enumerate(zip(*self.values)):
+            yield names[index], [
+                max(value * scale, 0.0) for value, scale in zip(values, scales)
+            ]
+
+    def scores(self, newest, by="velocity"):
+        """
+        Score every repo against its own trailing baseline
+        velocity compares the fast rate (second half-life) with the baseline (slowest half-life) and acceleration
+        compares the short rate (fastest half-life) with the fast rate - both are scaled by the square root of
+        the baseline, like a z-score for a Poisson count, so big repos need a proportionally bigger jump
+        :param newest: hour bucket the counters are read at
+        :param by: velocity or acceleration
+        :return: tuple of (dict of repo_name -> score, dict of repo_name -> stars per day at the fast rate)
+        """
+        scores = {}
+        per_day = {}
+        for repo_name, rates in self.rates(newest):
+            short, fast, baseline = rates[0], rates[len(rates) // 2], rates[-1]
+            if by == "acceleration":
+                score = (short - fast) / math.sqrt(fast + BASELINE_PRIOR)
+            else:
+                score = (fast - baseline) / math.sqrt(baseline + BASELINE_PRIOR)
+            if score > 0:
+                scores[repo_name] = score
+                per_day[repo_name] = fast
+        return scores, per_day
+
+    def top(self, newest, limit, by="velocity"):
+        """
+        Get the repos which are trending fastest relative to their own baseline
+        :param newest: hour bucket the counters are read at
+        :param limit: number of repos to return
+        :param by: velocity or acceleration
+        :return: list of (repo_name, score, stars per day) tuples, highest score first
+        """
+        scores, per_day = self.scores(newest, by)
+        return [
+            (repo_name, round(score, 3), per_day[repo_name])
+            for repo_name, score in top_k(scores, limit)
+        ]
+
+    def compact(self, newest):
+        """
+        Drop repos whose slowest counter has decayed to almost nothing so the counters don't grow forever
+        :param newest: hour bucket the counters are read at
+        """
+        if newest is None or self.origin is None:
+            return
+
+        keep = [
+            index
+            for index, (repo_name, rates) in enumerate(self.rates(newest))
+            if rates[-1] >= PRUNE_BELOW
+        ]
+        if len(keep) == len(self.repos):
+            return
+
+        repos = Dictionary()
+        for index in keep:
+            repos.add(self.repos.names[index])
+        self.values = [array("d", (values[i] for i in keep)) for values in self.values]
+        self.repos = repos
+
+    def to_dict(self):
+        return {
+            "half_lives": self.half_lives,
+            "origin": self.origin,
+            "repos": self.repos.names,
+            "values": [list(values) for values in self.values],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        counters = cls(data["half_lives"])
+        counters.origin = data["origin"]
+        for name in data["repos"]:
+            counters.repos.add(name)
+        counters.values = [array("d", values) for values in data["values"]]
+        return counters
@@ -0,0 +1,265 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.core.exceptions import ResourceExistsError
+
+# http status codes which Azure Table Storage uses to signal throttling or a busy server
+THROTTLE_STATUS_CODES = (429, 500, 503)
+
+
+class AdaptiveLimiter:
+    """
+    Semaphore with a limit that can grow and shrink while it is in use (AIMD)
+    The limit grows by one after a full window of successes and is halved on throttling
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        """
+        Initialize the AdaptiveLimiter class
+        :param initial: starting number of permits
+        :param minimum: lowest the limit can shrink to
+        :param maximum: highest the limit can grow to
+        """
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_use = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_use >= self.limit:
+                self.condition.wait()
+            self.in_use += 1
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self.successes = 0
+
+
+class WriteStats:
+    """
+    Latency and throughput statistics for a batch of table transactions
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.events = 0
+        self.chunks = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.start = time.time()
+        self.end = None
+        self.skipped = 0
+
+    def percentile(self, pct):
+        """
+        Get a latency percentile from the recorded chunk latencies
+        :param pct: percentile to get (0-100)
+        :return: latency in seconds (0 if nothing was recorded)
+        """
+        if not self.latencies:
+            return 0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def record(self, metrics, stage):
+        """
+        Add the stats to a Metrics registry
+        :param metrics: Metrics object
+        :param stage: stage the transactions belong to (e.g. write)
+        """
+        for name in ("chunks", "events", "failed", "retries", "throttled", "skipped"):
+            value = getattr(self, name)
+            if value:
+                metrics.increment(f"transaction_{name}", value, stage=stage)
+        for latency in self.latencies:
+            metrics.observe("transaction_seconds", latency, stage=stage)
+
+    def summary(self):
+        """
+        Summarize the stats as a dictionary
+        :return: dict of the write stats
+        """
+        elapsed = (self.end or time.time()) - self.start
+        return {
+            "chunks": self.chunks,
+            "events": self.events,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "elapsed": round(elapsed, 3),
+            "events_per_second": round(self.events / elapsed, 1) if elapsed else 0,
+            "latency_p50": round(self.percentile(50), 3),
+            "latency_p95": round(self.percentile(95), 3),
+            "latency_max": round(max(self.latencies, default=0), 3),
+        }
+
+
+class TableWriter:
+    """
+    Concurrent batched writer for Azure Table Storage transactions
+    Keeps a bounded, adaptive number of transactions in flight over a single shared table client
+    """
+
+    def __init__(
+        self,
+        table,
+        log,
+        max_concurrency=8,
+        min_concurrency=1,
+        max_retries=5,
+        base_delay=0.5,
+        max_delay=30,
+    ):
+        """
+        Initialize the TableWriter class
+        :param table: table client (anything with a submit_transaction method)
+        :param log: logger object
+        :param max_concurrency: max number of transactions in flight
+        :param min_concurrency: min number of transactions in flight when throttled
+        :param max_retries: number of times to retry a failed chunk
+        :param base_delay: base backoff delay in seconds
+        :param max_delay: max backoff delay in seconds
+        """
+        self.table = table
+        self.log = log
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_throttled(self, error):
+        """
+        Helper function to check if an exception means the service is throttling us
+        :param error: exception raised by the table client
+        :return: True if the request was throttled
+        """
+        return getattr(error, "status_code", None) in THROTTLE_STATUS_CODES
+
+    def backoff(self, attempt):
+        """
+        Exponential backoff with full jitter
+        :param attempt: retry attempt number (starting at 0)
+        :return: number of seconds to sleep
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def write_chunk(self, chunk, number, total, limiter, stats, operation="upsert"):
+        """
+        Write a single chunk of entities as one transaction, retrying with backoff
+        :param chunk: list of entities (max 100)
+        :param number: chunk number (for logging)
+        :param total: total number of chunks (for logging)
+        :param limiter: AdaptiveLimiter shared by all chunks
+        :param stats: WriteStats shared by all chunks
+        :param operation: transaction operation to run for every entity (upsert, delete, etc)
+        :return: True if the chunk was written, False if not
+        """
+        operations = [(operation, entity) for entity in chunk]
+
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            start = time.time()
+            try:
+                self.table.submit_transaction(operations)
+                error = None
+            except ResourceExistsError:
+                self.log.warning(f"Chunk {number}/{total} already exists - skipping")
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                latency = time.time() - start
+                limiter.release()
+
+            if error is None:
+                limiter.on_success()
+                with stats.lock:
+                    stats.latencies.append(latency)
+                    stats.chunks += 1
+                    stats.events += len(chunk)
+                self.log.debug(
+                    f"Chunk {number}/{total} written successfully in {round(latency, 2)} seconds"
+                )
+                return True
+
+            throttled = self.is_throttled(error)
+            if throttled:
+                limiter.on_throttle()
+
+            with stats.lock:
+                stats.throttled += int(throttled)
+                if attempt < self.max_retries:
+                    stats.retries += 1
+
+            if attempt < self.max_retries:
+                delay = self.backoff(attempt)
+                self.log.warning(
+                    f"Chunk {number}/{total} failed to write ({error}) - retrying in {round(delay, 2)} seconds..."
+                )
+                time.sleep(delay)
+
+        self.log.error(
+            f"Chunk {number}/{total} failed to write after {self.max_retries} retries - skipping..."
+        )
+        with stats.lock:
+            stats.failed += 1
+        return False
+
+    def write_chunks(self, chunks, operation="upsert", committed=None):
+        """
+        Write all chunks concurrently
+        :param chunks: list of entity chunks (max 100 entities per chunk, one PartitionKey per chunk)
+        :param operation: transaction operation to run for every entity (default: upsert)
+        :param committed: optional set of chunk ids (chunk numbers as strings) which are already written - they
+            are skipped and the ids of newly written chunks are added to it
+        :return: WriteStats for the whole batch
+        """
+        stats = WriteStats()
+        total = len(chunks)
+        limiter = AdaptiveLimiter(
+            initial=min(self.max_concurrency, max(self.min_concurrency, 2)),
+            minimum=self.min_concurrency,
+            maximum=self.max_concurrency,
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {}
+            for number, chunk in enumerate(chunks, start=1):
+                if committed is not None and str(number) in committed:
+                    stats.skipped += 1
+                    continue
+                future = pool.submit(
+                    self.write_chunk, chunk, number, total, limiter, stats, operation
+                )
+                futures[future] = number
+
+            for future, number in futures.items():
+                if future.result() and committed is not None:
+                    committed.add(str(number))
+
+        stats.end = time.time()
+        return stats
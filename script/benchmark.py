@@ -0,0 +1,834 @@
+import argparse
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+path_to_utils = Path(__file__).parent.parent / "lib/stars"
+sys.path.insert(0, str(path_to_utils))
+
+from events import StarEventBatch
+from gharchive import parse_star_events
+
+BASELINE = "script/benchmark_baseline.json"
+OUTPUT = "tmp/benchmark.json"
+SEED = 42
+
+# rough share of each event type in a gharchive hour
+EVENT_MIX = {
+    "PushEvent": 0.50,
+    "CreateEvent": 0.12,
+    "PullRequestEvent": 0.07,
+    "WatchEvent": 0.07,
+    "IssueCommentEvent": 0.06,
+    "DeleteEvent": 0.04,
+    "PullRequestReviewEvent": 0.03,
+    "IssuesEvent": 0.03,
+    "PullRequestReviewCommentEvent": 0.02,
+    "ForkEvent": 0.02,
+    "ReleaseEvent": 0.01,
+    "GollumEvent": 0.01,
+    "MemberEvent": 0.01,
+    "PublicEvent": 0.01,
+}
+
+WORDS = (
+    "fix add update remove refactor bump test docs readme build ci release merge branch main "
+    "feature bug issue pull request config api cli server client cache parser json event star "
+    "WatchEvent dependency version typo lint format cleanup support handle error performance"
+).split()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ingest, aggregation and enrichment hot paths"
+    )
+    parser.add_argument(
+        "--only",
+        help="comma separated list of benchmarks to run (memory, parse, write, aggregate, enrich)",
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=200000,
+        help="number of star events for the memory and write benchmarks (default: 200000)",
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=2,
+        help="number of synthetic gharchive hours to parse (default: 2)",
+    )
+    parser.add_argument(
+        "--hour-events",
+        type=int,
+        default=100000,
+        help="number of events (of every type) in each synthetic hour (default: 100000)",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1000000,10000000",
+        help="comma separated number of stored star events to aggregate (default: 1000000,10000000)",
+    )
+    parser.add_argument(
+        "--table-latency",
+        type=float,
+        default=0.01,
+        help="seconds each fake table transaction takes (default: 0.01)",
+    )
+    parser.add_argument(
+        "--repos",
+        type=int,
+        default=100,
+        help="number of repos to enrich (default: 100)",
+    )
+    parser.add_argument(
+        "--api-latency",
+        type=float,
+        default=0.05,
+        help="seconds each stub GitHub API request takes (default: 0.05)",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE,
+        help=f"baseline file to compare against (default: {BASELINE})",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change counted as a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--output",
+        default=OUTPUT,
+        help=f"path of the json report (default: {OUTPUT})",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=SEED,
+        help=f"random seed (default: {SEED})",
+    )
+    return parser.parse_args()
+
+
+def percentiles(samples, prefix):
+    """
+    Summarize latency samples
+    :param samples: list of durations in seconds
+    :param prefix: prefix for the metric names
+    :return: dict of p50, p95 and max metrics
+    """
+    ordered = sorted(samples) or [0]
+
+    def pick(pct):
+        return ordered[
+            min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        ]
+
+    return {
+        f"{prefix}_p50_seconds": round(pick(50), 4),
+        f"{prefix}_p95_seconds": round(pick(95), 4),
+        f"{prefix}_max_seconds": round(ordered[-1], 4),
+    }
+
+
+def quiet_logs():
+    # the benchmarks only care about timings, not the pipeline's info logs
+    os.environ["LOG_LEVEL"] = "WARNING"
+    logging.getLogger("StarEvents").setLevel(logging.WARNING)
+
+
+def new_star_events(root, **env):
+    """
+    Create a StarEvents object which stores everything under a temporary directory
+    :param root: temporary directory
+    :param env: extra environment variables
+    :return: StarEvents
+    """
+    os.environ.update(
+        {
+            "STORAGE_BACKEND": "columnar",
+            "COLUMNAR_PATH": os.path.join(root, "columnar"),
+            "TREND_STATE_PATH": os.path.join(root, "trend_state.json.gz"),
+            "GH_CACHE_PATH": os.path.join(root, "github_cache.sqlite3"),
+            # a dedup index left over from an earlier run would skip every write
+            "DEDUP_PATH": os.path.join(root, "dedup"),
+        }
+    )
+    os.environ.update(env)
+    quiet_logs()
+
+    from stars import StarEvents
+
+    return StarEvents()
+
+
+def synthetic_star_lines(count, seed=SEED):
+    """
+    Generate raw gharchive WatchEvent lines for a single hour
+    Repos follow a long tail (a few repos get most of the stars) and most actors star one or two repos
+    :param count: number of lines to generate
+    :param seed: random seed
+    :return: list of raw json lines (bytes)
+    """
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1, 12)
+    repos = max(1, count // 4)
+    actors = max(1, count // 2)
+
+    lines = []
+    for number in range(count):
+        repo = int(rng.paretovariate(1.2)) % repos
+        actor = rng.randrange(actors)
+        created_at = start + timedelta(seconds=rng.randrange(3600))
+        event = {
+            "id": str(26000000000 + number),
+            "type": "WatchEvent",
+            "actor": {"id": 1000000 + actor, "login": f"user-{actor:07d}"},
+            "repo": {"id": 5000000 + repo, "name": f"owner-{repo}/project-{repo}"},
+            "payload": {"action": "started"},
+            "public": True,
+            "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        lines.append(json.dumps(event).encode())
+
+    return lines
+
+
+def synthetic_payloads(rng, count=64):
+    """
+    Build a pool of payloads for every event type with realistic sizes
+    Pull request and review payloads are large, push payloads carry a handful of commits, stars are tiny
+    :param rng: random.Random
+    :param count: number of payloads per event type
+    :return: dict of event type -> list of serialized payloads
+    """
+
+    def text(low, high):
+        return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+    def urls(name, fields):
+        return {
+            f"{field}_url": f"https://api.github.com/{name}/{field}" for field in fields
+        }
+
+    pool = {}
+    for event_type in EVENT_MIX:
+        payloads = []
+        for _ in range(count):
+            if event_type == "PushEvent":
+                payload = {
+                    "push_id": rng.randrange(10**10),
+                    "size": 3,
+                    "ref": "refs/heads/main",
+                    "commits": [
+                        {
+                            "sha": f"{rng.getrandbits(160):040x}",
+                            "author": {"email": "dev@example.com", "name": "dev"},
+                            "message": text(3, 60),
+                            "url": "https://api.github.com/repos/o/r/commits/x",
+                        }
+                        for _ in range(rng.randint(1, 5))
+                    ],
+                }
+            elif event_type in (
+                "PullRequestEvent",
+                "PullRequestReviewEvent",
+                "PullRequestReviewCommentEvent",
+            ):
+                payload = {
+                    "action": "opened",
+                    "number": rng.randrange(10000),
+                    "pull_request": dict(
+                        urls(
+                            "repos/o/r/pulls/1",
+                            [
+                                "html",
+                                "diff",
+                                "patch",
+                                "issue",
+                                "commits",
+                                "comments",
+                                "statuses",
+                            ],
+                        ),
+                        title=text(3, 12),
+                        body=text(20, 1200),
+                        user={"login": "dev", "id": 1, "type": "User"},
+                        head={"ref": "feature", "sha": f"{rng.getrandbits(160):040x}"},
+                        base={"ref": "main", "sha": f"{rng.getrandbits(160):040x}"},
+                        additions=rng.randrange(1000),
+                        deletions=rng.randrange(1000),
+                    ),
+                }
+            elif event_type in ("IssueCommentEvent", "IssuesEvent"):
+                payload = {
+                    "action": "created",
+                    "issue": dict(
+                        urls(
+                            "repos/o/r/issues/1",
+                            ["html", "comments", "events", "labels"],
+                        ),
+                        title=text(3, 12),
+                        body=text(10, 400),
+                    ),
+                    "comment": {"body": text(5, 300)},
+                }
+            elif event_type == "ReleaseEvent":
+                payload = {
+                    "action": "published",
+                    "release": {"tag_name": "v1.0.0", "body": text(20, 600)},
+                }
+            elif event_type == "WatchEvent":
+                payload = {"action": "started"}
+            else:
+                payload = {
+                    "ref": "feature",
+                    "ref_type": "branch",
+                    "description": text(0, 20),
+                }
+            payloads.append(json.dumps(payload))
+        pool[event_type] = payloads
+
+    return pool
+
+
+def write_synthetic_hour(path, hour, count, rng, pool):
+    """
+    Write a synthetic gharchive hour file with a realistic mix of event types
+    :param path: path of the .json.gz file
+    :param hour: datetime of the hour
+    :param count: number of events
+    :param rng: random.Random
+    :param pool: payload pool (see synthetic_payloads)
+    :return: number of WatchEvents written
+    """
+    types = list(EVENT_MIX)
+    weights = list(EVENT_MIX.values())
+    stars = 0
+
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        for number, event_type in enumerate(rng.choices(types, weights, k=count)):
+            repo = int(rng.paretovariate(1.1)) % 50000
+            actor = rng.randrange(200000)
+            created_at = (hour + timedelta(seconds=rng.randrange(3600))).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            )
+            stars += event_type == "WatchEvent"
+            f.write(
+                f'{{"id":"{27000000000 + number}","type":"{event_type}",'
+                f'"actor":{{"id":{actor},"login":"user-{actor}","display_login":"user-{actor}",'
+                f'"url":"https://api.github.com/users/user-{actor}"}},'
+                f'"repo":{{"id":{repo},"name":"owner-{repo}/project-{repo}",'
+                f'"url":"https://api.github.com/repos/owner-{repo}/project-{repo}"}},'
+                f'"payload":{rng.choice(pool[event_type])},"public":true,"created_at":"{created_at}"}}\n'
+            )
+
+    return stars
+
+
+def bench_memory(opts):
+    """
+    Memory used by a list of event dicts compared to a StarEventBatch
+    """
+    lines = synthetic_star_lines(opts["events"], seed=opts["seed"])
+
+    def measure(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, after - before
+
+    def legacy_events():
+        # the previous representation - the parsed dicts plus the formatted dicts built at write time
+        events = list(parse_star_events(lines))
+        formatted = [
+            {
+                "id": event["id"],
+                "repo_name": event["repo_name"],
+                "created_at": datetime.strptime(
+                    event["created_at"], "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "actor_login": event["actor_login"],
+            }
+            for event in events
+        ]
+        return events, formatted
+
+    _, legacy_bytes = measure(legacy_events)
+    batch, batch_bytes = measure(
+        lambda: StarEventBatch.from_events(parse_star_events(lines))
+    )
+
+    return {
+        "events": len(batch),
+        "dict_bytes_per_event": round(legacy_bytes / len(batch)),
+        "batch_bytes_per_event": round(batch_bytes / len(batch)),
+        "reduction_ratio": round(legacy_bytes / batch_bytes, 1),
+    }
+
+
+def bench_parse(opts):
+    """
+    get_star_events throughput over synthetic gharchive hours
+    """
+    root = tempfile.mkdtemp()
+    try:
+        rng = random.Random(opts["seed"])
+        pool = synthetic_payloads(rng)
+        paths = []
+        stars = 0
+        for number in range(opts["hours"]):
+            hour = datetime(2023, 1, 1, number % 24)
+            path = os.path.join(root, f"2023-01-01-{number}.json.gz")
+            stars += write_synthetic_hour(path, hour, opts["hour_events"], rng, pool)
+            paths.append(path)
+
+        compressed = sum(os.path.getsize(path) for path in paths)
+        star_events = new_star_events(root)
+
+        latencies = []
+        for path in paths:
+            start = time.time()
+            star_events.get_star_events(direct_path=path, keep_file=True)
+            latencies.append(time.time() - start)
+
+        elapsed = sum(latencies)
+        lines = opts["hours"] * opts["hour_events"]
+        return dict(
+            {
+                "lines": lines,
+                "star_events": stars,
+                "lines_per_second": round(lines / elapsed),
+                "compressed_mb_per_second": round(
+                    compressed / 1024 / 1024 / elapsed, 1
+                ),
+            },
+            **percentiles(latencies, "hour"),
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+class FakeTable:
+    """
+    Table client which accepts every transaction after a fixed latency
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def submit_transaction(self, operations):
+        time.sleep(self.latency)
+        with self.lock:
+            self.rows += len(operations)
+
+    def upsert_entity(self, entity):
+        time.sleep(self.latency)
+
+    def get_entity(self, partition_key, row_key):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        raise ResourceNotFoundError("not found")
+
+    def query_entities(self, query, select=None):
+        return iter([])
+
+
+class FakeTableService:
+    """
+    Stand-in for TableServiceClient which hands out FakeTables
+    """
+
+    latency = 0
+
+    @classmethod
+    def from_connection_string(cls, conn_str):
+        return cls()
+
+    def create_table_if_not_exists(self, table_name):
+        pass
+
+    def get_table_client(self, table_name):
+        return FakeTable(self.latency)
+
+
+def bench_write(opts):
+    """
+    write_star_events batching against a fake table client with a fixed transaction latency
+    """
+    import azure_backend
+
+    FakeTableService.latency = opts["table_latency"]
+    azure_backend.TableServiceClient = FakeTableService
+
+    root = tempfile.mkdtemp()
+    try:
+        star_events = new_star_events(
+            root,
+            STORAGE_BACKEND="azure",
+            AZURE_CONNECTION_STRING="UseDevelopmentStorage=true",
+        )
+
+        # capture the WriteStats of the raw event writes
+        stats = []
+        write_chunks = star_events.backend.writer.write_chunks
+
+        def recording_write_chunks(chunks, **kwargs):
+            result = write_chunks(chunks, **kwargs)
+            stats.append(result)
+            return result
+
+        star_events.backend.writer.write_chunks = recording_write_chunks
+
+        star_events.events = StarEventBatch.from_events(
+            parse_star_events(synthetic_star_lines(opts["events"], seed=opts["seed"]))
+        )
+
+        start = time.time()
+        star_events.write_star_events()
+        elapsed = time.time() - start
+
+        return dict(
+            {
+                "events": opts["events"],
+                "events_per_second": round(opts["events"] / elapsed),
+                "chunks": sum(s.chunks for s in stats),
+                "retries": sum(s.retries for s in stats),
+            },
+            **percentiles(
+                [latency for s in stats for latency in s.latencies], "transaction"
+            ),
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def fill_columnar(star_events, count, seed):
+    """
+    Store synthetic star events spread over the last 30 days
+    :param star_events: StarEvents object with a columnar backend
+    :param count: number of star events
+    :param seed: random seed
+    """
+    rng = random.Random(seed)
+    hours = 30 * 24
+    per_hour = max(1, count // hours)
+    repos = max(1, count // 50)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    number = 0
+    for offset in range(hours):
+        hour = now - timedelta(hours=offset)
+        batch = StarEventBatch()
+        for _ in range(per_hour):
+            number += 1
+            repo = int(rng.paretovariate(1.1)) % repos
+            actor = rng.randrange(count // 2 + 1)
+            batch.ids.append(number)
+            batch.actor_ids.append(actor)
+            batch.repo_ids.append(repo)
+            batch.created_at.append(
+                batch.epoch(hour.strftime("%Y-%m-%dT%H:00:00Z")) + rng.randrange(3600)
+            )
+            batch.repo.append(batch.repos.add(f"owner-{repo}/project-{repo}"))
+            batch.actor.append(batch.actors.add(f"user-{actor}"))
+        star_events.backend.write_events(batch)
+
+
+def bench_aggregate(opts):
+    """
+    get_stars_in_timeslices over 1M/10M stored events, for every read path
+    """
+    windows = [24, 24 * 7, 24 * 30]
+    results = {}
+
+    for size in opts["sizes"]:
+        root = tempfile.mkdtemp()
+        try:
+            star_events = new_star_events(root, TREND_WINDOWS="24,168,720")
+
+            start = time.time()
+            fill_columnar(star_events, size, opts["seed"])
+            results[f"{size}_fill_seconds"] = round(time.time() - start, 2)
+
+            def timed(runs):
+                latencies = []
+                for _ in range(runs):
+                    start = time.time()
+                    star_events.get_stars_in_timeslices(windows, enrich=False)
+                    latencies.append(time.time() - start)
+                return latencies
+
+            # vectorized column scan
+            results.update(percentiles(timed(3), f"{size}_vectorized"))
+
+            # merge of the hourly rollups
+            star_events.backend.vectorized = False
+            star_events.use_rollups = True
+            results.update(percentiles(timed(3), f"{size}_rollups"))
+
+            # raw event scan (only at the smaller sizes, it is far too slow at 10M)
+            if size <= 1000000:
+                star_events.use_rollups = False
+                results.update(percentiles(timed(1), f"{size}_raw"))
+
+            # incrementally maintained trend state
+            state = star_events.load_trend_state()
+            state.save(star_events.trend_state_path)
+            latencies = []
+            for _ in range(3):
+                start = time.time()
+                star_events.get_trends(windows, enrich=False)
+                latencies.append(time.time() - start)
+            results.update(percentiles(latencies, f"{size}_trend_state"))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return results
+
+
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal GitHub API with a fixed latency, ETags and rate limit headers
+    """
+
+    latency = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        if self.path.endswith("/contributors"):
+            body = [
+                {"login": f"contributor-{n}", "contributions": 10 - n}
+                for n in range(15)
+            ]
+        elif self.path.startswith("/repos/"):
+            name = self.path[len("/repos/") :]
+            body = {
+                "description": f"{name} description",
+                "stargazers_count": 1000,
+                "language": "Python",
+                "forks_count": 10,
+                "updated_at": "2023-01-01T00:00:00Z",
+                "watchers_count": 1000,
+                "open_issues_count": 5,
+                "topics": ["cli"],
+                "license": None,
+                "contributors_url": f"http://127.0.0.1:{self.server.server_port}/repos/{name}/contributors",
+            }
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = f'"{abs(hash(self.path))}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def bench_enrich(opts):
+    """
+    enrich_most_stared against a local stub API - cold, warm and revalidating cache runs
+    """
+    StubGitHubHandler.latency = opts["api_latency"]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGitHubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    root = tempfile.mkdtemp()
+    try:
+        star_events = new_star_events(root, GH_CACHE_TTL="3600")
+        star_events.gh_base_url = f"http://127.0.0.1:{server.server_port}"
+
+        from api_cache import ApiCache
+
+        # time every request that actually goes through the cache
+        latencies = []
+        get = ApiCache.get
+
+        def timed_get(self, session, url, headers=None):
+            start = time.time()
+            try:
+                return get(self, session, url, headers)
+            finally:
+                latencies.append(time.time() - start)
+
+        ApiCache.get = timed_get
+
+        repos = [(f"owner-{n}/project-{n}", 1000 - n) for n in range(opts["repos"])]
+        results = {}
+        for run in ("cold", "warm", "revalidate"):
+            if run == "revalidate":
+                star_events.api_cache.ttl = 0
+
+            latencies.clear()
+            star_events.most_stared = list(repos)
+            start = time.time()
+            enriched = star_events.enrich_most_stared()
+            elapsed = time.time() - start
+
+            results[f"{run}_seconds"] = round(elapsed, 3)
+            results[f"{run}_repos_per_second"] = round(len(enriched) / elapsed)
+            results.update(percentiles(latencies, f"{run}_request"))
+
+        return results
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "memory": bench_memory,
+    "parse": bench_parse,
+    "write": bench_write,
+    "aggregate": bench_aggregate,
+    "enrich": bench_enrich,
+}
+
+
+def run_benchmark(name, opts):
+    """
+    Run a single benchmark (inside a fresh process so the peak RSS belongs to it alone)
+    :param name: benchmark name
+    :param opts: benchmark options
+    :return: dict of metrics
+    """
+    start = time.time()
+    metrics = BENCHMARKS[name](opts)
+    metrics["total_seconds"] = round(time.time() - start, 2)
+    # ru_maxrss is in KiB on linux
+    metrics["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    return metrics
+
+
+def regressions(results, baseline, threshold):
+    """
+    Compare results against a baseline
+    Metrics ending in _per_second are better when higher, _seconds and _mb are better when lower
+    :param results: dict of benchmark -> metrics
+    :param baseline: dict of benchmark -> metrics
+    :param threshold: relative change counted as a regression
+    :return: list of regression descriptions
+    """
+    found = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base or metric == "total_seconds":
+                continue
+
+            if metric.endswith("_per_second"):
+                regressed = value < base * (1 - threshold)
+            elif metric.endswith("_seconds") or metric.endswith("_mb"):
+                regressed = value > base * (1 + threshold)
+            else:
+                continue
+
+            if regressed:
+                found.append(f"{name}.{metric}: {base} -> {value}")
+
+    return found
+
+
+def main():
+    args = parse_args()
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    opts = {
+        "events": args.events,
+        "hours": args.hours,
+        "hour_events": args.hour_events,
+        "sizes": [int(size) for size in args.sizes.split(",")],
+        "table_latency": args.table_latency,
+        "repos": args.repos,
+        "api_latency": args.api_latency,
+        "seed": args.seed,
+    }
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(run_benchmark, name, opts).result()
+
+        for metric, value in results[name].items():
+            print(f"  {metric}: {value}")
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "options": opts,
+        "results": results,
+    }
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote report to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    found = regressions(results, baseline, args.threshold)
+    if found:
+        print(f"\n❌ {len(found)} regressions against {args.baseline}:")
+        for regression in found:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print(f"\n✅ No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+QUERIES = [
+    "hours=24&limit=20",
+    "hours=168&limit=20",
+    "hours=720&limit=20",
+    "hours=48&limit=50",
+    "hours=24&limit=10&enrich=false",
+    "hours=168&limit=20&language=python",
+    "hours=168&limit=20&language=rust",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Load test the trend query api (lib/crons/trends_api.py)"
+    )
+    parser.add_argument(
+        "--url",
+        default="http://127.0.0.1:8080",
+        help="base url of the api (default: http://127.0.0.1:8080)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="number of concurrent keep-alive clients (default: 16)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10,
+        help="seconds to run for (default: 10)",
+    )
+    parser.add_argument(
+        "--query",
+        action="append",
+        help="query string to request, can be repeated (default: a mix of windows, limits and languages)",
+    )
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="send If-None-Match with the last ETag seen for each query (measures 304 responses)",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="send Accept-Encoding: gzip",
+    )
+    parser.add_argument("--output", help="also write the results as json to a file")
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    """
+    Get a percentile of a sorted list
+    :param values: sorted list of numbers
+    :param pct: percentile between 0 and 100
+    :return: value (0 if the list is empty)
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def client(args, url, queries, deadline, results, lock):
+    """
+    Issue requests on one keep-alive connection until the deadline
+    """
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    etags = {}
+    latencies = []
+    statuses = {}
+    rng = random.Random()
+
+    while time.perf_counter() < deadline:
+        query = rng.choice(queries)
+        headers = {}
+        if args.revalidate and query in etags:
+            headers["If-None-Match"] = etags[query]
+        if args.gzip:
+            headers["Accept-Encoding"] = "gzip"
+
+        start = time.perf_counter()
+        try:
+            conn.request("GET", f"/trends?{query}", headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            statuses["error"] = statuses.get("error", 0) + 1
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+        etag = resp.getheader("ETag")
+        if etag:
+            etags[query] = etag
+
+    conn.close()
+    with lock:
+        results["latencies"].extend(latencies)
+        for status, count in statuses.items():
+            results["statuses"][str(status)] = (
+                results["statuses"].get(str(status), 0) + count
+            )
+
+
+def main():
+    args = parse_args()
+    url = urlparse(args.url)
+    queries = args.query or QUERIES
+
+    # warm the cache so the run measures steady state rather than the first storage reads
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=600)
+    for query in queries:
+        conn.request("GET", f"/trends?{query}")
+        resp = conn.getresponse()
+        resp.read()
+        print(f"warmup {query}: {resp.status}")
+    conn.close()
+
+    results = {"latencies": [], "statuses": {}}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(
+            target=client, args=(args, url, queries, deadline, results, lock)
+        )
+        for _ in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(results["latencies"])
+    report = {
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "statuses": results["statuses"],
+        "latency_ms": {
+            f"p{pct}": round(percentile(latencies, pct) * 1000, 3)
+            for pct in (50, 95, 99)
+        },
+    }
+    report["latency_ms"]["max"] = round(latencies[-1] * 1000, 3) if latencies else 0
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    # any failed request fails the run
+    if set(results["statuses"]) - {"200", "304"}:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import sys
+from pathlib import Path
+
+path_to_utils = Path(__file__).parent.parent / "lib/stars"
+sys.path.insert(0, str(path_to_utils))
+
+from events import StarEventBatch
+from partitions import LEGACY_PARTITION, chunk_by_partition, hour_bucket
+from stars import StarEvents
+
+BATCH_SIZE = 10000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=f"Move raw star events from the legacy '{LEGACY_PARTITION}' partition into hourly partitions"
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="delete the legacy rows once they have been copied",
+    )
+    parser.add_argument(
+        "--rollups",
+        action="store_true",
+        help="also rebuild the hourly rollup table from the migrated events",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"number of events to copy per batch (default: {BATCH_SIZE})",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    star_events = StarEvents()
+    log = star_events.log
+
+    # every migrated event is kept (compactly) so the rollups of each hour are rebuilt from all of its events
+    events = StarEventBatch()
+    migrated = 0
+    failed = 0
+
+    def flush(batch):
+        nonlocal migrated, failed
+
+        stats = star_events.backend.writer.write_chunks(chunk_by_partition(batch))
+        migrated += stats.events
+        failed += stats.failed
+
+        if args.rollups:
+            events.extend(
+                {
+                    "id": entity["RowKey"],
+                    "actor_id": None,
+                    "actor_login": entity["actor_login"],
+                    "repo_id": None,
+                    "repo_name": entity["repo_name"],
+                    "created_at": entity["created_at"].strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+                for entity in batch
+            )
+
+        # only remove the legacy rows when every copy in the batch succeeded
+        if args.delete and stats.failed == 0:
+            keys = [
+                {"PartitionKey": LEGACY_PARTITION, "RowKey": entity["RowKey"]}
+                for entity in batch
+            ]
+            deleted = star_events.backend.writer.write_chunks(
+                chunk_by_partition(keys), operation="delete"
+            )
+            failed += deleted.failed
+
+        log.info(f"Migrated {migrated} events ({failed} failed chunks)")
+
+    batch = []
+    legacy = star_events.read(f"PartitionKey eq '{LEGACY_PARTITION}'", listify=False)
+    for entity in legacy:
+        batch.append(
+            {
+                "PartitionKey": hour_bucket(entity["created_at"]),
+                "RowKey": entity["RowKey"],
+                "repo_name": entity["repo_name"],
+                "created_at": entity["created_at"],
+                "actor_login": entity.get("actor_login"),
+            }
+        )
+
+        if len(batch) >= args.batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+
+    if args.rollups and len(events) > 0:
+        # the same path as write_star_events: invalid events and repeated stars are dropped and the rows get
+        # the weighted star counts and distinct stargazer sketches
+        star_events.events = events
+        selected, _ = star_events.select_events()
+        if not star_events.backend.write_rollups(selected):
+            failed += 1
+        hours = len({created_at // 3600 for created_at in selected.created_at})
+        log.info(f"Rebuilt the rollups of {hours} hours from {len(selected)} events")
+
+    if failed:
+        print(f"❌ {failed} chunks failed to migrate")
+        sys.exit(1)
+
+    print(f"✅ Migrated {migrated} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,74 @@
-import sys
+import argparse
 import os
+import sys
 from pathlib import Path
 
 path_to_utils = Path(__file__).parent.parent / "lib/stars"
 sys.path.insert(0, str(path_to_utils))
 
+from backfill import Backfill
+from gharchive import gharchive_hours
 from stars import StarEvents
 
 DIR = "script/populate"
 
-star_events = StarEvents()
 
-# loop through all files in the populate dir
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Backfill the database with gharchive star events"
+    )
+    parser.add_argument(
+        "--dir",
+        default=DIR,
+        help=f"directory of gharchive .json.gz hour files (default: {DIR})",
+    )
+    parser.add_argument(
+        "--start", help="first hour to download in YYYY-MM-DD-HH format (UTC)"
+    )
+    parser.add_argument(
+        "--end", help="last hour to download in YYYY-MM-DD-HH format (UTC)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of parser processes (default: number of cpus)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            print("Both --start and --end are required for a date range. Exiting.")
+            sys.exit(1)
+
+        # download the hours directly from gharchive
+        sources = gharchive_hours(args.start, args.end)
+    else:
+        # loop through all files in the populate dir that end in .gz
+        sources = [
+            f"{args.dir}/{file}"
+            for file in sorted(os.listdir(args.dir))
+            if file.endswith(".gz")
+        ]
+
+    star_events = StarEvents()
+    backfill = Backfill(star_events, workers=args.workers)
+
+    result = backfill.run(sources)
+    star_events.write_metrics("backfill")
 
-for file in os.listdir(DIR):
-    # get the file name if it ends in .gz
-    if not file.endswith(".gz"):
-        continue
+    if result:
+        print(
+            f"✅ Completed successfully ({len(backfill.completed)} hours written, {len(backfill.skipped)} already ingested)"
+        )
+    else:
+        print(f"❌ Failed hours: {', '.join(backfill.failed)}")
+        sys.exit(1)
 
-    print(f"Processing {file}...")
 
-    # upload to the database
-    star_events.get_star_events(direct_path=f"{DIR}/{file}", keep_file=True)
-    star_events.write_star_events()
-    star_events.clear_events()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import gzip
+import json
+import sys
+import unittest
+from pathlib import Path
+
+path_to_utils = Path(__file__).parent.parent / "lib/stars"
+sys.path.insert(0, str(path_to_utils))
+
+import gharchive
+from gharchive import (
+    WATCH_EVENT_MARKER,
+    decompress_stream,
+    iter_file_chunks,
+    iter_lines,
+    parse_star_events,
+)
+
+# gharchive hour with star events, marker false positives ("WatchEvent" as a branch, repo or payload value),
+# escaped near misses, non-ascii names and two gzip members
+FIXTURE = Path(__file__).parent / "fixtures" / "gharchive_sample.json.gz"
+
+
+def reference_star_events(path):
+    """
+    Parse every line with json.loads and keep the WatchEvents - no byte marker prefilter
+    """
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["type"] != "WatchEvent":
+                continue
+            yield {
+                "id": event["id"],
+                "actor_id": event["actor"]["id"],
+                "actor_login": event["actor"]["login"],
+                "repo_id": event["repo"]["id"],
+                "repo_name": event["repo"]["name"],
+                "created_at": event["created_at"],
+            }
+
+
+def prefiltered_star_events(path):
+    """
+    Parse the fixture the way the ingest path does (streaming decompression, marker prefilter, orjson)
+    """
+    return list(
+        parse_star_events(iter_lines(decompress_stream(iter_file_chunks(path))))
+    )
+
+
+class TestStarEventParsing(unittest.TestCase):
+    def test_fixture_has_marker_false_positives(self):
+        with gzip.open(FIXTURE, "rb") as f:
+            lines = [line for line in f if line.strip()]
+
+        marked = sum(WATCH_EVENT_MARKER in line for line in lines)
+        stars = sum(json.loads(line)["type"] == "WatchEvent" for line in lines)
+        self.assertGreater(marked, stars)
+
+    def test_prefilter_matches_full_parse(self):
+        expected = list(reference_star_events(FIXTURE))
+        self.assertEqual(prefiltered_star_events(FIXTURE), expected)
+        self.assertEqual(len(expected), 14)
+
+    def test_stdlib_fallback_matches_full_parse(self):
+        # the same path without orjson (it is an optional dependency)
+        json_loads = gharchive.json_loads
+        gharchive.json_loads = json.loads
+        try:
+            self.assertEqual(
+                prefiltered_star_events(FIXTURE),
+                list(reference_star_events(FIXTURE)),
+            )
+        finally:
+            gharchive.json_loads = json_loads
+
+    def test_small_chunks(self):
+        # lines and gzip members split across chunk boundaries
+        chunks = iter_file_chunks(FIXTURE, chunk_size=7)
+        events = list(parse_star_events(iter_lines(decompress_stream(chunks))))
+        self.assertEqual(events, list(reference_star_events(FIXTURE)))
+
+
+class TestTruncatedStream(unittest.TestCase):
+    def test_truncated_file_raises(self):
+        # e.g. a download which was cut off - it must not look like a complete (shorter) hour
+        data = FIXTURE.read_bytes()
+        for size in (len(data) // 3, len(data) // 2, len(data) - 1):
+            with self.subTest(size=size):
+                with self.assertRaises(EOFError):
+                    list(
+                        parse_star_events(iter_lines(decompress_stream([data[:size]])))
+                    )
+
+    def test_truncated_chunks_raise(self):
+        data = FIXTURE.read_bytes()[:-8]
+        chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+        with self.assertRaises(EOFError):
+            list(decompress_stream(chunks))
+
+    def test_complete_members(self):
+        # a stream which ends exactly at the end of a gzip member is complete
+        member = gzip.compress(b'{"type":"PushEvent"}\n')
+        self.assertEqual(
+            b"".join(decompress_stream([member, member])), b'{"type":"PushEvent"}\n' * 2
+        )
+        self.assertEqual(list(decompress_stream([])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
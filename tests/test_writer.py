@@ -0,0 +1,225 @@
+import logging
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+from azure.core.exceptions import HttpResponseError, ResourceExistsError
+from azure.data.tables import TableTransactionError
+
+path_to_utils = Path(__file__).parent.parent / "lib/stars"
+sys.path.insert(0, str(path_to_utils))
+
+from writer import AdaptiveLimiter, TableWriter, WriteStats
+
+LOG = logging.getLogger("test_writer")
+# the retries are expected - keep their warnings out of the test output
+LOG.addHandler(logging.NullHandler())
+LOG.propagate = False
+
+
+def http_error(status_code):
+    error = HttpResponseError(message=f"status {status_code}")
+    error.status_code = status_code
+    return error
+
+
+def partial_batch_error():
+    # one entity of the transaction was rejected, so the whole transaction was rolled back
+    error = TableTransactionError(message="0:The specified entity is invalid")
+    error.status_code = 400
+    return error
+
+
+class FakeTable:
+    """
+    Table client which raises the queued errors of a partition before accepting its transactions
+    """
+
+    def __init__(self, errors=None):
+        """
+        :param errors: dict of PartitionKey -> list of exceptions to raise, in order (None for a success)
+        """
+        self.errors = {key: list(value) for key, value in (errors or {}).items()}
+        self.calls = {}
+        self.written = {}
+        self.lock = threading.Lock()
+
+    def submit_transaction(self, operations):
+        partition = operations[0][1]["PartitionKey"]
+        with self.lock:
+            self.calls[partition] = self.calls.get(partition, 0) + 1
+            queued = self.errors.get(partition)
+            error = queued.pop(0) if queued else None
+        if error is not None:
+            raise error
+        with self.lock:
+            self.written.setdefault(partition, []).extend(
+                entity["RowKey"] for _, entity in operations
+            )
+        return operations
+
+
+def chunks(partitions, size=3):
+    return [
+        [{"PartitionKey": partition, "RowKey": str(row)} for row in range(size)]
+        for partition in partitions
+    ]
+
+
+def new_writer(table, **kwargs):
+    kwargs.setdefault("max_retries", 3)
+    return TableWriter(table, LOG, base_delay=0, max_delay=0, **kwargs)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_throttle_halves_the_limit(self):
+        limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=8)
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_grows_after_a_window_of_successes(self):
+        limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=3)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+    def test_throttle_resets_the_success_window(self):
+        limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
+        for _ in range(3):
+            limiter.on_success()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 2)
+        limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+
+class TestWriteChunk(unittest.TestCase):
+    def write(self, table, **kwargs):
+        limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
+        stats = WriteStats()
+        written = new_writer(table, **kwargs).write_chunk(
+            chunks(["a"])[0], 1, 1, limiter, stats
+        )
+        return written, limiter, stats
+
+    def test_retries_throttled_chunks(self):
+        table = FakeTable({"a": [http_error(429), http_error(503)]})
+        written, limiter, stats = self.write(table)
+
+        self.assertTrue(written)
+        self.assertEqual(table.calls["a"], 3)
+        self.assertEqual(table.written["a"], ["0", "1", "2"])
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(stats.throttled, 2)
+        self.assertEqual((stats.chunks, stats.events, stats.failed), (1, 3, 0))
+        # halved twice, then grown by one after a full window (one success) at the shrunk limit
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.in_use, 0)
+
+    def test_partial_batch_errors_are_retried_without_shrinking(self):
+        table = FakeTable({"a": [partial_batch_error()]})
+        written, limiter, stats = self.write(table)
+
+        self.assertTrue(written)
+        self.assertEqual(table.calls["a"], 2)
+        self.assertEqual((stats.retries, stats.throttled), (1, 0))
+        self.assertEqual(limiter.limit, 4)
+
+    def test_gives_up_after_max_retries(self):
+        table = FakeTable({"a": [http_error(503)] * 10})
+        written, limiter, stats = self.write(table, max_retries=2)
+
+        self.assertFalse(written)
+        self.assertEqual(table.calls["a"], 3)
+        self.assertNotIn("a", table.written)
+        self.assertEqual((stats.retries, stats.throttled), (2, 3))
+        self.assertEqual((stats.chunks, stats.events, stats.failed), (0, 0, 1))
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.in_use, 0)
+
+    def test_existing_chunk_counts_as_written(self):
+        table = FakeTable({"a": [ResourceExistsError(message="exists")]})
+        written, _, stats = self.write(table)
+
+        self.assertTrue(written)
+        self.assertEqual(table.calls["a"], 1)
+        self.assertEqual((stats.chunks, stats.retries, stats.failed), (1, 0, 0))
+
+
+class TestWriteChunks(unittest.TestCase):
+    def test_committed_chunks(self):
+        table = FakeTable(
+            {
+                "b": [http_error(429)],
+                "c": [partial_batch_error()] * 10,
+                "d": [http_error(500)] * 10,
+            }
+        )
+        writer = new_writer(table, max_concurrency=4, max_retries=2)
+        committed = set()
+        stats = writer.write_chunks(chunks("abcde"), committed=committed)
+
+        # chunk ids are 1-based chunk numbers - the chunks which never got written are left out
+        self.assertEqual(committed, {"1", "2", "5"})
+        self.assertEqual(sorted(table.written), ["a", "b", "e"])
+        self.assertEqual((stats.chunks, stats.events, stats.failed), (3, 9, 2))
+        self.assertEqual(stats.retries, 5)
+        self.assertEqual(stats.throttled, 4)
+
+    def test_resume_only_writes_uncommitted_chunks(self):
+        table = FakeTable({"c": [partial_batch_error()] * 3})
+        writer = new_writer(table, max_retries=2)
+        committed = set()
+
+        first = writer.write_chunks(chunks("abc"), committed=committed)
+        self.assertEqual(committed, {"1", "2"})
+        self.assertEqual(first.failed, 1)
+
+        second = writer.write_chunks(chunks("abc"), committed=committed)
+        self.assertEqual(committed, {"1", "2", "3"})
+        self.assertEqual((second.chunks, second.skipped, second.failed), (1, 2, 0))
+        self.assertEqual(table.calls, {"a": 1, "b": 1, "c": 4})
+
+    def test_without_committed(self):
+        table = FakeTable()
+        stats = new_writer(table).write_chunks(chunks("ab"), operation="delete")
+        self.assertEqual((stats.chunks, stats.skipped), (2, 0))
+        self.assertIsNotNone(stats.end)
+
+    def test_concurrency_stays_within_the_limit(self):
+        in_flight = {"now": 0, "max": 0}
+        lock = threading.Lock()
+        release = threading.Event()
+
+        class SlowTable(FakeTable):
+            def submit_transaction(self, operations):
+                with lock:
+                    in_flight["now"] += 1
+                    in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                release.wait(0.05)
+                with lock:
+                    in_flight["now"] -= 1
+                return super().submit_transaction(operations)
+
+        # the limiter starts at two transactions in flight and grows towards max_concurrency
+        table = SlowTable()
+        stats = new_writer(table, max_concurrency=3).write_chunks(
+            chunks([str(n) for n in range(12)])
+        )
+        self.assertEqual(stats.chunks, 12)
+        self.assertLessEqual(in_flight["max"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()